@@ -8,6 +8,9 @@ from config import config
 import concurrent.futures
 import traceback
 import threading
+import queue
+from import_journal import ImportJournal, source_fingerprint
+from import_preflight import ImportPreflight
 
 # 尝试导入PyQt5，如果失败则使用无GUI模式
 try:
@@ -17,6 +20,196 @@ except ImportError:
     print("警告：无法导入PyQt5，将使用无GUI模式运行")
     _HAS_PYQT = False
 
+# 从 /api/v3/types/1 形式的链接中解析ID
+_HREF_ID = re.compile(r"/(\d+)/?$")
+
+
+class MetadataIndex:
+    """一类元数据（类型、状态、优先级或项目成员）的索引，按ID、href或名称O(1)查找
+    
+    Args:
+        kind: 元数据类别，与API路径中的名称一致，例如 types
+        elements: API返回的元素列表，成员为 {id, name, href, roles}
+    """
+    
+    def __init__(self, kind, elements=()):
+        self.kind = kind
+        self.elements = list(elements)
+        self.by_id = {}
+        self.by_href = {}
+        self.by_name = {}
+        self._by_folded_name = {}
+        for element in self.elements:
+            element_id = element.get("id")
+            if element_id is not None:
+                self.by_id[str(element_id)] = element
+            href = self.href(element)
+            if href:
+                self.by_href[href] = element
+            name = element.get("name")
+            if name:
+                self.by_name.setdefault(name, element)
+                self._by_folded_name.setdefault(name.strip().casefold(), element)
+    
+    def __len__(self):
+        return len(self.elements)
+    
+    def href(self, element):
+        """元素的API链接"""
+        self_link = element.get("_links", {}).get("self")
+        if isinstance(self_link, dict) and self_link.get("href"):
+            return self_link["href"]
+        if element.get("href"):
+            return element["href"]
+        if element.get("id") is not None:
+            return f"/api/v3/{self.kind}/{element['id']}"
+        return None
+    
+    def link(self, element):
+        """生成指向元素的HAL链接"""
+        return {"href": self.href(element), "title": element.get("name", "")}
+    
+    def get(self, key):
+        """按ID、href、名称或 {href, title} 链接查找元素，找不到时返回None"""
+        if key is None:
+            return None
+        if isinstance(key, dict):
+            return self.get(key.get("href")) or self.get(key.get("title"))
+        key = str(key)
+        if "/" in key:
+            element = self.by_href.get(key)
+            if element is None:
+                match = _HREF_ID.search(key)
+                element = self.by_id.get(match.group(1)) if match else None
+            return element
+        return self.by_id.get(key) or self.by_name.get(key) or self._by_folded_name.get(key.strip().casefold())
+    
+    def resolve(self, link):
+        """把其他实例或旧数据中的链接对应到当前实例的元素
+        
+        链接的ID在当前实例中存在且名称一致（或链接没有名称）时使用该元素，否则按名称查找。
+        
+        Args:
+            link: {href, title} 链接
+            
+        Returns:
+            当前实例中的元素，找不到时返回None
+        """
+        if not isinstance(link, dict):
+            return self.get(link)
+        title = link.get("title")
+        element = self.get(link.get("href"))
+        if element is not None and (not title or element.get("name") == title):
+            return element
+        return self.get(title) if title else None
+    
+    def map_exported(self, exported_elements):
+        """按名称把导出文件中的元素对应到当前实例，返回 {原ID字符串: 当前实例ID}"""
+        mapping = {}
+        for exported in exported_elements or []:
+            element = self.get(exported.get("name"))
+            if element is not None and exported.get("id") is not None:
+                mapping[str(exported["id"])] = element.get("id")
+        return mapping
+
+
+class MetadataRegistry:
+    """类型、状态、优先级和项目成员的注册表
+    
+    首次使用时并发获取全部类型、状态和优先级，之后按ID、href或名称直接查找，不再重复请求；
+    项目成员按项目获取并缓存。获取失败的类别使用空索引，RETRY_INTERVAL 秒后再次使用时重试。
+    
+    Args:
+        client: OpenProjectClient 实例
+    """
+    
+    KINDS = ("types", "statuses", "priorities")
+    RETRY_INTERVAL = 60
+    
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._members = {}
+        self._retry_at = {}
+    
+    def invalidate(self):
+        """清空已获取的元数据，更新凭证或元数据被修改后调用"""
+        with self._lock:
+            self._indexes = {}
+            self._members = {}
+            self._retry_at = {}
+    
+    def _stale(self, key, loaded):
+        return key not in loaded or (key in self._retry_at and time.time() >= self._retry_at[key])
+    
+    def load(self, project_id=None, force=False):
+        """并发获取尚未获取的元数据，同时有多个线程调用时只请求一次
+        
+        Args:
+            project_id: 同时获取该项目的成员，为None时不获取
+            force: 重新获取全部类型、状态和优先级
+        """
+        with self._lock:
+            jobs = {}
+            for kind in self.KINDS:
+                if force or self._stale(kind, self._indexes):
+                    jobs[kind] = (self._client._get_collection, kind)
+            member_key = str(project_id) if project_id is not None else None
+            if member_key is not None and (force or self._stale(member_key, self._members)):
+                jobs[member_key] = (self._client._get_project_memberships, project_id)
+            if not jobs:
+                return
+            
+            start_time = time.time()
+            counts = []
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                futures = {key: executor.submit(fetch, arg) for key, (fetch, arg) in jobs.items()}
+            for key, future in futures.items():
+                try:
+                    elements = future.result()
+                except Exception as e:
+                    print(f"获取元数据 {key} 出错: {str(e)}")
+                    elements = None
+                if elements is None:
+                    self._retry_at[key] = time.time() + self.RETRY_INTERVAL
+                    elements = []
+                else:
+                    self._retry_at.pop(key, None)
+                if key == member_key:
+                    self._members[key] = MetadataIndex("users", elements)
+                else:
+                    self._indexes[key] = MetadataIndex(key, elements)
+                counts.append(f"{'项目成员' if key == member_key else key} {len(elements)}")
+            print(f"元数据获取完成: {', '.join(counts)}，耗时 {time.time() - start_time:.2f}秒")
+    
+    def index(self, kind):
+        """返回类别的索引，尚未获取时先获取"""
+        self.load()
+        with self._lock:
+            index = self._indexes.get(kind)
+        return index if index is not None else MetadataIndex(kind)
+    
+    @property
+    def types(self):
+        return self.index("types")
+    
+    @property
+    def statuses(self):
+        return self.index("statuses")
+    
+    @property
+    def priorities(self):
+        return self.index("priorities")
+    
+    def members(self, project_id):
+        """返回项目成员的索引，元素为 {id, name, href, roles}"""
+        self.load(project_id)
+        with self._lock:
+            index = self._members.get(str(project_id))
+        return index if index is not None else MetadataIndex("users")
+
+
 class OpenProjectClient:
     def __init__(self):
         self.api_url = config.api_url
@@ -26,8 +219,6 @@ class OpenProjectClient:
         
         # 缓存数据
         self._custom_fields_cache = None
-        self._types_cache = None
-        self._statuses_cache = None
         self._projects_cache = None
         self._project_form_config_cache = {}
         self._field_name_to_id_cache = {}  # 字段名称到ID的映射缓存
@@ -54,6 +245,9 @@ class OpenProjectClient:
         self._session.mount('http://', adapter)
         self._session.mount('https://', adapter)
         
+        # 类型、状态、优先级和项目成员的注册表
+        self.metadata = MetadataRegistry(self)
+        
         # 初始化凭证
         self.update_credentials(self.api_url, self.api_token)
     
@@ -78,8 +272,7 @@ class OpenProjectClient:
         self._projects_cache = None
         self._project_form_config_cache = {}
         self._custom_fields_cache = None
-        self._types_cache = None
-        self._statuses_cache = None
+        self.metadata.invalidate()
         self._field_name_to_id_cache = {}
         self._cities_cache = None
         
@@ -240,13 +433,79 @@ class OpenProjectClient:
         
     def get_statuses(self):
         """获取状态列表"""
-        # 实现获取状态的逻辑
-        return []
+        return self.metadata.statuses.elements
         
     def get_types(self):
         """获取类型列表"""
-        # 实现获取类型的逻辑
-        return []
+        return self.metadata.types.elements
+    
+    def get_priorities(self):
+        """获取优先级列表"""
+        return self.metadata.priorities.elements
+    
+    def get_project_members(self, project_id):
+        """获取项目成员列表，元素为 {id, name, href, roles}"""
+        return self.metadata.members(project_id).elements
+    
+    def _get_collection(self, path, params=None, page_size=1000):
+        """获取 /api/v3/<path> 集合的全部元素，按需分页
+        
+        Returns:
+            元素列表，请求失败时返回None
+        """
+        url = f"{self.api_url}/api/v3/{path}"
+        elements = []
+        page = 1
+        while True:
+            query = dict(params or {}, pageSize=page_size, offset=page)
+            response = self._session.get(url, params=query, auth=self.auth,
+                                         timeout=(self._connection_timeout, self._read_timeout))
+            if response.status_code != 200:
+                print(f"获取 {path} 失败: {response.status_code} - {response.text[:200]}")
+                return None
+            result = response.json()
+            page_elements = result.get("_embedded", {}).get("elements", [])
+            elements.extend(page_elements)
+            total = result.get("total", len(elements))
+            if not page_elements or len(elements) >= total:
+                return elements
+            page += 1
+    
+    def get_work_package_ids(self, project_id):
+        """获取项目全部工作包（包括已关闭的）的ID，只请求ID字段
+        
+        Returns:
+            ID集合，失败时返回None
+        """
+        elements = self._get_collection(f"projects/{project_id}/work_packages",
+                                        {"filters": "[]", "select": "total,elements/id"})
+        if elements is None:
+            return None
+        return {element["id"] for element in elements if "id" in element}
+    
+    def _get_project_memberships(self, project_id):
+        """获取项目成员，每个成员（用户或用户组）一条，合并其全部角色"""
+        filters = json.dumps([{"project": {"operator": "=", "values": [str(project_id)]}}])
+        memberships = self._get_collection("memberships", {"filters": filters})
+        if memberships is None:
+            return None
+        members = {}
+        for membership in memberships:
+            links = membership.get("_links", {})
+            principal = links.get("principal") or {}
+            match = _HREF_ID.search(principal.get("href") or "")
+            if not match:
+                continue
+            member = members.setdefault(principal["href"], {
+                "id": int(match.group(1)),
+                "name": principal.get("title", ""),
+                "href": principal["href"],
+                "roles": [],
+            })
+            for role in links.get("roles") or []:
+                if role.get("title") and role["title"] not in member["roles"]:
+                    member["roles"].append(role["title"])
+        return list(members.values())
         
     def get_project_details(self, project_id):
         """获取项目详情
@@ -321,23 +580,45 @@ class OpenProjectClient:
                 return wp_form_data
             return {}
     
-    def get_work_packages(self, project_id, page=1, page_size=100):
+    def get_work_packages(self, project_id, page=1, page_size=100, filters=None):
         """获取项目的工作包列表
         
         Args:
             project_id: 项目ID
             page: 页码
             page_size: 每页数量
+            filters: OpenProject过滤条件列表，例如
+                [{"updatedAt": {"operator": "<>d", "values": ["2024-01-01T00:00:00Z", ""]}}]，
+                为None时不过滤（包括已关闭的工作包）
             
         Returns:
             工作包列表，失败时返回None
         """
+        work_packages, total = self.get_work_packages_page(project_id, page, page_size, filters)
+        if work_packages is not None:
+            # 存储总数信息
+            self._last_work_packages_total = total
+        return work_packages
+    
+    def get_work_packages_page(self, project_id, page=1, page_size=100, filters=None):
+        """获取一页工作包及总数，不修改共享状态，可在多个线程中并发调用
+        
+        Args:
+            project_id: 项目ID
+            page: 页码，从1开始
+            page_size: 每页数量
+            filters: OpenProject过滤条件列表，为None时不过滤
+            
+        Returns:
+            (工作包列表, 总数)，失败时返回 (None, 0)
+        """
         try:
             url = f"{self.api_url}/api/v3/projects/{project_id}/work_packages"
             params = {
                 "pageSize": page_size,
-                "offset": (page - 1) * page_size,
-                "filters": "[]"
+                # OpenProject API v3 的 offset 是从1开始的页码，而不是记录偏移量
+                "offset": page,
+                "filters": json.dumps(filters or [])
             }
             
             print(f"正在获取项目工作包: {project_id}，页码: {page}，每页: {page_size}")
@@ -349,18 +630,14 @@ class OpenProjectClient:
             
             if response.status_code == 200:
                 result = response.json()
-                
-                # 存储总数信息
-                self._last_work_packages_total = result.get("total", 0)
-                
                 work_packages = result.get("_embedded", {}).get("elements", [])
-                return work_packages
+                return work_packages, result.get("total", 0)
             else:
                 print(f"获取工作包失败: {response.status_code} - {response.text}")
-                return None
+                return None, 0
         except Exception as e:
             print(f"获取工作包出错: {str(e)}")
-            return None
+            return None, 0
     
     def get_last_work_packages_total(self):
         """获取最后一次工作包请求的总数
@@ -611,6 +888,10 @@ class OpenProjectClient:
             project_data: 项目数据
             new_name: 新项目名称
             import_options: 导入选项
+                - journal_path: 导入日志路径，设置后记录导入进度，中断后可以继续导入
+                - resume: 根据已有的导入日志继续导入，跳过已完成的项目、工作包和关系
+                - server_copy: 导出文件来自当前实例且原项目在导出之后没有变化时使用服务器端项目复制，默认为True
+                - preflight: 创建工作包前根据目标项目的schema检查并修正创建数据，默认为True
             
         Returns:
             新项目ID
@@ -633,14 +914,41 @@ class OpenProjectClient:
         status_mapping = import_options.get("status_mapping", {}) if import_options else {}
         type_mapping = import_options.get("type_mapping", {}) if import_options else {}
         
+        # 没有提供映射时按导出文件中的类型和状态列表与当前实例按名称对应
+        self.metadata.load()
+        if not type_mapping:
+            type_mapping = self.metadata.types.map_exported(project_data.get("types"))
+        if not status_mapping:
+            status_mapping = self.metadata.statuses.map_exported(project_data.get("statuses"))
+        
+        journal = None
+        if import_options and import_options.get("journal_path"):
+            journal = ImportJournal(import_options["journal_path"])
+        
+        new_project_id = None
         try:
             # 提取项目信息
             print(f"开始导入项目: {new_name or project_data.get('project', {}).get('name', '未命名')}")
             
             if "project" not in project_data:
                 raise ValueError("无效的项目数据: 缺少项目信息")
+            if "delta" in project_data:
+                raise ValueError("差异导出文件只包含变化的工作包，不能直接导入，请先与基准导出文件合并")
             
             project_info = project_data["project"]
+            source = source_fingerprint(project_data)
+            
+            if journal is not None:
+                if import_options.get("resume") and journal.load():
+                    if journal.source != source:
+                        raise ValueError(f"导入日志 {journal.path} 不属于当前导入数据，无法继续导入")
+                    if journal.completed:
+                        print(f"导入日志显示项目 {journal.project_id} 已导入完成")
+                        return journal.project_id
+                    print(f"根据导入日志继续导入到项目 {journal.project_id}: "
+                          f"已创建 {len(journal.id_mapping)} 个工作包，已完成 {len(journal.relations_done)} 个关系")
+                else:
+                    journal.reset()
             
             # 准备创建新项目的数据
             original_name = project_info.get("name", "未命名项目")
@@ -662,573 +970,188 @@ class OpenProjectClient:
                 }
             }
             
-            # 发送创建项目请求
-            if progress_callback:
-                progress_callback("创建项目", 0, 1, f"正在创建新项目: {project_name}")
-            
-            url = f"{self.api_url}/api/v3/projects"
-            response = self._session.post(
-                url,
-                json=new_project_data,
-                auth=self.auth
-            )
-            
-            if response.status_code not in [201, 200]:
-                error_msg = f"创建项目失败: {response.status_code} - {response.text}"
-                print(error_msg)
-                raise ValueError(error_msg)
-            
-            # 获取新项目ID
-            new_project = response.json()
-            new_project_id = new_project.get("id")
-            
-            if not new_project_id:
-                raise ValueError("创建项目成功但无法获取项目ID")
+            # 同一实例内的导入直接由服务器复制原项目，不再逐个创建工作包和关系
+            server_copy = import_options.get("server_copy", True) if import_options else True
+            if server_copy and (journal is None or not journal.project_id) and self._can_copy_on_server(project_data):
+                new_project_id = self._copy_project_on_server(
+                    project_info.get("id"), project_name, project_identifier, progress_callback)
+                if new_project_id:
+                    self._remap_copied_custom_fields(new_project_id, custom_field_mapping,
+                                                     import_options.get("max_workers") if import_options else None)
+                    if journal is not None:
+                        journal.record_project(new_project_id, source, project_name)
+                        journal.record_done()
+                    print(f"项目导入完成（服务器端复制），共耗时: {time.time() - start_time:.2f}秒")
+                    return new_project_id
+            
+            if journal is not None and journal.project_id:
+                # 继续导入时项目已经存在
+                new_project_id = journal.project_id
+                if progress_callback:
+                    progress_callback("创建项目", 1, 1, f"继续导入到已创建的项目: {new_project_id}")
+            else:
+                # 发送创建项目请求
+                if progress_callback:
+                    progress_callback("创建项目", 0, 1, f"正在创建新项目: {project_name}")
+                
+                url = f"{self.api_url}/api/v3/projects"
+                response = self._session.post(
+                    url,
+                    json=new_project_data,
+                    auth=self.auth
+                )
+                
+                if response.status_code not in [201, 200]:
+                    error_msg = f"创建项目失败: {response.status_code} - {response.text}"
+                    print(error_msg)
+                    raise ValueError(error_msg)
+                
+                # 获取新项目ID
+                new_project = response.json()
+                new_project_id = new_project.get("id")
+                
+                if not new_project_id:
+                    raise ValueError("创建项目成功但无法获取项目ID")
+                
+                print(f"新项目创建成功，ID: {new_project_id}")
+                if journal is not None:
+                    journal.record_project(new_project_id, source, project_name)
             
-            print(f"新项目创建成功，ID: {new_project_id}")
+            # 未能完成的工作包和关系数，有未完成的工作时导入日志不标记完成，继续导入时重试
+            unfinished = 0
             
             # 导入工作包
             if "work_packages" in project_data and project_data["work_packages"]:
                 work_packages = project_data["work_packages"]
-                total_wp_count = len(work_packages)
+                # 流式读取时工作包总数来自导出文件中的 work_package_count（旧版导出文件没有，进度按已读取数量显示）
+                total_wp_count = project_data.get("work_package_count") or 0
+                if isinstance(work_packages, list):
+                    total_wp_count = len(work_packages)
                 
                 if progress_callback:
-                    progress_callback("创建工作包", 0, total_wp_count, f"准备导入 {total_wp_count} 个工作包")
-                
-                print(f"开始导入 {total_wp_count} 个工作包...")
+                    progress_callback("创建工作包", 0, max(total_wp_count, 1), f"准备导入 {total_wp_count or '全部'} 个工作包")
                 
-                # 用于存储旧ID与新ID的映射关系
-                id_mapping = {}
-                completed_count = 0
+                print(f"开始导入 {total_wp_count or '全部'} 个工作包...")
                 
-                # 串行创建工作包
-                for index, wp in enumerate(work_packages):
-                    try:
-                        # 获取原始工作包信息
-                        original_id = wp.get("id")
-                        wp_subject = wp.get("subject", "未命名工作包")
-                        wp_description = wp.get("description", {}).get("raw", "")
-                        
-                        # 准备新工作包数据
-                        new_wp_data = {
-                            "subject": wp_subject,
-                            "_links": {
-                                "project": {
-                                    "href": f"/api/v3/projects/{new_project_id}"
-                                }
-                            }
-                        }
-                        
-                        # 添加描述
-                        if wp_description:
-                            new_wp_data["description"] = {"raw": wp_description}
-                        
-                        # 添加类型
-                        if "_links" in wp and "type" in wp["_links"]:
-                            original_type_id = None
-                            type_title = wp["_links"]["type"].get("title", "")
-                            type_href = wp["_links"]["type"].get("href", "")
-                            
-                            if type_href:
-                                # 从href中提取ID
-                                try:
-                                    original_type_id = re.search(r"/(\d+)$", type_href).group(1)
-                                except:
-                                    pass
-                            
-                            # 使用类型映射或使用相同的类型名称
-                            if original_type_id and original_type_id in type_mapping:
-                                mapped_type_id = type_mapping[original_type_id]
-                                new_wp_data["_links"]["type"] = {"href": f"/api/v3/types/{mapped_type_id}"}
-                            elif type_title:
-                                # 查找相同名称的类型
-                                types = self.get_types()
-                                for t in types:
-                                    if t.get("name") == type_title:
-                                        new_wp_data["_links"]["type"] = {"href": f"/api/v3/types/{t.get('id')}"}
-                                        break
-                        
-                        # 添加状态
-                        if "_links" in wp and "status" in wp["_links"]:
-                            original_status_id = None
-                            status_title = wp["_links"]["status"].get("title", "")
-                            status_href = wp["_links"]["status"].get("href", "")
-                            
-                            if status_href:
-                                # 从href中提取ID
-                                try:
-                                    original_status_id = re.search(r"/(\d+)$", status_href).group(1)
-                                except:
-                                    pass
-                            
-                            # 使用状态映射或使用相同的状态ID
-                            if original_status_id and original_status_id in status_mapping:
-                                # 如果有特定的状态映射，优先使用
-                                mapped_status_id = status_mapping[original_status_id]
-                                new_wp_data["_links"]["status"] = {"href": f"/api/v3/statuses/{mapped_status_id}"}
-                                print(f"使用映射状态ID: {original_status_id} -> {mapped_status_id}, 标题: {status_title}")
-                            elif original_status_id:
-                                # 直接使用原始状态ID，保持一致性
-                                new_wp_data["_links"]["status"] = {"href": f"/api/v3/statuses/{original_status_id}"}
-                                print(f"使用原始状态ID: {original_status_id}, 标题: {status_title}")
-                            elif status_title:
-                                # 查找相同名称的状态（作为备选）
-                                statuses = self.get_statuses()
-                                for s in statuses:
-                                    if s.get("name") == status_title:
-                                        new_wp_data["_links"]["status"] = {"href": f"/api/v3/statuses/{s.get('id')}"}
-                                        print(f"通过名称匹配状态: {status_title}, ID: {s.get('id')}")
-                                        break
-                        
-                        # 添加自定义字段
-                        if "_links" in wp:
-                            for key, value in wp["_links"].items():
-                                # 检查是否是自定义字段
-                                if key.startswith("customField") and isinstance(value, dict):
-                                    # 获取自定义字段ID和值
-                                    field_id = key.replace("customField", "")
-                                    field_href = value.get("href", "")
-                                    field_title = value.get("title", "")
-                                    
-                                    # 检查是否有自定义字段映射
-                                    mapped_field_id = None
-                                    if field_id in custom_field_mapping:
-                                        mapped_field_id = custom_field_mapping[field_id]
-                                        mapped_key = f"customField{mapped_field_id}"
-                                        print(f"应用自定义字段映射: {key} -> {mapped_key}")
-                                    else:
-                                        mapped_key = key
-                                    
-                                    if field_href and field_title:
-                                        print(f"处理自定义字段: {mapped_key}, 值: {field_title}")
-                                        # 添加到新工作包数据
-                                        new_wp_data["_links"][mapped_key] = {
-                                            "href": field_href,
-                                            "title": field_title
-                                        }
-                                        
-                                        # 特殊处理城市字段
-                                        if field_id == "1" and "城市" in field_title:
-                                            # 获取城市字段ID
-                                            city_field_id = self.get_city_field_id()
-                                            city_key = f"customField{city_field_id}"
-                                            # 如果与原始键不同，则添加城市字段
-                                            if city_key != mapped_key:
-                                                print(f"添加城市字段映射: {city_key}, 值: {field_title}")
-                                                new_wp_data["_links"][city_key] = {
-                                                    "href": field_href,
-                                                    "title": field_title
-                                                }
-                        
-                        # 创建工作包
-                        create_url = f"{self.api_url}/api/v3/work_packages"
-                        create_response = self._session.post(
-                            create_url,
-                            json=new_wp_data,
-                            auth=self.auth
-                        )
-                        
-                        if create_response.status_code not in [201, 200]:
-                            print(f"创建工作包失败: {create_response.status_code} - {create_response.text}")
-                            continue
-                        
-                        # 获取新工作包ID
-                        new_wp = create_response.json()
-                        new_wp_id = new_wp.get("id")
-                        
-                        if not new_wp_id:
-                            print(f"创建工作包成功但无法获取ID: {wp_subject}")
-                            continue
-                        
-                        print(f"工作包创建成功: {wp_subject}, 新ID: {new_wp_id}, 原ID: {original_id}")
-                        
-                        # 存储ID映射关系
-                        if original_id:
-                            id_mapping[str(original_id)] = str(new_wp_id)
-                            
-                    except Exception as e:
-                        print(f"导入工作包过程中出错: {str(e)}")
-                        continue
-                    finally:
-                        # 更新进度
-                        completed_count += 1
-                        if progress_callback and (completed_count % 5 == 0 or completed_count == total_wp_count):
-                            progress_callback("创建工作包", completed_count, total_wp_count, 
-                                            f"已创建 {completed_count}/{total_wp_count} 个工作包")
+                # 用于存储旧ID与新ID的映射关系，以及创建或更新响应中返回的lockVersion（按新ID）
+                id_mapping = dict(journal.id_mapping) if journal is not None else {}
+                lock_versions = dict(journal.lock_versions) if journal is not None else {}
+                max_workers = self._connection_pool_size
+                if import_options and import_options.get("max_workers"):
+                    max_workers = import_options["max_workers"]
                 
-                # 更新最终进度
-                if progress_callback:
-                    progress_callback("创建工作包", total_wp_count, total_wp_count, f"已导入 {len(id_mapping)} 个工作包")
+                # 预检：一次获取目标项目的schema，在本地检查每个工作包，有问题的不发送创建请求
+                preflight = None
+                payloads = None
+                if not import_options or import_options.get("preflight", True):
+                    preflight = ImportPreflight.load(self, new_project_id)
+                    if isinstance(work_packages, list):
+                        # 全部工作包已在内存中，写入之前先检查一遍并报告，检查后的创建数据在创建时直接使用
+                        mappings = (type_mapping, status_mapping, custom_field_mapping)
+                        payloads = {}
+                        for wp in work_packages:
+                            wp_id = str(wp.get("id"))
+                            if wp_id not in id_mapping:
+                                payloads[wp_id] = preflight.check(
+                                    wp.get("id"), self._build_import_payload(wp, new_project_id, *mappings))
+                        self._report_preflight(preflight, progress_callback)
                 
-                print(f"工作包导入完成，成功导入 {len(id_mapping)} 个工作包")
+                # 边读取边创建，创建请求中直接带上父任务的新ID，不再需要单独设置父子关系
+                relation_table, deferred_parents, read_count, created_count = self._stream_import_work_packages(
+                    work_packages, new_project_id, (type_mapping, status_mapping, custom_field_mapping),
+                    id_mapping, lock_versions, journal, max_workers, total_wp_count, progress_callback, preflight,
+                    payloads)
+                if preflight is not None and not isinstance(work_packages, list):
+                    # 流式读取时每个工作包在发送前检查，读取完成后汇总报告
+                    self._report_preflight(preflight, progress_callback)
                 
-                # 等待服务器处理完所有工作包创建请求
+                # 更新最终进度
                 if progress_callback:
-                    progress_callback("处理关系", 0, 1, "等待工作包创建稳定，准备处理关系...")
+                    progress_callback("创建工作包", read_count, max(read_count, 1), f"已导入 {len(id_mapping)} 个工作包")
                 
-                wait_time = 15  # 增加等待时间到15秒
-                print(f"等待{wait_time}秒，确保所有工作包创建完全处理完毕...")
-                time.sleep(wait_time)
+                print(f"工作包导入完成，读取 {read_count} 个，成功导入 {len(id_mapping)} 个工作包（本次创建 {created_count} 个）")
+                unfinished += read_count - len(id_mapping)
                 
-                # 导入关系
-                if id_mapping and work_packages:
+                # 导入关系：创建请求都已返回，关系两端的工作包都已存在，不需要等待
+                if id_mapping and read_count:
                     if progress_callback:
                         progress_callback("处理关系", 0, 1, "准备处理工作包关系")
                     
-                    # 初始化关系处理的计数器
-                    relations_created = 0
-                    relations_failed = 0
-                    
-                    # 处理关系的函数
-                    def process_relation(relation_type, from_id, to_id):
-                        """处理工作包关系
-                        
-                        Args:
-                            relation_type: 关系类型 ('parent', 'child', 'follows', 'precedes', 'relates')
-                            from_id: 源工作包ID
-                            to_id: 目标工作包ID
-                            
-                        Returns:
-                            bool: 是否成功创建关系
-                        """
-                        max_retries = 8  # 增加最大重试次数
-                        retry_count = 0
-                        
-                        while retry_count < max_retries:
-                            try:
-                                print(f"尝试创建关系 (尝试 {retry_count+1}/{max_retries}): {relation_type} {from_id} -> {to_id}")
-                                
-                                if relation_type == 'parent':
-                                    # 设置父工作包关系
-                                    update_url = f"{self.api_url}/api/v3/work_packages/{from_id}"
-                                    
-                                    # 获取当前工作包信息以获取lock_version
-                                    get_wp_response = self._session.get(
-                                        update_url,
-                                        auth=self.auth
-                                    )
-                                    
-                                    if get_wp_response.status_code != 200:
-                                        print(f"获取工作包信息失败: {from_id}, 状态码: {get_wp_response.status_code}")
-                                        retry_count += 1
-                                        time.sleep(2)  # 增加等待时间
-                                        continue
-                                    
-                                    wp_data = get_wp_response.json()
-                                    lock_version = wp_data.get("lockVersion", 0)
-                                    
-                                    # 设置关系
-                                    update_data = {
-                                        "lockVersion": lock_version,
-                                        "_links": {
-                                            "parent": {
-                                                "href": f"/api/v3/work_packages/{to_id}"
-                                            }
-                                        },
-                                        "_flags": ["force_relation"]  # 添加强制关系标志
-                                    }
-                                    
-                                    response = self._session.patch(
-                                        update_url,
-                                        json=update_data,
-                                        auth=self.auth
-                                    )
-                                    
-                                    if response.status_code in [200, 201]:
-                                        print(f"设置父子关系成功: {from_id} -> {to_id}")
-                                        return True
-                                    else:
-                                        print(f"设置父子关系失败: {from_id} -> {to_id}, 状态码: {response.status_code}, 返回: {response.text}")
-                                        # 如果是冲突，更新锁版本后重试
-                                        if response.status_code == 409:
-                                            retry_count += 1
-                                            time.sleep(3)  # 增加等待时间
-                                            continue
-                                        
-                                        # 如果失败，尝试使用关系API
-                                        if retry_count >= max_retries / 2:
-                                            try:
-                                                print(f"尝试使用关系API替代父子关系: {from_id} -> {to_id}")
-                                                relation_url = f"{self.api_url}/api/v3/work_package_relations"
-                                                relation_data = {
-                                                    "_links": {
-                                                        "from": {
-                                                            "href": f"/api/v3/work_packages/{from_id}"
-                                                        },
-                                                        "to": {
-                                                            "href": f"/api/v3/work_packages/{to_id}"
-                                                        }
-                                                    },
-                                                    "type": "relates"  # 使用relates作为替代
-                                                }
-                                                
-                                                alt_response = self._session.post(
-                                                    relation_url,
-                                                    json=relation_data,
-                                                    auth=self.auth
-                                                )
-                                                
-                                                if alt_response.status_code in [200, 201]:
-                                                    print(f"使用关系API创建关联关系成功: {from_id} -> {to_id}")
-                                                    return True
-                                            except Exception as e:
-                                                print(f"替代方法出错: {str(e)}")
-                                        
-                                        retry_count += 1
-                                        time.sleep(3)  # 增加等待时间
-                                        continue
-                                
-                                elif relation_type == 'child':
-                                    # 子关系与父关系相反，from成为to的子
-                                    update_url = f"{self.api_url}/api/v3/work_packages/{from_id}"
-                                    
-                                    # 获取当前工作包信息以获取lock_version
-                                    get_wp_response = self._session.get(
-                                        update_url,
-                                        auth=self.auth
-                                    )
-                                    
-                                    if get_wp_response.status_code != 200:
-                                        print(f"获取工作包信息失败: {from_id}, 状态码: {get_wp_response.status_code}")
-                                        retry_count += 1
-                                        time.sleep(2)  # 增加等待时间
-                                        continue
-                                    
-                                    wp_data = get_wp_response.json()
-                                    lock_version = wp_data.get("lockVersion", 0)
-                                    
-                                    # 设置关系
-                                    update_data = {
-                                        "lockVersion": lock_version,
-                                        "_links": {
-                                            "parent": {
-                                                "href": f"/api/v3/work_packages/{to_id}"
-                                            }
-                                        },
-                                        "_flags": ["force_relation"]  # 添加强制关系标志
-                                    }
-                                    
-                                    response = self._session.patch(
-                                        update_url,
-                                        json=update_data,
-                                        auth=self.auth
-                                    )
-                                    
-                                    if response.status_code in [200, 201]:
-                                        print(f"设置子关系成功: {from_id} -> {to_id}")
-                                        return True
-                                    else:
-                                        print(f"设置子关系失败: {from_id} -> {to_id}, 状态码: {response.status_code}, 返回: {response.text}")
-                                        # 如果是冲突，更新锁版本后重试
-                                        if response.status_code == 409:
-                                            retry_count += 1
-                                            time.sleep(3)  # 增加等待时间
-                                            continue
-                                        
-                                        # 如果失败，尝试使用关系API
-                                        if retry_count >= max_retries / 2:
-                                            try:
-                                                print(f"尝试使用关系API替代子关系: {from_id} -> {to_id}")
-                                                relation_url = f"{self.api_url}/api/v3/work_package_relations"
-                                                relation_data = {
-                                                    "_links": {
-                                                        "from": {
-                                                            "href": f"/api/v3/work_packages/{from_id}"
-                                                        },
-                                                        "to": {
-                                                            "href": f"/api/v3/work_packages/{to_id}"
-                                                        }
-                                                    },
-                                                    "type": "relates"  # 使用relates作为替代
-                                                }
-                                                
-                                                alt_response = self._session.post(
-                                                    relation_url,
-                                                    json=relation_data,
-                                                    auth=self.auth
-                                                )
-                                                
-                                                if alt_response.status_code in [200, 201]:
-                                                    print(f"使用关系API创建关联关系成功: {from_id} -> {to_id}")
-                                                    return True
-                                            except Exception as e:
-                                                print(f"替代方法出错: {str(e)}")
-                                        
-                                        retry_count += 1
-                                        time.sleep(3)  # 增加等待时间
-                                        continue
-                                
-                                else:
-                                    # 处理其他类型的关系
-                                    relation_url = f"{self.api_url}/api/v3/work_package_relations"
-                                    relation_data = {
-                                        "_links": {
-                                            "from": {
-                                                "href": f"/api/v3/work_packages/{from_id}"
-                                            },
-                                            "to": {
-                                                "href": f"/api/v3/work_packages/{to_id}"
-                                            }
-                                        }
-                                    }
-                                    
-                                    # 根据关系类型设置type属性
-                                    if relation_type == 'follows':
-                                        relation_data["type"] = "follows"
-                                    elif relation_type == 'precedes':
-                                        relation_data["type"] = "precedes"
-                                    elif relation_type == 'relates':
-                                        relation_data["type"] = "relates"
-                                    else:
-                                        print(f"未知的关系类型: {relation_type}")
-                                        return False
-                                    
-                                    response = self._session.post(
-                                        relation_url,
-                                        json=relation_data,
-                                        auth=self.auth
-                                    )
-                                    
-                                    if response.status_code in [200, 201]:
-                                        print(f"创建{relation_type}关系成功: {from_id} -> {to_id}")
-                                        return True
-                                    else:
-                                        print(f"创建{relation_type}关系失败: {from_id} -> {to_id}, 状态码: {response.status_code}, 返回: {response.text}")
-                                        retry_count += 1
-                                        time.sleep(2)  # 增加等待时间
-                                        continue
-                                
-                            except Exception as e:
-                                print(f"处理关系时出错 ({relation_type}): {from_id} -> {to_id}, 错误: {str(e)}")
-                                retry_count += 1
-                                time.sleep(2)  # 增加等待时间
-                                continue
-                        
-                        # 如果重试多次仍然失败
-                        print(f"处理关系失败，已重试 {max_retries} 次: {relation_type} {from_id} -> {to_id}")
-                        return False
-                    
                     # 准备关系数据
-                    parent_child_relations = []
                     predecessor_successor_relations = []
                     other_relations = []
+                    missing_relations = 0
                     
-                    for wp in work_packages:
-                        original_id = str(wp.get("id"))
-                        if not original_id or original_id not in id_mapping:
+                    for relation_type, original_id, to_id in relation_table:
+                        if original_id not in id_mapping or to_id not in id_mapping:
+                            missing_relations += 1
                             continue
                         
-                        new_id = id_mapping[original_id]
-                        
-                        # 处理父关系
-                        if "_links" in wp and "parent" in wp["_links"] and wp["_links"]["parent"]:
-                            parent_href = wp["_links"]["parent"].get("href", "")
-                            if parent_href:
-                                # 从href中提取父ID
-                                try:
-                                    parent_id = re.search(r"/(\d+)$", parent_href).group(1)
-                                    if parent_id and parent_id in id_mapping:
-                                        parent_child_relations.append(('child', new_id, id_mapping[parent_id]))
-                                except:
-                                    pass
-                        
-                        # 收集关系数据
-                        if "relations" in wp:
-                            for relation in wp["relations"]:
-                                relation_type = relation.get("type", "")
-                                to_id = relation.get("to_id", "")
-                                
-                                if not to_id or not relation_type or to_id not in id_mapping:
-                                    continue
-                                
-                                # 根据关系类型分类
-                                if relation_type in ["precedes", "follows"]:
-                                    predecessor_successor_relations.append((relation_type, new_id, id_mapping[to_id]))
-                                else:
-                                    other_relations.append((relation_type, new_id, id_mapping[to_id]))
+                        # 根据关系类型分类
+                        relation = (relation_type, id_mapping[original_id], id_mapping[to_id])
+                        if relation_type in ["precedes", "follows"]:
+                            predecessor_successor_relations.append(relation)
+                        else:
+                            other_relations.append(relation)
+                    if missing_relations:
+                        print(f"跳过 {missing_relations} 个引用了未创建工作包的关系")
+                    
+                    # 存在循环的父子关系只有强制处理关系时才尝试设置
+                    parent_updates = [("parent", id_mapping[child_id], id_mapping[parent_id])
+                                      for child_id, parent_id in deferred_parents
+                                      if child_id in id_mapping and parent_id in id_mapping]
+                    if parent_updates and not force_relations:
+                        print(f"跳过 {len(parent_updates)} 个存在循环的父子关系，启用强制处理关系后可以尝试设置")
+                        parent_updates = []
+                    
+                    # 跳过导入日志中已完成的关系
+                    if journal is not None and journal.relations_done:
+                        pending = [[item for item in items if ":".join(item) not in journal.relations_done]
+                                   for items in (parent_updates, predecessor_successor_relations, other_relations)]
+                        skipped = (len(parent_updates) + len(predecessor_successor_relations) + len(other_relations)
+                                   - sum(len(items) for items in pending))
+                        print(f"导入日志中已完成 {skipped} 个关系，跳过")
+                        parent_updates, predecessor_successor_relations, other_relations = pending
                     
                     # 计算总关系数
-                    total_relations = len(parent_child_relations) + len(predecessor_successor_relations) + len(other_relations)
+                    total_relations = len(parent_updates) + len(predecessor_successor_relations) + len(other_relations)
                     print(f"找到 {total_relations} 个关系需要处理")
                     
                     if total_relations > 0:
+                        relations_created = 0
                         current_progress = 0
                         
-                        # 第一阶段：处理父子关系
-                        if progress_callback:
-                            progress_callback("处理关系", current_progress, total_relations, 
-                                            f"处理父子关系 (0/{len(parent_child_relations)})")
-                        
-                        parent_child_successful = 0
-                        for i, (relation_type, from_id, to_id) in enumerate(parent_child_relations):
-                            result = process_relation(relation_type, from_id, to_id)
-                            if result:
-                                parent_child_successful += 1
-                            
-                            # 每处理一个关系就等待一小段时间
-                            time.sleep(1.5)
-                            
-                            current_progress += 1
-                            if progress_callback and (i % 5 == 0 or i == len(parent_child_relations) - 1):
-                                progress_callback("处理关系", current_progress, total_relations, 
-                                                f"处理父子关系 ({i+1}/{len(parent_child_relations)})")
-                        
-                        relations_created += parent_child_successful
-                        relations_failed += len(parent_child_relations) - parent_child_successful
-                        
-                        # 在处理完父子关系后等待后再处理其他关系
-                        wait_time = 10
-                        print(f"父子关系处理完成，等待{wait_time}秒再处理前置后置关系...")
-                        time.sleep(wait_time)
-                        
-                        # 第二阶段：处理前置后置关系
-                        if progress_callback:
-                            progress_callback("处理关系", current_progress, total_relations, 
-                                            f"处理前置/后置关系 (0/{len(predecessor_successor_relations)})")
-                        
-                        pred_succ_successful = 0
-                        for i, (relation_type, from_id, to_id) in enumerate(predecessor_successor_relations):
-                            result = process_relation(relation_type, from_id, to_id)
-                            if result:
-                                pred_succ_successful += 1
-                            
-                            # 每处理一个关系就等待一小段时间
-                            time.sleep(1.5)
-                            
-                            current_progress += 1
-                            if progress_callback and (i % 5 == 0 or i == len(predecessor_successor_relations) - 1):
-                                progress_callback("处理关系", current_progress, total_relations, 
-                                                f"处理前置/后置关系 ({i+1}/{len(predecessor_successor_relations)})")
-                        
-                        relations_created += pred_succ_successful
-                        relations_failed += len(predecessor_successor_relations) - pred_succ_successful
-                        
-                        # 在处理完前置后置关系后等待后再处理其他关系
-                        wait_time = 10
-                        print(f"前置后置关系处理完成，等待{wait_time}秒再处理其他关系...")
-                        time.sleep(wait_time)
-                        
-                        # 第三阶段：处理其他关系
-                        if progress_callback:
-                            progress_callback("处理关系", current_progress, total_relations, 
-                                            f"处理其他关系 (0/{len(other_relations)})")
-                        
-                        other_successful = 0
-                        for i, (relation_type, from_id, to_id) in enumerate(other_relations):
-                            result = process_relation(relation_type, from_id, to_id)
-                            if result:
-                                other_successful += 1
-                            
-                            # 每处理一个关系就等待一小段时间
-                            time.sleep(1.5)
-                            
-                            current_progress += 1
-                            if progress_callback and (i % 5 == 0 or i == len(other_relations) - 1):
-                                progress_callback("处理关系", current_progress, total_relations, 
-                                                f"处理其他关系 ({i+1}/{len(other_relations)})")
+                        # 各阶段依次进行，同一阶段的请求并发发送
+                        phases = [
+                            ("父子关系", lambda _, child_id, parent_id: self._set_import_parent(
+                                child_id, parent_id, lock_versions), parent_updates),
+                            ("前置/后置关系", self._create_import_relation, predecessor_successor_relations),
+                            ("其他关系", self._create_import_relation, other_relations),
+                        ]
+                        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                            for phase_name, handler, items in phases:
+                                if not items:
+                                    continue
+                                if progress_callback:
+                                    progress_callback("处理关系", current_progress, total_relations, 
+                                                    f"处理{phase_name} (0/{len(items)})")
+                                
+                                futures = {executor.submit(handler, *item): item for item in items}
+                                for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                                    if future.result():
+                                        relations_created += 1
+                                        if journal is not None:
+                                            journal.record_relation(":".join(futures[future]))
+                                    
+                                    current_progress += 1
+                                    if progress_callback and (i % 5 == 0 or i == len(items) - 1):
+                                        progress_callback("处理关系", current_progress, total_relations, 
+                                                        f"处理{phase_name} ({i+1}/{len(items)})")
+                                if journal is not None:
+                                    journal.sync()
                         
-                        relations_created += other_successful
-                        relations_failed += len(other_relations) - other_successful
+                        relations_failed = total_relations - relations_created
+                        unfinished += relations_failed
                         
                         # 更新最终进度
                         if progress_callback:
@@ -1241,6 +1164,12 @@ class OpenProjectClient:
                             progress_callback("处理关系", 1, 1, "没有找到需要处理的关系")
                         print("没有找到需要处理的关系")
             
+            if journal is not None:
+                if unfinished:
+                    print(f"有 {unfinished} 个工作包或关系未能导入，可以根据导入日志 {journal.path} 继续导入重试")
+                else:
+                    journal.record_done()
+            
             # 记录导入耗时
             end_time = time.time()
             print(f"项目导入完成，共耗时: {end_time - start_time:.2f}秒")
@@ -1250,8 +1179,623 @@ class OpenProjectClient:
         except Exception as e:
             error_msg = f"导入项目失败: {str(e)}\n{traceback.format_exc()}"
             print(error_msg)
+            if journal is not None and journal.project_id:
+                print(f"导入进度已记录在 {journal.path}，可以继续导入")
+            return None
+        finally:
+            if journal is not None:
+                journal.close()
+            if new_project_id:
+                # 继续导入时项目可能已经被查看过，导入写入后之前的快照不再有效
+                from project_snapshot import project_snapshots  # project_snapshot 依赖本模块，在此处导入
+                project_snapshots.invalidate(new_project_id)
+    
+    def _can_copy_on_server(self, project_data):
+        """导出文件是否来自当前连接的OpenProject实例，且原项目在导出之后没有变化
+        
+        服务器端复制的是原项目的当前数据，只有当前数据与导出文件一致时才能代替按文件导入：
+        项目的更新时间与导出时相同，没有在导出时间之后更新的工作包，且工作包总数与导出时相同（排除删除）。
+        没有导出时间的旧版导出文件无法确认，不使用服务器端复制。
+        """
+        source = project_data.get("source") or {}
+        source_url = (source.get("api_url") or "").rstrip("/").lower()
+        exported_project = project_data.get("project", {})
+        source_project_id = exported_project.get("id")
+        exported_at = project_data.get("exported_at")
+        if not source_url or source_url != (self.api_url or "").rstrip("/").lower() or not source_project_id:
+            return False
+        if not exported_at:
+            print("导出文件中没有导出时间，无法确认原项目是否变化，按文件导入")
+            return False
+        
+        current_project = self.get_project_details(source_project_id)
+        if current_project is None:
+            return False
+        if current_project.get("updatedAt") != exported_project.get("updatedAt"):
+            print(f"原项目 {source_project_id} 在导出之后有修改，按文件导入")
+            return False
+        
+        # 只需要总数，每页取一个工作包
+        updated, updated_total = self.get_work_packages_page(
+            source_project_id, page=1, page_size=1,
+            filters=[{"updatedAt": {"operator": "<>d", "values": [exported_at, ""]}}])
+        if updated is None or updated_total:
+            print(f"原项目 {source_project_id} 在 {exported_at} 之后有工作包更新，按文件导入")
+            return False
+        exported_count = project_data.get("work_package_count")
+        if exported_count is not None:
+            current, current_total = self.get_work_packages_page(source_project_id, page=1, page_size=1)
+            if current is None or current_total != exported_count:
+                print(f"原项目 {source_project_id} 的工作包数量与导出时不同，按文件导入")
+                return False
+        return True
+    
+    def _copy_project_on_server(self, source_project_id, name, identifier, progress_callback=None, timeout=900):
+        """使用服务器端的项目复制接口创建新项目，并轮询复制任务状态直到完成
+        
+        复制的是原项目在服务器上的当前数据，而不是导出文件中的数据。
+        
+        Args:
+            source_project_id: 原项目ID
+            name: 新项目名称
+            identifier: 新项目标识符
+            progress_callback: 进度回调
+            timeout: 等待复制任务完成的最长秒数
+            
+        Returns:
+            新项目ID；服务器不支持或拒绝复制时返回None，调用方改为逐个创建
+            
+        Raises:
+            ValueError: 复制任务已开始但失败或超时
+        """
+        url = f"{self.api_url}/api/v3/projects/{source_project_id}/copy"
+        copy_data = {
+            "name": name,
+            "identifier": identifier,
+            "_meta": {
+                "copyWorkPackages": True,
+                "copyCategories": True,
+                "copyVersions": True,
+                "copyMembers": True,
+                "copyQueries": True,
+                "sendNotifications": False
+            }
+        }
+        
+        if progress_callback:
+            progress_callback("创建项目", 0, 1, f"正在由服务器复制项目 {source_project_id}: {name}")
+        try:
+            response = self._session.post(url, json=copy_data, auth=self.auth, allow_redirects=False)
+        except Exception as e:
+            print(f"服务器端复制请求出错，改为逐个创建: {str(e)}")
+            return None
+        
+        # 复制接口返回302，Location指向复制任务的状态
+        job_url = response.headers.get("Location")
+        if response.status_code not in (200, 201, 202, 302, 303) or not job_url:
+            print(f"服务器端复制不可用，改为逐个创建: {response.status_code} - {response.text[:200]}")
             return None
+        if job_url.startswith("/"):
+            job_url = f"{self.api_url}{job_url}"
+        print(f"服务器端复制已开始，任务状态: {job_url}")
+        
+        start_time = time.time()
+        interval = 0.5
+        while True:
+            time.sleep(interval)
+            interval = min(interval * 2, 5)
+            elapsed = time.time() - start_time
+            response = self._session.get(job_url, auth=self.auth)
+            if response.status_code != 200:
+                raise ValueError(f"获取复制任务状态失败: {response.status_code} - {response.text[:200]}")
+            job = response.json()
+            status = job.get("status")
+            if status == "success":
+                break
+            if status in ("failure", "error", "cancelled"):
+                message = job.get("message") or job.get("payload") or ""
+                raise ValueError(f"服务器端复制项目失败: {status} {message}")
+            if elapsed > timeout:
+                raise ValueError(f"服务器端复制项目超过 {timeout} 秒未完成，最后状态: {status}")
+            if progress_callback:
+                progress_callback("创建项目", 0, 1, f"服务器正在复制项目（{status}，已等待 {elapsed:.0f} 秒）")
+        
+        new_project_id = None
+        payload = job.get("payload") if isinstance(job.get("payload"), dict) else {}
+        for links in (job.get("_links", {}), payload.get("_links", {})):
+            project_link = links.get("project")
+            match = _HREF_ID.search(project_link.get("href") or "") if isinstance(project_link, dict) else None
+            if match:
+                new_project_id = int(match.group(1))
+                break
+        if new_project_id is None:
+            # 任务状态中没有项目链接时按标识符查找新项目
+            new_project = self.get_project_details(identifier)
+            new_project_id = new_project.get("id") if new_project else None
+        if not new_project_id:
+            raise ValueError("服务器端复制完成但无法获取新项目ID")
+        
+        self._projects_cache = None
+        if progress_callback:
+            progress_callback("创建项目", 1, 1, f"服务器端复制完成，新项目ID: {new_project_id}")
+        print(f"服务器端复制完成，新项目ID: {new_project_id}，耗时 {time.time() - start_time:.1f}秒")
+        return new_project_id
+    
+    def _remap_copied_custom_fields(self, project_id, custom_field_mapping, max_workers=None):
+        """把复制得到的工作包中原自定义字段的值移到映射后的字段，没有需要移动的字段时不发送请求"""
+        moves = {f"customField{source}": f"customField{target}"
+                 for source, target in (custom_field_mapping or {}).items() if str(source) != str(target)}
+        if not moves:
+            return 0
+        
+        work_packages = []
+        page = 1
+        while True:
+            elements, total = self.get_work_packages_page(project_id, page=page, page_size=1000)
+            if not elements:
+                break
+            work_packages.extend(elements)
+            if len(work_packages) >= total:
+                break
+            page += 1
+        
+        def remap(wp):
+            links = wp.get("_links", {})
+            update_links = {target: {"href": links[source].get("href")}
+                            for source, target in moves.items()
+                            if isinstance(links.get(source), dict) and links[source].get("href")}
+            if not update_links:
+                return False
+            update_data = {"lockVersion": wp.get("lockVersion", 0), "_links": update_links}
+            response = self._session.patch(f"{self.api_url}/api/v3/work_packages/{wp['id']}",
+                                           json=update_data, auth=self.auth)
+            if response.status_code != 200:
+                print(f"工作包 {wp['id']} 自定义字段映射失败: {response.status_code} - {response.text[:200]}")
+                return False
+            return True
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or self._connection_pool_size) as executor:
+            updated = sum(1 for result in executor.map(remap, work_packages) if result)
+        print(f"自定义字段映射完成: 更新 {updated}/{len(work_packages)} 个工作包")
+        return updated
+    
+    def _report_preflight(self, preflight, progress_callback=None):
+        """输出预检发现的问题"""
+        fixed, rejected, lines = preflight.summary()
+        message = f"预检完成: {fixed} 个工作包已修正，{rejected} 个工作包无法创建"
+        print(message)
+        for line in lines:
+            print(f"  {line}")
+        if progress_callback:
+            progress_callback("预检", 1, 1, message)
     
+    def _journal_import_work_package(self, journal):
+        """生成把创建结果写入导入日志的future回调"""
+        def record(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            original_id, new_wp_id, lock_version = future.result()
+            if original_id and new_wp_id:
+                journal.record_work_package(original_id, new_wp_id, lock_version)
+        return record
+    
+    def _import_parent_id(self, wp):
+        """从导出数据的parent链接中解析父工作包的原ID，没有父任务时返回None"""
+        parent_link = wp.get("_links", {}).get("parent")
+        if not isinstance(parent_link, dict):
+            return None
+        match = re.search(r"/(\d+)$", parent_link.get("href") or "")
+        return match.group(1) if match else None
+
+    def _stream_import_work_packages(self, work_packages, new_project_id, mappings, id_mapping, lock_versions,
+                                     journal=None, max_workers=8, total=0, progress_callback=None, preflight=None,
+                                     payloads=None):
+        """边读取边创建导入的工作包，父任务总在子任务之前创建
+        
+        工作包按读取顺序提交：没有父任务或父任务已创建的立即提交，父任务尚未创建的等到父任务完成后提交；
+        读取结束后仍在等待的工作包，父任务不在导入数据中时作为顶级任务创建，父子链接存在循环时从循环处截断。
+        已提交的工作包不再保留，内存中只有ID映射、关系表和等待父任务的工作包；
+        进行中的请求达到 max_workers 的4倍时暂停读取，等待请求完成。
+        
+        Args:
+            work_packages: 工作包列表或逐个返回工作包的迭代器
+            new_project_id: 新项目ID
+            mappings: (类型映射, 状态映射, 自定义字段映射)
+            id_mapping: 原ID到新ID的字典，已包含导入日志中已创建的工作包，创建成功后写入
+            lock_versions: 新ID到lockVersion的字典，创建成功后写入
+            journal: 导入日志，为None时不记录
+            max_workers: 并发请求数
+            total: 工作包总数，只用于显示进度，未知时为0
+            progress_callback: 进度回调
+            preflight: 导入预检，预检未通过的工作包不发送创建请求
+            payloads: 已生成并预检过的创建数据（原ID -> 创建数据，预检未通过时为None），其中的工作包不再重复生成和检查
+            
+        Returns:
+            tuple: (关系表 [(类型, 原ID, 目标原ID)], 存在循环的父子关系 [(原ID, 父任务原ID)], 读取的工作包数, 本次创建的工作包数)
+        """
+        type_mapping, status_mapping, custom_field_mapping = mappings
+        # 列表中的工作包ID可以预先确定，父任务不在其中时不必等到读取结束
+        known_ids = {str(wp.get("id")) for wp in work_packages} if isinstance(work_packages, list) else None
+        relation_table = []
+        deferred_parents = []
+        parents = {}        # 已读取的工作包原ID -> 父任务原ID
+        waiting = {}        # 父任务原ID -> 等待它创建的工作包列表
+        failed = set()
+        results = queue.Queue()
+        state = {"pending": 0, "completed": 0, "created": 0}
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def submit(wp, parent_new_id):
+                wp_id = str(wp.get("id"))
+                future = executor.submit(
+                    self._create_import_work_package, wp, new_project_id, parent_new_id,
+                    type_mapping, status_mapping, custom_field_mapping, preflight, payloads)
+                if journal is not None:
+                    # 请求完成时立即记录，导入因异常中断时已发出的请求也不会丢失记录
+                    future.add_done_callback(self._journal_import_work_package(journal))
+                future.add_done_callback(lambda done, wp_id=wp_id: results.put((wp_id, done)))
+                state["pending"] += 1
+            
+            def release(parent_id):
+                # 父任务完成或确定无法创建后提交等待它的子任务
+                parent_new_id = id_mapping.get(parent_id)
+                for child in waiting.pop(parent_id, []):
+                    if not parent_new_id:
+                        print(f"父工作包 {parent_id} 未能创建，工作包 {child.get('id')} 将作为顶级任务导入")
+                    submit(child, parent_new_id)
+            
+            def finish(wp_id, future):
+                state["pending"] -= 1
+                new_wp_id = None
+                if future.exception() is None:
+                    _, new_wp_id, lock_version = future.result()
+                if new_wp_id:
+                    id_mapping[wp_id] = str(new_wp_id)
+                    if lock_version is not None:
+                        lock_versions[str(new_wp_id)] = lock_version
+                    state["created"] += 1
+                else:
+                    failed.add(wp_id)
+                
+                # 更新进度
+                state["completed"] += 1
+                completed_count = state["completed"]
+                progress_total = max(total, len(parents))
+                if progress_callback and (completed_count % 5 == 0 or completed_count == progress_total):
+                    progress_callback("创建工作包", completed_count, progress_total, 
+                                    f"已创建 {completed_count}/{progress_total} 个工作包")
+                release(wp_id)
+            
+            for wp in work_packages:
+                wp_id = str(wp.get("id"))
+                parent_id = self._import_parent_id(wp)
+                parents[wp_id] = parent_id
+                for relation in wp.get("relations") or []:
+                    if relation.get("type") and relation.get("to_id"):
+                        relation_table.append((relation["type"], wp_id, str(relation["to_id"])))
+                
+                if wp_id in id_mapping:
+                    # 导入日志中已创建的工作包
+                    state["completed"] += 1
+                    release(wp_id)
+                elif parent_id is None or parent_id in id_mapping or (known_ids is not None and parent_id not in known_ids):
+                    submit(wp, id_mapping.get(parent_id))
+                elif parent_id in failed:
+                    print(f"父工作包 {parent_id} 未能创建，工作包 {wp_id} 将作为顶级任务导入")
+                    submit(wp, None)
+                else:
+                    waiting.setdefault(parent_id, []).append(wp)
+                
+                # 处理已完成的请求，进行中的请求过多时等待
+                while True:
+                    try:
+                        finish(*results.get(block=state["pending"] >= max_workers * 4))
+                    except queue.Empty:
+                        break
+            
+            while state["pending"] or waiting:
+                if state["pending"]:
+                    finish(*results.get())
+                    continue
+                # 没有进行中的请求时仍在等待：父任务不在导入数据中的，子任务作为顶级任务导入
+                absent = [parent_id for parent_id in waiting if parent_id not in parents]
+                if absent:
+                    for parent_id in absent:
+                        for child in waiting.pop(parent_id):
+                            submit(child, None)
+                    continue
+                # 其余等待的父任务都在等待各自的父任务，沿父链接向上必然回到链上的某个工作包，即存在循环
+                chain = []
+                member = next(iter(waiting))
+                while member not in chain:
+                    chain.append(member)
+                    member = parents[member]
+                cycle = chain[chain.index(member):]
+                parent_id = parents[member]
+                children = waiting[parent_id]
+                child = next(child for child in children if str(child.get("id")) == member)
+                children.remove(child)
+                if not children:
+                    del waiting[parent_id]
+                print(f"工作包 {' → '.join(cycle)} 的父子链接存在循环，工作包 {member} 先作为顶级任务创建")
+                deferred_parents.append((member, parent_id))
+                # 循环中的其他工作包在 member 创建后由 release() 依次提交
+                submit(child, None)
+        
+        if journal is not None:
+            journal.sync()
+        return relation_table, deferred_parents, len(parents), state["created"]
+
+    def _build_import_payload(self, wp, new_project_id, type_mapping, status_mapping, custom_field_mapping):
+        """根据导出的工作包生成在新项目中创建工作包的请求数据"""
+        # 获取原始工作包信息
+        wp_subject = wp.get("subject", "未命名工作包")
+        wp_description = wp.get("description", {}).get("raw", "")
+        
+        # 准备新工作包数据
+        new_wp_data = {
+            "subject": wp_subject,
+            "_links": {
+                "project": {
+                    "href": f"/api/v3/projects/{new_project_id}"
+                }
+            }
+        }
+        
+        # 添加描述
+        if wp_description:
+            new_wp_data["description"] = {"raw": wp_description}
+        
+        # 添加类型：优先使用类型映射，其次在当前实例的类型中按ID（名称一致时）或名称查找
+        type_link = wp.get("_links", {}).get("type")
+        if isinstance(type_link, dict):
+            match = _HREF_ID.search(type_link.get("href") or "")
+            original_type_id = match.group(1) if match else None
+            if original_type_id and original_type_id in type_mapping:
+                mapped_type_id = type_mapping[original_type_id]
+                new_wp_data["_links"]["type"] = {"href": f"/api/v3/types/{mapped_type_id}"}
+            else:
+                local_type = self.metadata.types.resolve(type_link)
+                if local_type is not None:
+                    new_wp_data["_links"]["type"] = {"href": self.metadata.types.href(local_type)}
+        
+        # 添加状态
+        status_link = wp.get("_links", {}).get("status")
+        if isinstance(status_link, dict):
+            status_title = status_link.get("title", "")
+            match = _HREF_ID.search(status_link.get("href") or "")
+            original_status_id = match.group(1) if match else None
+            local_status = self.metadata.statuses.resolve(status_link)
+        
+            if original_status_id and original_status_id in status_mapping:
+                # 如果有特定的状态映射，优先使用
+                mapped_status_id = status_mapping[original_status_id]
+                new_wp_data["_links"]["status"] = {"href": f"/api/v3/statuses/{mapped_status_id}"}
+            elif local_status is not None:
+                new_wp_data["_links"]["status"] = {"href": self.metadata.statuses.href(local_status)}
+            elif original_status_id:
+                # 当前实例中没有对应的状态（或无法获取状态列表）时直接使用原始状态ID
+                new_wp_data["_links"]["status"] = {"href": f"/api/v3/statuses/{original_status_id}"}
+                print(f"未找到对应的状态，使用原始状态ID: {original_status_id}, 标题: {status_title}")
+        
+        # 添加优先级
+        priority_link = wp.get("_links", {}).get("priority")
+        if isinstance(priority_link, dict):
+            local_priority = self.metadata.priorities.resolve(priority_link)
+            if local_priority is not None:
+                new_wp_data["_links"]["priority"] = {"href": self.metadata.priorities.href(local_priority)}
+        
+        # 添加自定义字段
+        if "_links" in wp:
+            for key, value in wp["_links"].items():
+                # 检查是否是自定义字段
+                if key.startswith("customField") and isinstance(value, dict):
+                    # 获取自定义字段ID和值
+                    field_id = key.replace("customField", "")
+                    field_href = value.get("href", "")
+                    field_title = value.get("title", "")
+        
+                    # 检查是否有自定义字段映射
+                    mapped_field_id = None
+                    if field_id in custom_field_mapping:
+                        mapped_field_id = custom_field_mapping[field_id]
+                        mapped_key = f"customField{mapped_field_id}"
+                        print(f"应用自定义字段映射: {key} -> {mapped_key}")
+                    else:
+                        mapped_key = key
+        
+                    if field_href and field_title:
+                        print(f"处理自定义字段: {mapped_key}, 值: {field_title}")
+                        # 添加到新工作包数据
+                        new_wp_data["_links"][mapped_key] = {
+                            "href": field_href,
+                            "title": field_title
+                        }
+        
+                        # 特殊处理城市字段
+                        if field_id == "1" and "城市" in field_title:
+                            # 获取城市字段ID
+                            city_field_id = self.get_city_field_id()
+                            city_key = f"customField{city_field_id}"
+                            # 如果与原始键不同，则添加城市字段
+                            if city_key != mapped_key:
+                                print(f"添加城市字段映射: {city_key}, 值: {field_title}")
+                                new_wp_data["_links"][city_key] = {
+                                    "href": field_href,
+                                    "title": field_title
+                                }
+        
+        return new_wp_data
+
+    def _create_import_work_package(self, wp, new_project_id, parent_new_id, type_mapping, status_mapping,
+                                    custom_field_mapping, preflight=None, payloads=None):
+        """在新项目中创建一个导入的工作包，在线程池中执行
+        
+        Args:
+            wp: 导出的工作包
+            new_project_id: 新项目ID
+            parent_new_id: 父工作包在新项目中的ID，没有时为None
+            type_mapping: 类型映射
+            status_mapping: 状态映射
+            custom_field_mapping: 自定义字段映射
+            preflight: 导入预检，为None时不检查
+            payloads: 已生成并预检过的创建数据，包含该工作包时直接使用（取出后删除），不再生成和检查
+            
+        Returns:
+            (原ID, 新ID, lockVersion) 元组，创建失败或预检未通过时新ID为None
+        """
+        original_id = wp.get("id")
+        wp_subject = wp.get("subject", "未命名工作包")
+        try:
+            if payloads is not None and str(original_id) in payloads:
+                new_wp_data = payloads.pop(str(original_id))
+            else:
+                new_wp_data = self._build_import_payload(wp, new_project_id, type_mapping, status_mapping,
+                                                         custom_field_mapping)
+                if preflight is not None:
+                    new_wp_data = preflight.check(original_id, new_wp_data)
+            if new_wp_data is None:
+                print(f"工作包 {wp_subject} (原ID: {original_id}) 预检未通过，不创建")
+                return original_id, None, None
+            if parent_new_id:
+                new_wp_data["_links"]["parent"] = {"href": f"/api/v3/work_packages/{parent_new_id}"}
+            
+            # 创建工作包
+            create_url = f"{self.api_url}/api/v3/work_packages"
+            create_response = self._session.post(
+                create_url,
+                json=new_wp_data,
+                auth=self.auth
+            )
+            
+            if create_response.status_code not in [201, 200]:
+                print(f"创建工作包失败: {create_response.status_code} - {create_response.text}")
+                return original_id, None, None
+            
+            # 获取新工作包ID
+            new_wp = create_response.json()
+            new_wp_id = new_wp.get("id")
+            
+            if not new_wp_id:
+                print(f"创建工作包成功但无法获取ID: {wp_subject}")
+                return original_id, None, None
+            
+            print(f"工作包创建成功: {wp_subject}, 新ID: {new_wp_id}, 原ID: {original_id}")
+            return original_id, new_wp_id, new_wp.get("lockVersion")
+        except Exception as e:
+            print(f"导入工作包过程中出错: {str(e)}")
+            return original_id, None, None
+
+    def _create_import_relation(self, relation_type, from_id, to_id):
+        """创建导入的前置/后置或关联关系，在线程池中执行
+        
+        只有请求异常、409冲突和服务器错误会重试，其他错误（例如关系无效）重试也不会成功，直接返回失败。
+        
+        Args:
+            relation_type: 关系类型 ('follows', 'precedes', 'relates')
+            from_id: 源工作包ID
+            to_id: 目标工作包ID
+            
+        Returns:
+            bool: 是否成功创建关系
+        """
+        if relation_type not in ("follows", "precedes", "relates"):
+            print(f"未知的关系类型: {relation_type}")
+            return False
+        
+        relation_url = f"{self.api_url}/api/v3/work_package_relations"
+        relation_data = {
+            "_links": {
+                "from": {
+                    "href": f"/api/v3/work_packages/{from_id}"
+                },
+                "to": {
+                    "href": f"/api/v3/work_packages/{to_id}"
+                }
+            },
+            "type": relation_type
+        }
+        
+        max_retries = 3
+        for retry_count in range(max_retries):
+            try:
+                response = self._session.post(
+                    relation_url,
+                    json=relation_data,
+                    auth=self.auth
+                )
+            except Exception as e:
+                print(f"处理关系时出错 ({relation_type}): {from_id} -> {to_id}, 错误: {str(e)}")
+            else:
+                if response.status_code in [200, 201]:
+                    print(f"创建{relation_type}关系成功: {from_id} -> {to_id}")
+                    return True
+                print(f"创建{relation_type}关系失败: {from_id} -> {to_id}, 状态码: {response.status_code}, 返回: {response.text}")
+                if response.status_code != 409 and response.status_code < 500:
+                    return False
+            time.sleep(1 + retry_count)
+        
+        print(f"处理关系失败，已重试 {max_retries} 次: {relation_type} {from_id} -> {to_id}")
+        return False
+
+    def _set_import_parent(self, wp_id, parent_id, lock_versions):
+        """设置导入工作包的父任务，在线程池中执行
+        
+        使用创建或上次更新响应中记录的lockVersion，不再在每次更新前读取工作包；
+        只有发生409冲突（工作包已被修改）时才重新读取lockVersion后重试。
+        
+        Args:
+            wp_id: 工作包新ID
+            parent_id: 父工作包新ID
+            lock_versions: 新ID到lockVersion的字典，更新成功后写入新的lockVersion
+            
+        Returns:
+            bool: 是否设置成功
+        """
+        update_url = f"{self.api_url}/api/v3/work_packages/{wp_id}"
+        max_retries = 3
+        for retry_count in range(max_retries):
+            lock_version = lock_versions.get(wp_id)
+            if lock_version is None:
+                wp_data = self.get_work_package(wp_id)
+                if not wp_data:
+                    return False
+                lock_version = wp_data.get("lockVersion", 0)
+            
+            update_data = {
+                "lockVersion": lock_version,
+                "_links": {
+                    "parent": {
+                        "href": f"/api/v3/work_packages/{parent_id}"
+                    }
+                },
+                "_flags": ["force_relation"]  # 添加强制关系标志
+            }
+            try:
+                response = self._session.patch(
+                    update_url,
+                    json=update_data,
+                    auth=self.auth
+                )
+            except Exception as e:
+                print(f"设置父子关系时出错: {wp_id} -> {parent_id}, 错误: {str(e)}")
+                time.sleep(1 + retry_count)
+                continue
+            
+            if response.status_code in [200, 201]:
+                lock_versions[wp_id] = response.json().get("lockVersion", lock_version + 1)
+                print(f"设置父子关系成功: {wp_id} -> {parent_id}")
+                return True
+            if response.status_code == 409:
+                # 记录的lockVersion已过期，下次重试前重新读取
+                lock_versions.pop(wp_id, None)
+                continue
+            print(f"设置父子关系失败: {wp_id} -> {parent_id}, 状态码: {response.status_code}, 返回: {response.text}")
+            return False
+        
+        print(f"设置父子关系失败，已重试 {max_retries} 次: {wp_id} -> {parent_id}")
+        return False
+
     def _create_work_package_relation(self, from_id, to_id, relation_type):
         """创建工作包之间的关系
         
@@ -12,6 +12,7 @@ import sys
 import argparse
 from api_client import api_client
 from config import config
+from project_snapshot import project_snapshots
 
 def log(message):
     """输出日志信息"""
@@ -39,40 +40,20 @@ def get_city_by_name(cities, city_name):
             return city
     return None
 
-def get_tasks_by_city(project_id, city):
-    """获取指定城市的任务列表，包括所有分页数据"""
+def get_tasks_by_city(project_id, city, force_refresh=False):
+    """获取指定城市的任务列表
+    
+    全部任务来自项目快照，处理多个城市时只下载一次
+    """
     log(f"正在获取城市 '{city['name']}' 的任务...")
     
     # 获取所有任务，然后在客户端筛选
-    all_tasks = []
     all_city_tasks = []
-    page = 1
-    page_size = 100  # 使用较大的页面大小
     city_id = city["id"]
     city_href = city.get("href", f"/api/v3/custom_options/{city_id}")
 
-    # 不使用过滤器获取所有任务
-    while True:
-        log(f"正在获取第 {page} 页数据...")
-        tasks = api_client.get_work_packages(project_id, filters=None, page=page, page_size=page_size)
-        
-        # 确保tasks是列表
-        if tasks is None:
-            tasks = []
-            
-        if not tasks:
-            log("没有更多任务")
-            break
-            
-        log(f"获取到 {len(tasks)} 个任务")
-        all_tasks.extend(tasks)
-        
-        # 如果获取的任务数量小于页面大小，说明已经是最后一页
-        if len(tasks) < page_size:
-            log("已到达最后一页")
-            break
-            
-        page += 1
+    snapshot = project_snapshots.get(project_id, force_refresh=force_refresh)
+    all_tasks = snapshot.work_packages
     
     log(f"总共获取到 {len(all_tasks)} 个任务")
     
@@ -277,7 +258,7 @@ def copy_tasks_to_cities(source_city_name="省厅", target_project_name=None, ta
     
     # 获取源城市的任务
     log(f"获取源城市 '{source_city_name}' 的所有任务...")
-    source_tasks = get_tasks_by_city(project_id, source_city)
+    source_tasks = get_tasks_by_city(project_id, source_city, force_refresh=True)
     if not source_tasks:
         log(f"源城市 '{source_city_name}' 下没有任务，任务终止")
         return False
@@ -431,6 +412,10 @@ def copy_tasks_to_cities(source_city_name="省厅", target_project_name=None, ta
         if not dry_run:
             time.sleep(2)
     
+    # 已创建的任务不在之前的快照中
+    if not dry_run:
+        project_snapshots.invalidate(project_id)
+    
     # 显示统计信息
     log("\n复制任务完成! 统计信息:")
     for city_name, stats in city_stats.items():
@@ -445,6 +430,19 @@ def copy_tasks_to_cities(source_city_name="省厅", target_project_name=None, ta
     log("任务复制完成")
     return True
 
+def copy_metadata_links(task_data, new_task_data):
+    """复制类型、状态和优先级链接，通过元数据注册表对应到当前实例中的元素"""
+    links = task_data.get("_links", {})
+    for key, index in (("type", api_client.metadata.types),
+                       ("status", api_client.metadata.statuses),
+                       ("priority", api_client.metadata.priorities)):
+        link = links.get(key)
+        if not isinstance(link, dict) or not link.get("href"):
+            continue
+        element = index.resolve(link)
+        # 注册表中找不到时保留原链接，由服务器决定是否接受
+        new_task_data["_links"][key] = index.link(element) if element is not None else link
+
 def create_task_for_city(project_id, task_data, city, dry_run=False, verbose=False):
     """为指定城市创建任务"""
     # 获取城市字段ID
@@ -468,13 +466,8 @@ def create_task_for_city(project_id, task_data, city, dry_run=False, verbose=Fal
     if "description" in task_data:
         new_task_data["description"] = task_data["description"]
     
-    # 复制类型
-    if "_links" in task_data and "type" in task_data["_links"]:
-        new_task_data["_links"]["type"] = task_data["_links"]["type"]
-    
-    # 复制状态
-    if "_links" in task_data and "status" in task_data["_links"]:
-        new_task_data["_links"]["status"] = task_data["_links"]["status"]
+    # 复制类型、状态和优先级
+    copy_metadata_links(task_data, new_task_data)
     
     # 创建任务
     log(f"正在为城市 '{city['name']}' 创建任务 '{task_data['subject']}'...")
@@ -522,13 +515,8 @@ def create_subtask_for_city(project_id, task_data, city, parent_id, dry_run=Fals
     if "description" in task_data:
         new_task_data["description"] = task_data["description"]
     
-    # 复制类型
-    if "_links" in task_data and "type" in task_data["_links"]:
-        new_task_data["_links"]["type"] = task_data["_links"]["type"]
-    
-    # 复制状态
-    if "_links" in task_data and "status" in task_data["_links"]:
-        new_task_data["_links"]["status"] = task_data["_links"]["status"]
+    # 复制类型、状态和优先级
+    copy_metadata_links(task_data, new_task_data)
     
     # 创建任务
     log(f"正在为城市 '{city['name']}' 创建子任务 '{task_data['subject']}'...")
@@ -0,0 +1,279 @@
+"""
+二进制导出格式模块
+文件由若干压缩块组成：文件头、项目信息块、工作包块（每块 BLOCK_SIZE 个工作包）和末尾块。
+工作包块按列存储：字段组合相同的工作包分为一组，每个字段的值保存为一列；
+_links 中重复出现的链接（状态、类型、项目、自定义字段选项等）在整个文件中只保存一次，列中只保存下标。
+按列编码和解码时大部分工作由内置函数完成，比逐个工作包处理快得多。
+安装了 zstandard 时使用zstd压缩，否则使用zlib
+"""
+
+import itertools
+import json
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"OPXB"
+FORMAT_VERSION = 1
+
+# 压缩方式
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+# 块类型
+_BLOCK_HEADER = b"H"
+_BLOCK_WORK_PACKAGES = b"W"
+_BLOCK_TRAILER = b"T"
+
+# 块类型(1字节) + 压缩后长度(4字节)
+_BLOCK_PREFIX = struct.Struct(">cI")
+
+# 每个工作包块包含的工作包数量
+BLOCK_SIZE = 1000
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def is_binary_export(path):
+    """根据文件头判断是否为二进制导出文件"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# 链接列的编码方式：链接表下标，或原样保存
+_COLUMN_INDEXED = "i"
+_COLUMN_RAW = "r"
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _rows(columns, count):
+    """把列转换为逐行的值元组，没有列时返回 count 个空元组"""
+    return zip(*columns) if columns else itertools.repeat((), count)
+
+
+class BinaryExportWriter:
+    """二进制导出文件写入器，接口与 export_writer.ExportWriter 相同
+
+    先写入临时文件，finish() 成功后才替换目标文件。
+
+    Args:
+        path: 导出文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._tmp_path = path + ".tmp"
+        if zstandard is not None:
+            self._codec = CODEC_ZSTD
+            self._compress = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+        else:
+            self._codec = CODEC_ZLIB
+            self._compress = lambda data: zlib.compress(data, ZLIB_LEVEL)
+        self._links = {}
+        self._written_links = 0
+        self._block = []
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(MAGIC + bytes([FORMAT_VERSION, self._codec]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _write_block(self, block_type, value):
+        data = self._compress(_dumps(value))
+        self._file.write(_BLOCK_PREFIX.pack(block_type, len(data)))
+        self._file.write(data)
+
+    def write_header(self, header):
+        self._write_block(_BLOCK_HEADER, dict(header, export_version=f"binary-{FORMAT_VERSION}"))
+
+    def write_work_package(self, wp):
+        self._block.append(wp)
+        self.count += 1
+        if len(self._block) >= BLOCK_SIZE:
+            self._flush()
+
+    def _encode_links(self, values):
+        """编码一列链接：重复较多且值可哈希时编码为链接表下标，否则原样保存
+
+        每个工作包各不相同的链接（self、activities 等）不放入链接表，避免链接表随工作包数量增长。
+        """
+        if all(type(value) is dict for value in values):
+            keys = list(map(tuple, map(dict.items, values)))
+            try:
+                repeated = len(set(keys)) * 2 <= len(keys)
+            except TypeError:
+                repeated = False
+            if repeated:
+                links = self._links
+                return [_COLUMN_INDEXED, [links.setdefault(key, len(links)) for key in keys]]
+        return [_COLUMN_RAW, values]
+
+    def _flush(self):
+        if not self._block:
+            return
+        block = self._block
+        shapes = {}
+        for position, wp in enumerate(block):
+            links = wp.get("_links")
+            has_links = type(links) is dict
+            fields = tuple(key for key in wp if key != "_links" or not has_links)
+            shapes.setdefault((fields, tuple(links) if has_links else None), []).append(position)
+
+        groups = []
+        for (fields, link_keys), positions in shapes.items():
+            wps = [block[position] for position in positions]
+            group = {
+                "positions": positions,
+                "fields": fields,
+                "columns": [[wp[key] for wp in wps] for key in fields],
+                "link_keys": link_keys,
+            }
+            if link_keys is not None:
+                group["link_columns"] = [self._encode_links([wp["_links"][key] for wp in wps]) for key in link_keys]
+            groups.append(group)
+
+        # 本块新增的链接随块写入，读取时按顺序追加到链接表
+        new_links = [dict(key) for key in itertools.islice(self._links, self._written_links, None)]
+        self._written_links = len(self._links)
+        self._write_block(_BLOCK_WORK_PACKAGES, {"count": len(block), "links": new_links, "groups": groups})
+        self._block = []
+
+    def finish(self, trailer=None):
+        """写入剩余的工作包和末尾字段，并替换目标文件"""
+        self._flush()
+        self._write_block(_BLOCK_TRAILER, dict(trailer or {}, work_package_count=self.count))
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+
+    def close(self):
+        """未完成时放弃写入，删除临时文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+
+class BinaryExportStream:
+    """二进制导出文件的流式读取器，接口与 import_stream.ExportStream 相同
+
+    打开时读取项目信息块保存在 header 中；iter_work_packages() 逐块解压并逐个返回工作包，
+    迭代结束后末尾块的字段保存在 trailer 中。内存中只保留当前块和链接表。
+
+    Args:
+        path: 导出文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = {}
+        self.trailer = {}
+        self.has_work_packages = True
+        self._links = []
+        self._file = open(path, 'rb')
+        try:
+            prefix = self._file.read(len(MAGIC) + 2)
+            if prefix[:len(MAGIC)] != MAGIC or len(prefix) < len(MAGIC) + 2:
+                raise ValueError(f"{path} 不是二进制导出文件")
+            version, codec = prefix[len(MAGIC)], prefix[len(MAGIC) + 1]
+            if version > FORMAT_VERSION:
+                raise ValueError(f"导出文件 {path} 的格式版本 {version} 高于当前支持的版本 {FORMAT_VERSION}，请升级后再导入")
+            if codec == CODEC_ZSTD:
+                if zstandard is None:
+                    raise ValueError(f"导出文件 {path} 使用zstd压缩，请先安装 zstandard: pip install zstandard")
+                self._decompress = zstandard.ZstdDecompressor().decompress
+            elif codec == CODEC_ZLIB:
+                self._decompress = zlib.decompress
+            else:
+                raise ValueError(f"导出文件 {path} 使用了未知的压缩方式 {codec}")
+
+            block_type, header = self._read_block()
+            if block_type != _BLOCK_HEADER:
+                raise ValueError(f"导出文件 {path} 格式错误: 缺少项目信息块")
+            self.header = header
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_block(self):
+        """读取下一个块，返回 (块类型, 内容)，文件结束时返回 (None, None)"""
+        prefix = self._file.read(_BLOCK_PREFIX.size)
+        if not prefix:
+            return None, None
+        if len(prefix) < _BLOCK_PREFIX.size:
+            raise ValueError(f"导出文件 {self.path} 意外结束")
+        block_type, length = _BLOCK_PREFIX.unpack(prefix)
+        data = self._file.read(length)
+        if len(data) < length:
+            raise ValueError(f"导出文件 {self.path} 意外结束")
+        return block_type, json.loads(self._decompress(data))
+
+    def project_data(self):
+        """返回导入用的项目数据：header 中的字段加上逐个读取工作包的迭代器"""
+        project_data = dict(self.header)
+        project_data["work_packages"] = self.iter_work_packages()
+        return project_data
+
+    def _decode_links(self, column):
+        # 每个工作包得到自己的链接字典，修改时不影响其他工作包
+        encoding, values = column
+        if encoding == _COLUMN_INDEXED:
+            return list(map(dict, map(self._links.__getitem__, values)))
+        return values
+
+    def iter_work_packages(self):
+        """逐个返回工作包，只能迭代一次"""
+        if not self.has_work_packages:
+            return
+        self.has_work_packages = False
+        while True:
+            block_type, block = self._read_block()
+            if block_type is None:
+                raise ValueError(f"导出文件 {self.path} 意外结束: 缺少末尾块")
+            if block_type == _BLOCK_TRAILER:
+                self.trailer.update(block)
+                return
+            if block_type != _BLOCK_WORK_PACKAGES:
+                continue
+            self._links.extend(block["links"])
+            wps = [None] * block["count"]
+            for group in block["groups"]:
+                positions = group["positions"]
+                fields = group["fields"]
+                rows = _rows(group["columns"], len(positions))
+                link_keys = group["link_keys"]
+                if link_keys is None:
+                    for position, values in zip(positions, rows):
+                        wps[position] = dict(zip(fields, values))
+                    continue
+                link_rows = _rows([self._decode_links(column) for column in group["link_columns"]], len(positions))
+                for position, values, links in zip(positions, rows, link_rows):
+                    wp = dict(zip(fields, values))
+                    wp["_links"] = dict(zip(link_keys, links))
+                    wps[position] = wp
+            yield from wps
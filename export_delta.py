@@ -0,0 +1,222 @@
+"""
+差异导出模块
+以上一次的导出文件为基准，只获取基准导出之后更新过的工作包，并与项目当前的工作包ID对比找出已删除的工作包，
+写入只包含新增/更新工作包和删除记录的差异文件；merge_exports() 把基准文件和按顺序排列的差异文件合并为完整的导出文件。
+差异文件也可以作为下一次差异导出的基准
+"""
+
+import calendar
+import os
+import time
+
+from api_client import api_client
+from export_writer import FORMAT_NDJSON_GZIP, build_export_header, open_writer
+from import_stream import open_export
+from project_snapshot import project_snapshots
+
+# 按更新时间过滤时向前多取的秒数，避免本机与服务器的时钟误差漏掉更新
+UPDATED_OVERLAP = 3600
+
+
+def _parse_time(value):
+    """解析 2024-01-01T00:00:00Z 形式的UTC时间，返回时间戳，无法解析时返回None"""
+    try:
+        return calendar.timegm(time.strptime(value[:19], "%Y-%m-%dT%H:%M:%S"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class Baseline:
+    """基准导出文件的摘要
+
+    完整导出文件需要读取全部工作包：属于本项目的计入 ids，被引用而补全的其他项目工作包计入 external_ids；
+    旧版导出文件没有导出时间时使用工作包中最晚的更新时间。差异文件直接使用末尾记录的合并后状态。
+
+    Attributes:
+        project_id: 项目ID
+        exported_at: 导出时间
+        ids: 导出时本项目的工作包ID集合
+        external_ids: 导出文件中其他项目的工作包ID集合
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open_export(path) as stream:
+            header = stream.header
+            self.project_id = header.get("project", {}).get("id")
+            self.exported_at = header.get("exported_at")
+            self.ids = set()
+            self.external_ids = set()
+            if header.get("delta") is not None:
+                for _ in stream.iter_work_packages():
+                    pass
+                state = stream.trailer.get("delta_state")
+                if state is None:
+                    raise ValueError(f"差异文件 {path} 不完整: 缺少末尾的工作包ID记录")
+                self.ids = set(state["ids"])
+                self.external_ids = set(state["external_ids"])
+                return
+
+            project_href = f"/api/v3/projects/{self.project_id}"
+            latest = ""
+            for wp in stream.iter_work_packages():
+                project_link = wp.get("_links", {}).get("project") or {}
+                if project_link.get("href") in (None, project_href):
+                    self.ids.add(wp["id"])
+                else:
+                    self.external_ids.add(wp["id"])
+                latest = max(latest, wp.get("updatedAt") or "")
+            if not self.exported_at:
+                self.exported_at = latest or None
+
+
+def export_project_delta(project_id, file_path, baseline_path, export_format=FORMAT_NDJSON_GZIP,
+                         progress_callback=None):
+    """以基准导出文件为基础导出项目的变化
+
+    差异文件开头与完整导出相同（项目信息、自定义字段等均为当前数据），另有 delta 字段记录基准；
+    工作包部分只包含基准导出之后更新过的工作包；末尾的 delta_state 记录删除的工作包ID和合并后的全部工作包ID。
+
+    Args:
+        project_id: 项目ID
+        file_path: 差异文件路径
+        baseline_path: 基准文件路径，可以是完整导出文件或上一次的差异文件
+        export_format: 导出格式，见 export_writer.EXPORT_FORMATS
+        progress_callback: 进度回调，参数为 (进度值0-100, 消息)
+
+    Returns:
+        (新增或更新的工作包数, 删除的工作包数)
+
+    Raises:
+        ValueError: 基准文件属于其他项目或无法确定基准导出时间时抛出
+        Exception: 无法获取项目详情、工作包或工作包ID时抛出
+    """
+    def report(percent, message):
+        if progress_callback:
+            progress_callback(percent, message)
+
+    report(2, f"正在读取基准文件 {baseline_path}...")
+    baseline = Baseline(baseline_path)
+    since_timestamp = _parse_time(baseline.exported_at)
+    if since_timestamp is None:
+        raise ValueError(f"基准文件 {baseline_path} 中没有导出时间，无法生成差异导出")
+
+    header = build_export_header(project_id, progress_callback)
+    if str(header["project"].get("id")) != str(baseline.project_id):
+        raise ValueError(f"基准文件 {baseline_path} 属于项目 {baseline.project_id}，不是项目 {header['project'].get('id')}")
+
+    since = _format_time(since_timestamp - UPDATED_OVERLAP)
+    filters = [{"updatedAt": {"operator": "<>d", "values": [since, ""]}}]
+    report(30, f"正在获取 {since} 之后更新的工作包...")
+    total, work_packages = project_snapshots.stream(
+        project_id, progress_callback=lambda message, percent: report(30 + percent // 2, message),
+        filters=filters, known_ids=baseline.ids | baseline.external_ids)
+    header["work_package_count"] = total
+    header["delta"] = {
+        "base_file": os.path.basename(baseline_path),
+        "base_exported_at": baseline.exported_at,
+        "updated_since": since,
+    }
+
+    with open_writer(file_path, export_format) as writer:
+        writer.write_header(header)
+        upserted = []
+        for wp in work_packages:
+            writer.write_work_package(wp)
+            upserted.append(wp["id"])
+
+        # 工作包写入之后再获取当前ID，期间新建的工作包在下一次差异导出中获取
+        report(85, "正在核对项目当前的工作包ID...")
+        current_ids = api_client.get_work_package_ids(project_id)
+        if current_ids is None:
+            raise Exception("无法获取项目当前的工作包ID")
+        deleted = sorted(baseline.ids - current_ids)
+        external_ids = (baseline.external_ids | set(upserted)) - current_ids
+        writer.finish({"delta_state": {
+            "deleted": deleted,
+            "ids": sorted(current_ids),
+            "external_ids": sorted(external_ids),
+        }})
+    report(100, f"差异导出完成: {len(upserted)} 个新增或更新的工作包，{len(deleted)} 个已删除")
+    return len(upserted), len(deleted)
+
+
+def _base_exported_at(path, header):
+    if header.get("exported_at"):
+        return header["exported_at"]
+    return Baseline(path).exported_at
+
+
+def merge_exports(base_path, delta_paths, output_path, export_format=FORMAT_NDJSON_GZIP, progress_callback=None):
+    """把完整导出文件和按时间顺序排列的差异文件合并为完整的导出文件
+
+    差异文件中的工作包全部读入内存，基准文件逐个读取，内存占用与差异大小相关。
+    合并结果的开头字段来自最后一个差异文件，可以作为下一次差异导出的基准。
+
+    Args:
+        base_path: 完整导出文件路径
+        delta_paths: 差异文件路径列表，每个差异文件的基准必须是前一个文件
+        output_path: 合并后的文件路径
+        export_format: 导出格式，见 export_writer.EXPORT_FORMATS
+        progress_callback: 进度回调，参数为 (进度值0-100, 消息)
+
+    Returns:
+        合并后的工作包数量
+
+    Raises:
+        ValueError: 文件不是完整导出/差异文件、属于不同项目或基准顺序不一致时抛出
+    """
+    def report(percent, message):
+        if progress_callback:
+            progress_callback(percent, message)
+
+    if not delta_paths:
+        raise ValueError("没有需要合并的差异文件")
+
+    with open_export(base_path) as base:
+        if base.header.get("delta") is not None:
+            raise ValueError(f"{base_path} 是差异文件，合并时第一个文件必须是完整导出文件")
+        project_id = base.header.get("project", {}).get("id")
+        previous_path, previous_exported_at = base_path, _base_exported_at(base_path, base.header)
+
+    upserts = {}
+    header = None
+    state = None
+    for index, path in enumerate(delta_paths):
+        report(index * 50 // len(delta_paths), f"正在读取差异文件 {path}...")
+        with open_export(path) as stream:
+            delta = stream.header.get("delta")
+            if delta is None:
+                raise ValueError(f"{path} 不是差异文件")
+            if str(stream.header.get("project", {}).get("id")) != str(project_id):
+                raise ValueError(f"差异文件 {path} 与 {base_path} 不属于同一个项目")
+            if delta.get("base_exported_at") != previous_exported_at:
+                raise ValueError(f"差异文件 {path} 不是基于 {previous_path} 生成的，请按导出顺序指定差异文件")
+            for wp in stream.iter_work_packages():
+                upserts[wp["id"]] = wp
+            state = stream.trailer.get("delta_state")
+            if state is None:
+                raise ValueError(f"差异文件 {path} 不完整: 缺少末尾的工作包ID记录")
+            header = dict(stream.header)
+            previous_path, previous_exported_at = path, header.get("exported_at")
+
+    keep = set(state["ids"]) | set(state["external_ids"])
+    del header["delta"]
+    header["work_package_count"] = len(keep)
+
+    report(50, f"正在合并 {base_path} 和 {len(delta_paths)} 个差异文件...")
+    with open_export(base_path) as base, open_writer(output_path, export_format) as writer:
+        writer.write_header(header)
+        for wp in base.iter_work_packages():
+            if wp["id"] in keep:
+                writer.write_work_package(upserts.pop(wp["id"], wp))
+        for wp_id, wp in upserts.items():
+            if wp_id in keep:
+                writer.write_work_package(wp)
+        writer.finish()
+    report(100, f"合并完成，共 {writer.count} 个工作包")
+    return writer.count
@@ -0,0 +1,216 @@
+"""
+项目导出写入模块
+边获取工作包边写入导出文件，内存占用与项目大小无关。
+默认使用每行一条记录的紧凑格式（可gzip压缩）：首行为项目信息、表单配置和自定义字段等，之后每行一个工作包，
+末行记录实际导出的工作包数量；二进制格式见 export_binary；兼容格式仍为旧版本可以读取的JSON对象
+"""
+
+import gzip
+import json
+import os
+import time
+
+from api_client import api_client
+from export_binary import BinaryExportWriter
+from import_stream import HEADER_TYPE, TRAILER_TYPE
+from project_snapshot import project_snapshots
+
+# 导出格式
+FORMAT_NDJSON_GZIP = "ndjson.gz"
+FORMAT_NDJSON = "ndjson"
+FORMAT_BINARY = "binary"
+FORMAT_JSON = "json"
+EXPORT_FORMATS = {
+    FORMAT_NDJSON_GZIP: "紧凑格式（gzip压缩）",
+    FORMAT_NDJSON: "紧凑格式（不压缩）",
+    FORMAT_BINARY: "二进制格式（最小、读写最快，本工具专用）",
+    FORMAT_JSON: "兼容格式（JSON，旧版本可读取）",
+}
+
+# 各格式写入文件的 export_version
+_EXPORT_VERSIONS = {FORMAT_NDJSON_GZIP: "2.0", FORMAT_NDJSON: "2.0", FORMAT_JSON: "1.0"}
+
+# gzip压缩级别，默认的9级压缩率提高很少但慢得多
+GZIP_LEVEL = 6
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class ExportWriter:
+    """导出文件写入器
+
+    先写入临时文件，finish() 成功后才替换目标文件，导出失败时不会留下不完整的文件。
+
+    Args:
+        path: 导出文件路径
+        export_format: 导出格式，见 EXPORT_FORMATS
+    """
+
+    def __init__(self, path, export_format=FORMAT_NDJSON_GZIP):
+        if export_format not in _EXPORT_VERSIONS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+        self.path = path
+        self.export_format = export_format
+        self.count = 0
+        self._header_keys = set()
+        self._tmp_path = path + ".tmp"
+        if export_format == FORMAT_NDJSON_GZIP:
+            self._file = gzip.open(self._tmp_path, 'wt', encoding='utf-8', compresslevel=GZIP_LEVEL)
+        else:
+            self._file = open(self._tmp_path, 'w', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def write_header(self, header):
+        """写入工作包之前的顶层字段"""
+        header = dict(header, export_version=_EXPORT_VERSIONS[self.export_format])
+        self._header_keys = set(header)
+        if self.export_format == FORMAT_JSON:
+            self._file.write("{\n")
+            for key, value in header.items():
+                self._file.write(f"{_dumps(key)}: {_dumps(value)},\n")
+            self._file.write('"work_packages": [\n')
+        else:
+            self._file.write(_dumps(dict({"_type": HEADER_TYPE}, **header)) + "\n")
+
+    def write_work_package(self, wp):
+        if self.export_format == FORMAT_JSON:
+            if self.count:
+                self._file.write(",\n")
+            self._file.write(_dumps(wp))
+        else:
+            self._file.write(_dumps(wp) + "\n")
+        self.count += 1
+
+    def finish(self, trailer=None):
+        """写入末尾字段并替换目标文件
+
+        Args:
+            trailer: 工作包之后的顶层字段，work_package_count 自动写入实际数量；
+                兼容格式中已经在开头写入的字段不再重复写入
+        """
+        trailer = dict(trailer or {}, work_package_count=self.count)
+        if self.export_format == FORMAT_JSON:
+            self._file.write("\n]")
+            for key, value in trailer.items():
+                if key not in self._header_keys:
+                    self._file.write(f",\n{_dumps(key)}: {_dumps(value)}")
+            self._file.write("\n}\n")
+        else:
+            self._file.write(_dumps(dict({"_type": TRAILER_TYPE}, **trailer)) + "\n")
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+
+    def close(self):
+        """未完成时放弃写入，删除临时文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+
+def open_writer(path, export_format=FORMAT_NDJSON_GZIP):
+    """按导出格式创建写入器"""
+    if export_format == FORMAT_BINARY:
+        return BinaryExportWriter(path)
+    return ExportWriter(path, export_format)
+
+
+def build_export_header(project_id, progress_callback=None):
+    """获取导出文件开头的字段：项目详情、表单配置、自定义字段及选项、状态、类型和导出时间
+
+    Args:
+        project_id: 项目ID
+        progress_callback: 进度回调，参数为 (进度值0-100, 消息)
+
+    Raises:
+        Exception: 无法获取项目详情时抛出
+    """
+    def report(percent, message):
+        if progress_callback:
+            progress_callback(percent, message)
+
+    report(5, "正在获取项目基本信息...")
+    project_details = api_client.get_project_details(project_id)
+    if not project_details:
+        raise Exception("无法获取项目详情")
+
+    report(10, f"正在导出项目: {project_details.get('name', 'Unknown')}...")
+
+    # 获取项目表单配置（包含更详细的自定义字段信息）
+    report(12, "正在获取项目表单配置...")
+    project_form_config = api_client.get_project_form_configuration(project_id)
+
+    report(15, "正在获取自定义字段...")
+    custom_fields = api_client.get_custom_fields() or []
+
+    report(17, "正在获取自定义字段选项...")
+    custom_field_options = {}
+    for field in custom_fields:
+        field_id = field.get("id")
+        if field_id:
+            options = api_client.get_custom_field_options(field_id)
+            if options:
+                custom_field_options[field_id] = options
+
+    report(20, "正在获取状态和类型数据...")
+    return {
+        "project": project_details,
+        # 导出来源，导入到同一实例时可以直接由服务器复制项目
+        "source": {"api_url": api_client.api_url},
+        "project_form_config": project_form_config,
+        "custom_fields": custom_fields,
+        "custom_field_options": custom_field_options,
+        "statuses": api_client.get_statuses() or [],
+        "types": api_client.get_types() or [],
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def export_project(project_id, file_path, export_format=FORMAT_NDJSON_GZIP, include_work_packages=True,
+                   progress_callback=None):
+    """导出项目到文件
+
+    Args:
+        project_id: 项目ID
+        file_path: 导出文件路径
+        export_format: 导出格式，见 EXPORT_FORMATS
+        include_work_packages: 是否导出工作包
+        progress_callback: 进度回调，参数为 (进度值0-100, 消息)
+
+    Returns:
+        导出的工作包数量
+
+    Raises:
+        Exception: 无法获取项目详情或工作包时抛出
+    """
+    def report(percent, message):
+        if progress_callback:
+            progress_callback(percent, message)
+
+    header = build_export_header(project_id, progress_callback)
+
+    total, work_packages = 0, iter(())
+    if include_work_packages:
+        report(30, "正在获取工作包数据...")
+        total, work_packages = project_snapshots.stream(
+            project_id, progress_callback=lambda message, percent: report(30 + percent * 6 // 10, message))
+    # 开头的工作包数量为列表接口返回的总数，导入时用于显示进度；实际数量写在末尾
+    header["work_package_count"] = total
+
+    with open_writer(file_path, export_format) as writer:
+        writer.write_header(header)
+        for wp in work_packages:
+            writer.write_work_package(wp)
+        report(95, f"正在写入文件，共 {writer.count} 个工作包...")
+        writer.finish()
+    report(100, "导出完成")
+    return writer.count
@@ -0,0 +1,168 @@
+"""
+导入日志模块
+项目导入过程中把新项目ID、工作包的新旧ID映射和已完成的关系逐条追加到磁盘上的日志文件，
+导入中断后可以根据日志继续导入，跳过已经完成的工作
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+# 日志文件的默认后缀，与导入文件放在同一目录
+JOURNAL_SUFFIX = ".journal"
+
+
+def default_journal_path(file_path):
+    """导入文件对应的默认日志路径"""
+    return file_path + JOURNAL_SUFFIX
+
+
+def source_fingerprint(project_data):
+    """导出数据的指纹，用于确认日志属于同一份导出文件
+
+    只使用工作包数组之前的字段（原项目的ID、标识符和更新时间，导出的工作包数量，以及有导出时间时的导出时间），
+    流式读取导出文件时在读取工作包之前即可计算。
+    """
+    project_info = project_data.get("project", {})
+    identity = [project_info.get("id"), project_info.get("identifier", ""), project_info.get("updatedAt", ""),
+                project_data.get("work_package_count")]
+    if "exported_at" in project_data:
+        identity.append(project_data["exported_at"])
+    return hashlib.sha1(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ImportJournal:
+    """项目导入日志
+
+    每行一条JSON记录，只追加、不修改：
+        {"type": "project", "project_id", "source", "name", "time"}  新项目创建成功
+        {"type": "wp", "old", "new", "lock"}                          工作包创建成功
+        {"type": "relation", "key"}                                    关系创建或父任务设置成功
+        {"type": "done", "time"}                                       导入全部完成
+    每条记录写入后立即flush，工作包创建和每个关系阶段结束时fsync；进程意外退出时最后一行可能不完整，读取时丢弃并从文件中截断。
+    请求已成功但记录尚未写入时中断的工作包在继续导入时会被再次创建。
+
+    Args:
+        path: 日志文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.project_id = None
+        self.source = None
+        self.id_mapping = {}
+        self.lock_versions = {}
+        self.relations_done = set()
+        self.completed = False
+        self._file = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """读取已有的日志，返回是否包含已创建的项目"""
+        self.project_id = None
+        self.source = None
+        self.id_mapping = {}
+        self.lock_versions = {}
+        self.relations_done = set()
+        self.completed = False
+        if not self.exists():
+            return False
+
+        skipped = 0
+        torn = 0        # 末尾没有换行的不完整记录的字节数
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    if not line.endswith(b"\n"):
+                        torn = len(line)
+                    continue
+                record_type = record.get("type")
+                if record_type == "project":
+                    self.project_id = record.get("project_id")
+                    self.source = record.get("source")
+                elif record_type == "wp":
+                    self.id_mapping[str(record["old"])] = str(record["new"])
+                    if record.get("lock") is not None:
+                        self.lock_versions[str(record["new"])] = record["lock"]
+                elif record_type == "relation":
+                    self.relations_done.add(record["key"])
+                elif record_type == "done":
+                    self.completed = True
+        if skipped:
+            print(f"导入日志 {self.path} 中有 {skipped} 行不完整的记录，已忽略")
+        if torn:
+            # 截断末尾不完整的记录，否则继续导入时追加的第一条记录会接在它后面而无法读取
+            os.truncate(self.path, os.path.getsize(self.path) - torn)
+        elif not self._ends_with_newline():
+            # 最后一条记录完整但换行符未写入
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("\n")
+        return self.project_id is not None
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def reset(self):
+        """删除已有的日志，重新开始记录"""
+        self.close()
+        if self.exists():
+            os.remove(self.path)
+        self.load()
+
+    def _append(self, record, sync=False):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def sync(self):
+        """把已写入的记录同步到磁盘"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def record_project(self, project_id, source, name):
+        self.project_id = project_id
+        self.source = source
+        self._append({"type": "project", "project_id": project_id, "source": source,
+                      "name": name, "time": time.time()}, sync=True)
+
+    def record_work_package(self, old_id, new_id, lock_version=None):
+        self.id_mapping[str(old_id)] = str(new_id)
+        if lock_version is not None:
+            self.lock_versions[str(new_id)] = lock_version
+        self._append({"type": "wp", "old": str(old_id), "new": str(new_id), "lock": lock_version})
+
+    def record_relation(self, key):
+        self.relations_done.add(key)
+        self._append({"type": "relation", "key": key})
+
+    def record_done(self):
+        self.completed = True
+        self._append({"type": "done", "time": time.time()}, sync=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
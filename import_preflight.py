@@ -0,0 +1,195 @@
+"""
+导入预检模块
+创建工作包之前一次性获取目标项目的可用类型和各类型的工作包表单结构（schema），
+在本地检查并修正每个工作包的创建数据：类型和状态是否可用、自定义字段及其选项是否存在、必填字段是否填写，
+无法修正的工作包不发送创建请求，所有问题汇总后一并报告
+"""
+
+import concurrent.futures
+import json
+import re
+import threading
+from collections import Counter
+
+# 从 /api/v3/work_packages/schemas/12-3 中解析类型ID
+_SCHEMA_TYPE_ID = re.compile(r"-(\d+)/?$")
+_HREF_ID = re.compile(r"/(\d+)/?$")
+
+# 问题级别：修正后仍可创建的，和无法创建的
+FIXED = "修正"
+REJECTED = "错误"
+
+
+def _link_href(link):
+    return link.get("href") if isinstance(link, dict) else None
+
+
+def _allowed_links(field_schema):
+    """schema字段中直接给出的可选值 {href: 标题}，只给出集合链接时返回None"""
+    embedded = field_schema.get("_embedded", {}).get("allowedValues")
+    if isinstance(embedded, list):
+        allowed = {}
+        for value in embedded:
+            self_link = value.get("_links", {}).get("self", {})
+            if self_link.get("href"):
+                allowed[self_link["href"]] = self_link.get("title") or value.get("value") or value.get("name", "")
+        return allowed
+    links = field_schema.get("_links", {}).get("allowedValues")
+    if isinstance(links, list):
+        return {link["href"]: link.get("title", "") for link in links if isinstance(link, dict) and link.get("href")}
+    return None
+
+
+class ImportPreflight:
+    """导入预检
+
+    schema 按类型缓存；check() 可以在多个线程中并发调用，每个工作包的问题只记录最后一次检查的结果。
+
+    Args:
+        project_id: 目标项目ID
+        types: 目标项目可用的类型列表
+        schemas: 类型ID字符串 -> 工作包schema
+        options: 自定义字段键 -> {选项href: 标题}
+    """
+
+    def __init__(self, project_id, types=(), schemas=None, options=None):
+        self.project_id = project_id
+        self.types = {}
+        for wp_type in types:
+            href = _link_href(wp_type.get("_links", {}).get("self")) or f"/api/v3/types/{wp_type.get('id')}"
+            self.types[href] = wp_type
+        self.default_type = next((t for t in types if t.get("isDefault")), types[0] if types else None)
+        self.schemas = schemas or {}
+        self.options = options or {}
+        self.problems = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, client, project_id):
+        """获取目标项目的类型、schema和自定义字段选项，无法获取的部分不做检查
+
+        Args:
+            client: OpenProjectClient 实例
+            project_id: 目标项目ID
+        """
+        types = client._get_collection(f"projects/{project_id}/types") or []
+        schemas = {}
+        if types:
+            schema_ids = [f"{project_id}-{wp_type['id']}" for wp_type in types]
+            filters = json.dumps([{"id": {"operator": "=", "values": schema_ids}}])
+            for schema in client._get_collection("work_packages/schemas", {"filters": filters}) or []:
+                match = _SCHEMA_TYPE_ID.search(_link_href(schema.get("_links", {}).get("self")) or "")
+                if match:
+                    schemas[match.group(1)] = schema
+
+        # 可选值只给出集合链接的自定义字段并发获取选项，同一字段在多个类型中只获取一次
+        options = {}
+        pending = {}
+        for schema in schemas.values():
+            for key, field_schema in schema.items():
+                if not key.startswith("customField") or not isinstance(field_schema, dict) or key in options:
+                    continue
+                allowed = _allowed_links(field_schema)
+                if allowed is not None:
+                    options[key] = allowed
+                else:
+                    href = _link_href(field_schema.get("_links", {}).get("allowedValues"))
+                    if href and "/api/v3/" in href:
+                        pending[key] = href.split("/api/v3/", 1)[1]
+        pending = {key: path for key, path in pending.items() if key not in options}
+        if pending:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(pending), client._connection_pool_size)) as executor:
+                futures = {key: executor.submit(client._get_collection, path) for key, path in pending.items()}
+            for key, future in futures.items():
+                values = future.result()
+                if values is not None:
+                    options[key] = _allowed_links({"_embedded": {"allowedValues": values}})
+
+        print(f"预检: 目标项目 {project_id} 有 {len(types)} 个类型、{len(schemas)} 个表单结构、"
+              f"{len(options)} 个自定义字段的选项")
+        return cls(project_id, types, schemas, options)
+
+    def check(self, wp_id, payload):
+        """检查并修正一个工作包的创建数据
+
+        Args:
+            wp_id: 工作包原ID，用于汇总问题
+            payload: 创建请求数据，会被直接修改
+
+        Returns:
+            修正后的创建数据，无法创建时返回None
+        """
+        problems = []
+        links = payload.setdefault("_links", {})
+
+        # 类型：目标项目未启用时改为默认类型，未设置时由服务器使用默认类型
+        type_href = _link_href(links.get("type"))
+        default_href = f"/api/v3/types/{self.default_type.get('id')}" if self.default_type is not None else None
+        if type_href and self.types and type_href not in self.types and default_href:
+            problems.append((FIXED, f"类型 {type_href} 在目标项目中不可用，改为 {self.default_type.get('name', default_href)}"))
+            links["type"] = {"href": default_href}
+            type_href = default_href
+        match = _HREF_ID.search(type_href or default_href or "")
+        schema = self.schemas.get(match.group(1)) if match else None
+
+        if schema is not None:
+            # 状态：schema给出可选值时检查，不可用时使用服务器默认状态
+            status_href = _link_href(links.get("status"))
+            allowed_statuses = _allowed_links(schema.get("status", {})) if isinstance(schema.get("status"), dict) else None
+            if status_href and allowed_statuses is not None and status_href not in allowed_statuses:
+                problems.append((FIXED, f"状态 {status_href} 不可用，使用默认状态"))
+                del links["status"]
+
+            # 自定义字段：字段不存在时去掉，选项不存在时按标题对应，仍找不到时去掉
+            for key in [key for key in links if key.startswith("customField")]:
+                link = links[key]
+                if key not in schema:
+                    problems.append((FIXED, f"自定义字段 {key} 不在目标项目中，已忽略"))
+                    del links[key]
+                    continue
+                allowed = self.options.get(key)
+                href = _link_href(link)
+                if allowed is None or not href or href in allowed:
+                    continue
+                title = link.get("title") if isinstance(link, dict) else None
+                matched = next((option_href for option_href, option_title in allowed.items()
+                                if title and option_title == title), None)
+                if matched:
+                    problems.append((FIXED, f"自定义字段 {key} 的选项 {title} 按名称对应到 {matched}"))
+                    links[key] = {"href": matched}
+                else:
+                    problems.append((FIXED, f"自定义字段 {key} 的选项 {title or href} 不存在，已忽略"))
+                    del links[key]
+
+            # 必填字段：没有默认值且未填写时无法创建
+            for key, field_schema in schema.items():
+                if key.startswith("_") or not isinstance(field_schema, dict):
+                    continue
+                if not field_schema.get("required") or field_schema.get("hasDefault") or not field_schema.get("writable", True):
+                    continue
+                if key not in payload and key not in links:
+                    problems.append((REJECTED, f"缺少必填字段 {field_schema.get('name', key)}"))
+
+        with self._lock:
+            if problems:
+                self.problems[str(wp_id)] = problems
+            else:
+                self.problems.pop(str(wp_id), None)
+        if any(level == REJECTED for level, _ in problems):
+            return None
+        return payload
+
+    def summary(self, limit=20):
+        """汇总问题，相同的问题合并计数
+
+        Returns:
+            (修正的工作包数, 无法创建的工作包数, 报告文本行)
+        """
+        with self._lock:
+            problems = dict(self.problems)
+        rejected = sum(1 for items in problems.values() if any(level == REJECTED for level, _ in items))
+        counter = Counter(item for items in problems.values() for item in items)
+        lines = [f"[{level}] {message} ×{count}" for (level, message), count in counter.most_common(limit)]
+        if len(counter) > limit:
+            lines.append(f"... 另有 {len(counter) - limit} 种问题")
+        return len(problems) - rejected, rejected, lines
@@ -0,0 +1,203 @@
+"""
+导出文件流式读取模块
+按顺序解析导出文件的顶层字段，work_packages 数组逐个元素解析返回，
+导入几百MB的导出文件时不必把整个文件读入内存，读到第一个工作包即可开始创建。
+同时支持每行一条记录的紧凑格式，文件经过gzip压缩时自动解压；二进制格式由 open_export() 交给 export_binary 读取
+"""
+
+import gzip
+import json
+
+from export_binary import BinaryExportStream, is_binary_export
+
+# 每次从文件读取的字符数
+CHUNK_SIZE = 1 << 20
+
+# 紧凑格式中首行和末行记录的类型标记
+HEADER_TYPE = "ExportHeader"
+TRAILER_TYPE = "ExportTrailer"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+_WHITESPACE = " \t\r\n"
+
+
+class ExportStream:
+    """导出文件的流式读取器
+
+    打开时解析 work_packages 之前的顶层字段（项目信息、自定义字段等）保存在 header 中；
+    iter_work_packages() 逐个返回工作包，迭代结束后 work_packages 之后的顶层字段保存在 trailer 中。
+    单个工作包仍由标准库json整体解析，缓冲区中只保留尚未解析的数据。
+    紧凑格式的首行（_type 为 ExportHeader）即 header，之后每行一个工作包，末行（_type 为 ExportTrailer）为 trailer。
+
+    Args:
+        path: 导出文件路径
+        chunk_size: 每次读取的字符数
+    """
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.header = {}
+        self.trailer = {}
+        self.has_work_packages = False
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._lines = False
+        with open(path, 'rb') as f:
+            compressed = f.read(2) == _GZIP_MAGIC
+        if compressed:
+            self._file = gzip.open(path, 'rt', encoding='utf-8')
+        else:
+            self._file = open(path, 'r', encoding='utf-8')
+        try:
+            self._expect('{')
+            self.has_work_packages = self._read_fields(self.header)
+            if self.header.get("_type") == HEADER_TYPE:
+                del self.header["_type"]
+                self._lines = True
+                self.has_work_packages = True
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def project_data(self):
+        """返回导入用的项目数据：header 中的字段加上逐个读取工作包的迭代器"""
+        project_data = dict(self.header)
+        project_data["work_packages"] = self.iter_work_packages()
+        return project_data
+
+    def iter_work_packages(self):
+        """逐个返回 work_packages 数组中的工作包，只能迭代一次"""
+        if not self.has_work_packages:
+            return
+        self.has_work_packages = False
+        if self._lines:
+            yield from self._iter_lines()
+            return
+        while True:
+            char = self._peek()
+            if char == ']':
+                self._pos += 1
+                break
+            if char == ',':
+                self._pos += 1
+                continue
+            if not char:
+                raise ValueError(f"导出文件 {self.path} 在工作包数组中意外结束")
+            yield self._value()
+        self._read_fields(self.trailer)
+
+    def _iter_lines(self):
+        """紧凑格式：逐行返回工作包，遇到末行记录时保存到 trailer"""
+        while self._peek():
+            value = self._value()
+            if isinstance(value, dict) and value.get("_type") == TRAILER_TYPE:
+                self.trailer.update((key, item) for key, item in value.items() if key != "_type")
+                continue
+            yield value
+
+    def _fill(self):
+        """从文件读取更多数据，丢弃已解析的部分，返回是否读到了新数据"""
+        if self._eof or self._file is None:
+            return False
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """跳过空白，返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"导出文件 {self.path} 格式错误: 应为 '{char}'，实际为 '{found or '文件结束'}'")
+        self._pos += 1
+
+    def _value(self):
+        """解析下一个完整的JSON值，缓冲区中的数据不完整时继续读取"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # 位于缓冲区末尾的数字可能只读到了一部分
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _read_fields(self, target):
+        """读取顶层字段直到 work_packages 数组或对象结束，返回是否停在 work_packages 数组开头"""
+        while True:
+            char = self._peek()
+            if char == '}':
+                self._pos += 1
+                return False
+            if char == ',':
+                self._pos += 1
+                continue
+            if not char:
+                raise ValueError(f"导出文件 {self.path} 意外结束")
+            key = self._value()
+            self._expect(':')
+            if key == "work_packages" and self._peek() == '[':
+                self._pos += 1
+                return True
+            target[key] = self._value()
+
+
+def open_export(path):
+    """按文件内容选择读取器打开导出文件，返回的读取器都提供 header、trailer、project_data() 和 iter_work_packages()"""
+    if is_binary_export(path):
+        return BinaryExportStream(path)
+    return ExportStream(path)
+
+
+def read_export_metadata(path, keys=None):
+    """读取导出文件中工作包以外的顶层字段
+
+    Args:
+        path: 导出文件路径
+        keys: 需要的字段，全部出现在工作包数组之前时不再读取工作包；为None时读取全部字段
+
+    Returns:
+        dict: 顶层字段，另外包含 work_package_count（只在读取了工作包数组或文件中有该字段时存在）
+    """
+    with open_export(path) as stream:
+        metadata = dict(stream.header)
+        if keys is not None and all(key in metadata for key in keys):
+            return metadata
+        count = 0
+        for _ in stream.iter_work_packages():
+            count += 1
+        metadata.update(stream.trailer)
+        metadata.setdefault("work_package_count", count)
+        return metadata
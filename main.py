@@ -117,37 +117,146 @@ def print_usage():
     print("  - 命令行模式: python main.py [选项]")
     print("\n选项:")
     print("  --report         启动报表服务器")
+    print("  --report-build   生成静态报表文件后退出（配合 --interval 按计划持续生成）")
+    print("  --output DIR     静态报表目录，默认为 report_artifacts；导出和合并时为目标文件")
+    print("  --interval 秒    静态报表生成间隔，与 --report 一起使用时在服务器后台生成")
+    print("  --projects ID    只为指定的项目ID或标识符生成静态报表，可指定多个")
+    print("  --import FILE    导入项目文件后退出，导入进度记录在 FILE.journal")
+    print("  --name 名称      导入后的新项目名称")
+    print("  --resume         根据导入日志继续上次中断的导入")
+    print("  --journal PATH   导入日志路径，默认为导入文件路径加 .journal")
+    print("  --force-relations 导入时强制处理存在循环的父子关系")
+    print("  --no-server-copy 导出文件来自当前服务器时也按文件逐个创建，不使用服务器端复制")
+    print("  --export ID      导出项目到 --output 指定的文件后退出")
+    print("  --format 格式    导出格式: ndjson.gz（默认）、ndjson、binary、json")
+    print("  --baseline FILE  差异导出：只导出基准文件之后的变化，基准可以是完整导出或上一次的差异文件")
+    print("  --merge FILE...  把完整导出文件和按顺序排列的差异文件合并为完整导出文件，写入 --output")
     print("  --help           显示此帮助信息")
     print("\n如需完整GUI功能，请安装PyQt5:")
     print("  - Ubuntu/Debian: sudo apt-get install python3-pyqt5 libgl1-mesa-glx")
     print("  - CentOS/RHEL: sudo yum install python3-qt5 mesa-libGL")
     print("  - 或使用pip: pip install PyQt5")
 
+def run_import(file_path, project_name=None, resume=False, journal_path=None, force_relations=False, server_copy=True):
+    """命令行导入项目文件，返回新项目ID"""
+    from import_journal import default_journal_path
+    from import_stream import open_export
+    
+    def progress_callback(stage, current, total, message):
+        print(f"[{stage}] {message}")
+    
+    import_options = {
+        "progress_callback": progress_callback,
+        "force_relations": force_relations,
+        "journal_path": journal_path or default_journal_path(file_path),
+        "resume": resume,
+        "server_copy": server_copy
+    }
+    # 流式读取导出文件，工作包边读取边创建
+    with open_export(file_path) as stream:
+        new_project_id = api_client.import_project(stream.project_data(), project_name, import_options)
+    if new_project_id:
+        print(f"项目导入成功，ID: {new_project_id}")
+    else:
+        print(f"项目导入失败，可以使用 --resume 根据 {import_options['journal_path']} 继续导入")
+    return new_project_id
+
+def run_export(project_id, output, export_format, baseline=None):
+    """命令行导出项目，指定基准文件时只导出变化，返回是否成功"""
+    from export_delta import export_project_delta
+    from export_writer import export_project
+    
+    def progress_callback(percent, message):
+        print(f"[{percent}%] {message}")
+    
+    try:
+        if baseline:
+            export_project_delta(project_id, output, baseline, export_format, progress_callback)
+        else:
+            export_project(project_id, output, export_format, progress_callback=progress_callback)
+    except Exception as e:
+        print(f"导出失败: {str(e)}")
+        return False
+    print(f"项目已导出到 {output}")
+    return True
+
+def run_merge(paths, output, export_format):
+    """命令行合并完整导出文件和差异文件，返回是否成功"""
+    from export_delta import merge_exports
+    
+    def progress_callback(percent, message):
+        print(f"[{percent}%] {message}")
+    
+    try:
+        merge_exports(paths[0], paths[1:], output, export_format, progress_callback)
+    except Exception as e:
+        print(f"合并失败: {str(e)}")
+        return False
+    print(f"已合并到 {output}")
+    return True
+
 def main():
     """主函数"""
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='OpenProject同步工具')
     parser.add_argument('--report', action='store_true', help='启动报表服务器')
     parser.add_argument('--gui', action='store_true', help='启动GUI界面')
+    parser.add_argument('--report-build', action='store_true', help='生成静态报表文件（无界面模式）')
+    parser.add_argument('--output', default=None, help='静态报表目录')
+    parser.add_argument('--interval', type=int, default=0, help='静态报表生成间隔（秒），0表示只生成一次')
+    parser.add_argument('--projects', nargs='*', default=None, help='生成静态报表的项目ID或标识符')
+    parser.add_argument('--import', dest='import_file', default=None, help='导入项目文件（无界面模式）')
+    parser.add_argument('--name', default=None, help='导入后的新项目名称')
+    parser.add_argument('--resume', action='store_true', help='根据导入日志继续上次中断的导入')
+    parser.add_argument('--journal', default=None, help='导入日志路径')
+    parser.add_argument('--force-relations', action='store_true', help='导入时强制处理存在循环的父子关系')
+    parser.add_argument('--no-server-copy', action='store_true', help='不使用服务器端项目复制')
+    parser.add_argument('--export', dest='export_project', default=None, metavar='ID', help='导出项目（无界面模式）')
+    parser.add_argument('--format', dest='export_format', default='ndjson.gz',
+                        choices=['ndjson.gz', 'ndjson', 'binary', 'json'], help='导出格式')
+    parser.add_argument('--baseline', default=None, help='差异导出的基准文件')
+    parser.add_argument('--merge', nargs='+', default=None, metavar='FILE', help='合并完整导出文件和差异文件')
     
     args = parser.parse_args()
+    mode_selected = args.report or args.gui or args.report_build or args.import_file or args.export_project or args.merge
     
     # 如果没有指定参数且支持GUI，则默认启动GUI
-    if not any(vars(args).values()) and _HAS_PYQT:
+    if not mode_selected and _HAS_PYQT:
         args.gui = True
     
     # 如果没有指定参数且不支持GUI，则打印帮助
-    if not any(vars(args).values()) and not _HAS_PYQT:
+    if not mode_selected and not _HAS_PYQT:
         print("错误: 无法导入PyQt5，不能启动GUI模式。")
         print("请安装PyQt5或使用命令行模式。")
         print_usage()
         return
     
     # 根据参数执行相应功能
-    if args.report:
+    if args.import_file:
+        new_project_id = run_import(args.import_file, args.name, args.resume, args.journal, args.force_relations,
+                                    not args.no_server_copy)
+        sys.exit(0 if new_project_id else 1)
+    elif args.export_project or args.merge:
+        if not args.output:
+            print("错误: 导出和合并需要使用 --output 指定目标文件")
+            sys.exit(1)
+        if args.merge:
+            if len(args.merge) < 2:
+                print("错误: --merge 需要一个完整导出文件和至少一个差异文件")
+                sys.exit(1)
+            succeeded = run_merge(args.merge, args.output, args.export_format)
+        else:
+            succeeded = run_export(args.export_project, args.output, args.export_format, args.baseline)
+        sys.exit(0 if succeeded else 1)
+    elif args.report_build:
+        # 无界面生成静态报表，供报表服务器或其他Web服务器直接发送
+        import report_server
+        report_server.run_report_builder(args.output or report_server.ARTIFACT_DIR, args.interval, args.projects)
+    elif args.report:
         # 启动报表服务器
         import report_server
-        report_server.start_server()
+        report_server.start_server(artifact_dir=args.output or report_server.ARTIFACT_DIR,
+                                   build_interval=args.interval, project_ids=args.projects)
     elif args.gui:
         if not _HAS_PYQT:
             print("错误: 无法导入PyQt5，不能启动GUI模式。")
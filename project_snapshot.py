@@ -0,0 +1,364 @@
+"""
+项目快照模块
+统一获取项目的全部工作包（分页并发获取 → 补全被引用的父/子任务 → 补全缺少状态的工作包），
+结果保存为不可变、带版本号的快照，在同一进程内由界面、导出、报表和复制工具共享
+"""
+
+import concurrent.futures
+import math
+import threading
+import time
+from collections import deque
+from types import MappingProxyType
+
+from api_client import api_client
+
+# 单页请求的工作包数量，服务器限制更小的页面大小时按实际返回数量分页
+PAGE_SIZE = 1000
+
+
+def _id_from_href(href):
+    """从 /api/v3/work_packages/123 形式的链接中解析ID"""
+    if not href:
+        return None
+    try:
+        return int(href.rstrip("/").split("/")[-1])
+    except (ValueError, IndexError):
+        return None
+
+
+def referenced_ids(work_packages):
+    """收集工作包的父任务和子任务链接中引用的ID"""
+    ids = set()
+    for wp in work_packages:
+        links = wp.get("_links", {})
+        children = links.get("children")
+        if isinstance(children, list):
+            for child in children:
+                if isinstance(child, dict):
+                    child_id = _id_from_href(child.get("href"))
+                    if child_id is not None:
+                        ids.add(child_id)
+        parent = links.get("parent")
+        if isinstance(parent, dict):
+            parent_id = _id_from_href(parent.get("href"))
+            if parent_id is not None:
+                ids.add(parent_id)
+    return ids
+
+
+def has_complete_status(wp):
+    """状态链接同时包含title和href时视为完整"""
+    status_link = wp.get("_links", {}).get("status")
+    return isinstance(status_link, dict) and "title" in status_link and "href" in status_link
+
+
+class ProjectSnapshot:
+    """项目工作包的不可变快照
+
+    work_packages 为元组，by_id 为只读映射；其中的工作包字典由所有使用者共享，只能读取，不能修改。
+
+    Attributes:
+        project_id: 项目ID
+        version: 快照版本号，同一进程内单调递增
+        created_at: 快照生成时间（time.time()）
+        listed_total: 项目工作包列表接口返回的总数（不含额外补全的引用任务）
+        work_packages: 工作包元组
+        by_id: 工作包ID到工作包的只读映射
+    """
+
+    def __init__(self, project_id, version, work_packages, listed_total):
+        self.project_id = project_id
+        self.version = version
+        self.created_at = time.time()
+        self.listed_total = listed_total
+        self.work_packages = tuple(work_packages)
+        self.by_id = MappingProxyType({wp["id"]: wp for wp in self.work_packages})
+
+    def __len__(self):
+        return len(self.work_packages)
+
+    def age(self):
+        """快照生成至今的秒数"""
+        return time.time() - self.created_at
+
+
+class _Loading:
+    """正在进行的加载，同一项目的其他请求等待它完成"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+        # 已获取的分页，供需要在加载完成前先显示结果的调用方读取
+        self.pages = []
+        self.listed_total = 0
+
+
+class ProjectSnapshotService:
+    """项目快照服务
+
+    同一项目在TTL内重复请求直接返回已有快照；多个线程同时请求时只有一个线程实际下载（single-flight），
+    其他线程等待并共享同一结果。
+
+    Args:
+        ttl: 快照有效期（秒）
+        max_workers: 分页和补全请求的并发线程数
+    """
+
+    def __init__(self, ttl=60, max_workers=10):
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._snapshots = {}
+        self._loading = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self, project_id, force_refresh=False, progress_callback=None):
+        """获取项目快照
+
+        Args:
+            project_id: 项目ID
+            force_refresh: 忽略未过期的快照重新下载；已有下载正在进行时仍然等待它的结果
+            progress_callback: 进度回调，参数为 (消息, 加载阶段内的百分比0-100)，只有实际执行下载的调用方会收到详细进度
+
+        Returns:
+            ProjectSnapshot
+
+        Raises:
+            Exception: 无法获取工作包时抛出
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(project_id)
+            if snapshot is not None and not force_refresh and snapshot.age() < self.ttl:
+                print(f"使用项目 {project_id} 的快照 v{snapshot.version}（{snapshot.age():.0f}秒前生成）")
+                return snapshot
+
+            loading = self._loading.get(project_id)
+            leader = loading is None
+            if leader:
+                loading = _Loading()
+                self._loading[project_id] = loading
+
+        if not leader:
+            if progress_callback:
+                progress_callback("等待正在进行的工作包加载...", 0)
+            loading.done.wait()
+            if loading.error is not None:
+                raise loading.error
+            return loading.snapshot
+
+        try:
+            snapshot = self._load(project_id, progress_callback, loading)
+            with self._lock:
+                self._snapshots[project_id] = snapshot
+            loading.snapshot = snapshot
+            return snapshot
+        except Exception as e:
+            loading.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._loading[project_id]
+            loading.done.set()
+
+    def peek(self, project_id):
+        """返回已缓存的快照（不论是否过期），没有时返回None"""
+        with self._lock:
+            return self._snapshots.get(project_id)
+
+    def partial(self, project_id):
+        """返回正在加载的项目已获取到的工作包
+
+        Returns:
+            (工作包列表, 列表接口返回的总数)，没有正在进行的加载时返回None
+        """
+        with self._lock:
+            loading = self._loading.get(project_id)
+        if loading is None:
+            return None
+        pages = list(loading.pages)
+        by_id = {}
+        for elements in pages:
+            for wp in elements:
+                by_id[wp["id"]] = wp
+        return list(by_id.values()), loading.listed_total
+
+    def stream(self, project_id, progress_callback=None, filters=None, known_ids=()):
+        """逐页获取项目的工作包并逐个返回，不生成快照，内存占用与项目大小无关
+
+        有未过期的快照且没有过滤条件时直接返回快照中的工作包。否则获取第一页后返回，其余分页最多 max_workers 页同时获取，
+        按页码顺序逐个返回；每页中缺少状态信息的工作包先补全详情，所有分页返回后再补全被引用但不在列表中的父/子任务。
+        重复出现的工作包只返回第一次获取的。
+
+        Args:
+            project_id: 项目ID
+            progress_callback: 进度回调，参数为 (消息, 加载阶段内的百分比0-100)
+            filters: OpenProject过滤条件列表，为None时获取全部工作包
+            known_ids: 调用方已有的工作包ID，被引用时不再补全
+
+        Returns:
+            (列表接口返回的总数, 工作包迭代器)
+
+        Raises:
+            Exception: 无法获取第一页工作包时抛出，其余分页失败时由迭代器抛出
+        """
+        snapshot = self.peek(project_id) if filters is None else None
+        if snapshot is not None and snapshot.age() < self.ttl:
+            print(f"使用项目 {project_id} 的快照 v{snapshot.version}（{snapshot.age():.0f}秒前生成）")
+            return len(snapshot), iter(snapshot.work_packages)
+
+        first_page, total = api_client.get_work_packages_page(project_id, page=1, page_size=PAGE_SIZE, filters=filters)
+        if first_page is None:
+            raise Exception("无法从API获取工作包数据")
+        return total, self._stream_pages(project_id, first_page, total, progress_callback, filters, known_ids)
+
+    def _stream_pages(self, project_id, first_page, total, progress_callback=None, filters=None, known_ids=()):
+        def report(message, percent):
+            print(message)
+            if progress_callback:
+                progress_callback(message, percent)
+
+        seen = set()
+        referenced = set()
+        page_size = len(first_page)
+        pages = math.ceil(total / page_size) if page_size else 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            next_page = 2
+            elements = first_page
+            page = 1
+            while True:
+                # 处理当前页时保持后续分页在后台获取，已获取未返回的分页不超过 max_workers 页
+                while next_page <= pages and len(pending) < self.max_workers:
+                    pending.append(executor.submit(api_client.get_work_packages_page, project_id, next_page, page_size,
+                                                   filters))
+                    next_page += 1
+
+                without_status = [wp["id"] for wp in elements if wp["id"] not in seen and not has_complete_status(wp)]
+                details = self._fetch_details(executor, without_status) if without_status else {}
+                for wp in elements:
+                    if wp["id"] in seen:
+                        continue
+                    seen.add(wp["id"])
+                    wp = details.get(wp["id"], wp)
+                    referenced.update(referenced_ids([wp]))
+                    yield wp
+                if page % 10 == 0 or page == pages:
+                    report(f"已获取 {page}/{pages} 页工作包", page * 80 // pages)
+
+                if not pending:
+                    break
+                elements, _ = pending.popleft().result()
+                if elements is None:
+                    raise Exception("分页获取工作包失败")
+                page += 1
+
+            # 补全被引用但不在列表中的父任务和子任务
+            missing_ids = referenced - seen - set(known_ids)
+            if missing_ids:
+                report(f"正在获取 {len(missing_ids)} 个被引用的工作包...", 90)
+                for wp_id, wp in self._fetch_details(executor, missing_ids).items():
+                    seen.add(wp_id)
+                    yield wp
+        report(f"项目 {project_id} 共获取 {len(seen)} 个工作包", 100)
+
+    def invalidate(self, project_id=None):
+        """使指定项目（或全部项目）的快照失效，写操作后调用
+
+        创建、修改、删除工作包和导入项目之后调用；项目ID为整数或字符串时都能对应到同一个快照。
+        """
+        with self._lock:
+            if project_id is None:
+                self._snapshots.clear()
+            else:
+                for key in [key for key in self._snapshots if str(key) == str(project_id)]:
+                    del self._snapshots[key]
+
+    def _fetch_details(self, executor, ids):
+        """并发获取多个工作包详情，返回 {ID: 工作包}，失败的ID不包含在结果中"""
+        results = {}
+        future_to_id = {executor.submit(api_client.get_work_package, wp_id): wp_id for wp_id in ids}
+        for future in concurrent.futures.as_completed(future_to_id):
+            wp_id = future_to_id[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"获取工作包 {wp_id} 详情时出错: {str(e)}")
+                continue
+            if data:
+                results[wp_id] = data
+        return results
+
+    def _load(self, project_id, progress_callback=None, loading=None):
+        def report(message, percent):
+            print(message)
+            if progress_callback:
+                progress_callback(message, percent)
+
+        start_time = time.time()
+        report("获取工作包数据...", 0)
+        first_page, total = api_client.get_work_packages_page(project_id, page=1, page_size=PAGE_SIZE)
+        if first_page is None:
+            raise Exception("无法从API获取工作包数据")
+
+        # 用字典合并，重复的工作包以后获取的为准
+        by_id = {wp["id"]: wp for wp in first_page}
+        listed_total = total
+        if loading is not None:
+            loading.listed_total = total
+            loading.pages.append(first_page)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 服务器可能限制页面大小，按第一页实际返回的数量计算剩余页数并并发获取
+            page_size = len(first_page)
+            if page_size and total > page_size:
+                pages = math.ceil(total / page_size)
+                report(f"项目包含 {total} 个工作包，并发获取剩余 {pages - 1} 页...", 20)
+                futures = [executor.submit(api_client.get_work_packages_page, project_id, page, page_size)
+                           for page in range(2, pages + 1)]
+                if loading is not None:
+                    # 每页完成后立即公开，partial 不必等待前面较慢的分页
+                    def publish(future):
+                        if future.exception() is None and future.result()[0]:
+                            loading.pages.append(future.result()[0])
+
+                    for future in futures:
+                        future.add_done_callback(publish)
+                for future in futures:
+                    elements, _ = future.result()
+                    if elements is None:
+                        raise Exception("分页获取工作包失败")
+                    for wp in elements:
+                        by_id[wp["id"]] = wp
+            report(f"获取到 {len(by_id)} 个工作包", 40)
+
+            # 补全被引用但不在列表中的父任务和子任务
+            missing_ids = referenced_ids(by_id.values()) - by_id.keys()
+            if missing_ids:
+                report(f"正在获取 {len(missing_ids)} 个被引用的工作包...", 60)
+                by_id.update(self._fetch_details(executor, missing_ids))
+
+            # 补全缺少状态信息的工作包
+            without_status = [wp_id for wp_id, wp in by_id.items() if not has_complete_status(wp)]
+            if without_status:
+                report(f"正在获取 {len(without_status)} 个缺少状态信息的工作包...", 80)
+                by_id.update(self._fetch_details(executor, without_status))
+
+        if not by_id:
+            print(f"警告：项目 {project_id} 没有任何工作包")
+
+        still_missing = sum(1 for wp in by_id.values() if not has_complete_status(wp))
+        if still_missing:
+            print(f"警告: 仍有 {still_missing} 个工作包缺少状态信息")
+
+        with self._lock:
+            self._version += 1
+            version = self._version
+        snapshot = ProjectSnapshot(project_id, version, by_id.values(), listed_total)
+        report(f"项目 {project_id} 快照 v{version}: {len(snapshot)} 个工作包，耗时 {time.time() - start_time:.1f}秒", 100)
+        return snapshot
+
+
+# 全局项目快照服务实例
+project_snapshots = ProjectSnapshotService()
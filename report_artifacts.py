@@ -0,0 +1,158 @@
+"""
+报表静态文件模块
+按计划把各项目的报表HTML和JSON写入目录，每个文件先写入临时文件再原子替换，
+报表服务器直接从磁盘发送这些文件，查看者的请求不再访问OpenProject
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+
+from report_http import gzip_bytes
+
+# 默认的静态文件目录
+ARTIFACT_DIR = "report_artifacts"
+# 各项目的清单文件，记录快照哈希和生成时间，内容没有变化时不重写文件
+MANIFEST_FILE = "manifest.json"
+# 所有项目的索引文件
+INDEX_FILE = "index.json"
+# 大于该字节数的文件同时写入gzip压缩版本
+GZIP_MIN_SIZE = 1024
+
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_\-][A-Za-z0-9_.\-]*$')
+
+
+def project_key(project):
+    """项目的目录名，优先使用项目标识符"""
+    key = str(project.get("identifier") or project.get("id", ""))
+    key = re.sub(r'[^A-Za-z0-9_.\-]', '_', key).lstrip('.')
+    return key or "project"
+
+
+def write_atomic(path, data):
+    """写入临时文件后原子替换目标文件，读取方只会看到完整的旧文件或新文件"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def file_etag(stat_result, encoding=""):
+    """根据修改时间和大小生成强ETag，未重写的文件在多次构建之间保持不变"""
+    suffix = f"-{encoding}" if encoding else ""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}{suffix}"'
+
+
+class ArtifactStore:
+    """报表静态文件目录
+
+    目录结构:
+        index.json                所有项目的索引
+        <项目>/manifest.json      快照哈希、生成时间和文件列表
+        <项目>/<文件>[.gz]        报表文件及其gzip版本
+
+    Args:
+        directory: 静态文件目录
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR):
+        self.directory = directory
+
+    def project_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def read_manifest(self, key):
+        """读取项目清单，不存在或无法解析时返回None"""
+        path = os.path.join(self.project_dir(key), MANIFEST_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, key, snapshot_hash):
+        """项目的静态文件是否已经是指定快照"""
+        manifest = self.read_manifest(key)
+        if not manifest or manifest.get("snapshot_hash") != snapshot_hash:
+            return False
+        return all(os.path.isfile(os.path.join(self.project_dir(key), name))
+                   for name in manifest.get("files", {}))
+
+    def publish(self, key, project, report_data, files):
+        """写入项目的报表文件，最后写入清单
+
+        Args:
+            key: 项目目录名
+            project: 项目数据
+            report_data: 带有快照哈希和生成时间的报表数据
+            files: 文件名到文件内容（bytes）的字典
+
+        Returns:
+            dict: 写入的清单
+        """
+        directory = self.project_dir(key)
+        listed = {}
+        for name, data in files.items():
+            path = os.path.join(directory, name)
+            write_atomic(path, data)
+            listed[name] = {"size": len(data)}
+            if len(data) > GZIP_MIN_SIZE:
+                compressed = gzip_bytes(data, level=9)
+                write_atomic(path + ".gz", compressed)
+                listed[name]["gzip_size"] = len(compressed)
+            elif os.path.exists(path + ".gz"):
+                os.remove(path + ".gz")
+
+        manifest = {
+            "project": {"id": project.get("id"), "name": project.get("name", ""), "key": key},
+            "snapshot_hash": report_data.get("snapshot_hash", ""),
+            "snapshot_time": report_data.get("snapshot_time", time.time()),
+            "generated_at": report_data.get("generated_at", ""),
+            "files": listed,
+        }
+        write_atomic(os.path.join(directory, MANIFEST_FILE),
+                     json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+        return manifest
+
+    def write_index(self, manifests):
+        """写入所有项目的索引"""
+        index = {
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "projects": [{
+                "id": manifest["project"]["id"],
+                "name": manifest["project"]["name"],
+                "key": manifest["project"]["key"],
+                "generated_at": manifest["generated_at"],
+                "snapshot_hash": manifest["snapshot_hash"],
+                "files": [f"{manifest['project']['key']}/{name}" for name in manifest["files"]],
+            } for manifest in manifests],
+        }
+        write_atomic(os.path.join(self.directory, INDEX_FILE),
+                     json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    def resolve(self, relative_path):
+        """把请求路径解析为目录内的文件路径
+
+        只接受由安全字符组成的路径段，临时文件和目录外的路径返回None。
+        """
+        parts = [part for part in relative_path.split('/') if part]
+        if not parts or any(not _SAFE_NAME.match(part) for part in parts):
+            return None
+        path = os.path.join(self.directory, *parts)
+        root = os.path.realpath(self.directory)
+        if not os.path.realpath(path).startswith(root + os.sep):
+            return None
+        return path if os.path.isfile(path) else None
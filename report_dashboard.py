@@ -0,0 +1,244 @@
+"""
+全省汇总看板模块
+为每个项目并发生成完成情况摘要：工作包通过项目快照服务在线程中获取，
+状态矩阵构建和汇总在独立进程中计算；每个项目的摘要单独缓存，
+看板页面在较慢的项目完成前先显示已完成项目的结果
+"""
+
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from api_client import api_client
+from project_snapshot import project_snapshots
+from report_artifacts import project_key
+from report_matrix import (CityIndex, StatusMatrix, STATUS_ABSENT, STATUS_COMPLETED, STATUS_LABELS,
+                           build_tasks_tree)
+
+# 摘要中的统计项，与报表城市统计一致
+SUMMARY_LABELS = STATUS_LABELS + ["总计"]
+
+# 工作进程的启动方式：报表服务器是多线程的，fork 出的子进程可能继承其他线程持有的锁（requests连接池、print、快照服务）
+# 而永久挂起，因此不使用 fork；forkserver 不可用（Windows）时使用 spawn。summarize_project 必须保持为模块级函数
+_PROCESS_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# 项目摘要状态
+SUMMARY_PENDING = "pending"
+SUMMARY_READY = "ready"
+SUMMARY_ERROR = "error"
+
+
+def _trim_work_package(wp, city_field_key):
+    """只保留计算摘要需要的字段，减少传给工作进程的数据量"""
+    links = wp.get("_links", {})
+    return {
+        "id": wp["id"],
+        "_links": {
+            "status": links.get("status"),
+            "parent": links.get("parent"),
+            city_field_key: links.get(city_field_key),
+        },
+    }
+
+
+def summarize_project(project, cities, work_packages, city_field_key):
+    """计算单个项目的完成情况摘要，在工作进程中执行
+
+    Args:
+        project: {"id", "name", "key"}
+        cities: 城市列表
+        work_packages: 精简后的工作包列表
+        city_field_key: 城市自定义字段在 _links 中的键
+
+    Returns:
+        dict: 项目摘要，包含各城市的状态统计和顶级任务完成数
+    """
+    start_time = time.perf_counter()
+    city_index = CityIndex(cities, city_field_key)
+    tasks_tree, child_tasks = build_tasks_tree(work_packages)
+    matrix = StatusMatrix.build(work_packages, city_index, tasks_tree)
+    counts = matrix.status_counts()
+
+    # 顶级任务按汇总后的状态统计，反映整项工作的完成情况
+    top_rows = [matrix.row_of[task_id] for task_id in matrix.task_ids if task_id not in child_tasks]
+    # 汇总状态会填满所有城市列，是否属于该城市以任务自身的状态为准
+    top_present = matrix.raw[top_rows] != STATUS_ABSENT
+    top_total = top_present.sum(axis=0)
+    top_done = (top_present & (matrix.codes[top_rows] == STATUS_COMPLETED)).sum(axis=0)
+
+    city_summaries = []
+    for col, city_name in enumerate(matrix.city_names):
+        city_counts = {label: int(counts[code, col]) for code, label in enumerate(SUMMARY_LABELS)}
+        if not city_counts["总计"]:
+            continue
+        city_summaries.append({
+            "name": city_name,
+            "counts": city_counts,
+            "top_level_done": int(top_done[col]),
+            "top_level_total": int(top_total[col]),
+        })
+
+    totals = {label: int(counts[code].sum()) for code, label in enumerate(SUMMARY_LABELS)}
+    return {
+        "project": project,
+        "work_packages": len(work_packages),
+        "totals": totals,
+        "cities": city_summaries,
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "compute_seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def merge_summaries(summaries):
+    """合并多个项目摘要的统计数字和城市统计"""
+    totals = {label: 0 for label in SUMMARY_LABELS}
+    cities = {}
+    for summary in summaries:
+        for label in SUMMARY_LABELS:
+            totals[label] += summary["totals"].get(label, 0)
+        for city in summary["cities"]:
+            merged = cities.setdefault(city["name"], {label: 0 for label in SUMMARY_LABELS})
+            for label in SUMMARY_LABELS:
+                merged[label] += city["counts"].get(label, 0)
+    return totals, [{"name": name, "counts": counts} for name, counts in cities.items()]
+
+
+class DashboardService:
+    """全省汇总看板服务
+
+    refresh 只提交过期项目的摘要任务并立即返回，snapshot 返回当前已有的结果，
+    没有完成的项目标记为加载中，过期但正在重新计算的项目继续显示旧摘要。
+
+    Args:
+        summary_ttl: 项目摘要有效期（秒）
+        max_processes: 计算摘要的进程数，默认为CPU核心数
+        fetch_workers: 同时获取工作包的项目数
+    """
+
+    def __init__(self, summary_ttl=300, max_processes=None, fetch_workers=4):
+        self.summary_ttl = summary_ttl
+        self.max_processes = max_processes
+        self._entries = {}
+        self._projects = []
+        self._lock = threading.Lock()
+        self._fetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers,
+                                                                 thread_name_prefix="dashboard")
+        self._process_pool = None
+
+    def _get_process_pool(self):
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_processes, mp_context=multiprocessing.get_context(_PROCESS_START_METHOD))
+            return self._process_pool
+
+    def _reset_process_pool(self, pool):
+        with self._lock:
+            if self._process_pool is pool:
+                self._process_pool = None
+        pool.shutdown(wait=False)
+
+    def refresh(self, force=False):
+        """为没有摘要或摘要过期的项目提交计算任务
+
+        Args:
+            force: 忽略有效期重新计算全部项目
+
+        Returns:
+            int: 本次提交的项目数量
+        """
+        projects = api_client.get_projects()
+        if not projects:
+            return 0
+
+        submitted = 0
+        now = time.time()
+        with self._lock:
+            self._projects = projects
+            for project in projects:
+                project_id = project.get("id")
+                entry = self._entries.get(project_id)
+                if entry is not None:
+                    if entry["state"] == SUMMARY_PENDING:
+                        continue
+                    if not force and now - entry["finished_at"] < self.summary_ttl:
+                        continue
+                    entry["state"] = SUMMARY_PENDING
+                else:
+                    entry = {"state": SUMMARY_PENDING, "summary": None, "error": None, "finished_at": 0}
+                    self._entries[project_id] = entry
+                entry["started_at"] = now
+                self._fetch_pool.submit(self._build, project, entry)
+                submitted += 1
+        if submitted:
+            print(f"看板: 开始计算 {submitted} 个项目的摘要")
+        return submitted
+
+    def _build(self, project, entry):
+        project_id = project.get("id")
+        try:
+            snapshot = project_snapshots.get(project_id)
+            cities = api_client.get_cities() or []
+            city_field_key = f"customField{api_client.get_city_field_id()}"
+            payload = [_trim_work_package(wp, city_field_key) for wp in snapshot.work_packages]
+            project_info = {"id": project_id, "name": project.get("name", ""), "key": project_key(project)}
+
+            pool = self._get_process_pool()
+            try:
+                summary = pool.submit(summarize_project, project_info, cities, payload, city_field_key).result()
+            except (BrokenProcessPool, OSError) as e:
+                # 无法创建工作进程时（例如受限环境）在当前线程中计算
+                print(f"看板: 进程池不可用（{str(e)}），在线程中计算项目 {project_id} 的摘要")
+                self._reset_process_pool(pool)
+                summary = summarize_project(project_info, cities, payload, city_field_key)
+
+            with self._lock:
+                entry.update(state=SUMMARY_READY, summary=summary, error=None, finished_at=time.time())
+            print(f"看板: 项目 {project.get('name')} 摘要完成，"
+                  f"{summary['work_packages']} 个工作包，计算 {summary['compute_seconds']}秒")
+        except Exception as e:
+            print(f"看板: 计算项目 {project.get('name')} 的摘要时出错: {str(e)}")
+            with self._lock:
+                entry.update(state=SUMMARY_ERROR, error=str(e), finished_at=time.time())
+
+    def snapshot(self):
+        """返回当前的看板数据
+
+        Returns:
+            dict: projects 为每个项目的状态和摘要，totals/cities 为已完成项目的合并结果，
+                  complete 表示所有项目都已有结果
+        """
+        with self._lock:
+            projects = list(self._projects)
+            entries = {project_id: dict(entry) for project_id, entry in self._entries.items()}
+
+        items = []
+        summaries = []
+        for project in projects:
+            entry = entries.get(project.get("id"), {"state": SUMMARY_PENDING, "summary": None, "error": None})
+            if entry["summary"] is not None:
+                summaries.append(entry["summary"])
+            items.append({
+                "id": project.get("id"),
+                "name": project.get("name", ""),
+                "key": project_key(project),
+                "state": entry["state"],
+                "error": entry["error"],
+                "summary": entry["summary"],
+            })
+
+        totals, cities = merge_summaries(summaries)
+        return {
+            "labels": SUMMARY_LABELS,
+            "projects": items,
+            "totals": totals,
+            "cities": cities,
+            "ready": len(summaries),
+            "complete": all(item["state"] != SUMMARY_PENDING for item in items),
+        }
+
+
+# 全局看板服务实例
+dashboard_service = DashboardService()
@@ -0,0 +1,223 @@
+"""
+报表增量计算模块
+在两次刷新之间保留工作包、城市索引和状态矩阵，
+刷新时只获取上次构建后更新过的工作包并修补受影响的单元格、城市统计和父任务汇总
+"""
+
+import threading
+import time
+
+from api_client import api_client
+from project_snapshot import project_snapshots
+from report_matrix import CityIndex, STATUS_ABSENT, STATUS_LABELS, parse_parent_id, status_code_for_task
+
+# 单次增量刷新最多处理的变化数量，超过时直接完整重建
+MAX_INCREMENTAL_CHANGES = 500
+
+
+class ReportEngine:
+    """保存最近一次报表构建的状态，支持增量刷新
+
+    refresh 返回None表示无法增量更新（删除了工作包、变化过多或请求失败），
+    调用方应重新获取全部工作包并调用 load 重置状态。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.project = None
+        self.cities = None
+        self.city_index = None
+        self.work_packages = {}
+        self.listed_total = 0
+        self.last_updated_at = None
+        self.report_data = None
+        self.status_matrix = None
+
+    def has_state(self, project_id):
+        """是否保存了指定项目的构建状态"""
+        return self.project is not None and self.project.get("id") == project_id
+
+    def load(self, project, cities, work_packages, report_data, status_matrix, listed_total=None):
+        """保存完整构建的结果，作为之后增量刷新的基准
+
+        Args:
+            project: 项目数据
+            cities: 城市列表
+            work_packages: 构建报表使用的全部工作包
+            report_data: build_report_data 生成的报表数据
+            status_matrix: 对应的状态矩阵
+            listed_total: 项目工作包列表接口返回的总数，默认取项目快照记录的总数
+        """
+        with self._lock:
+            self.project = project
+            self.cities = cities
+            self.city_index = CityIndex(cities, f"customField{api_client.get_city_field_id()}")
+            self.work_packages = {wp["id"]: wp for wp in work_packages}
+            if listed_total is None:
+                snapshot = project_snapshots.peek(project.get("id"))
+                listed_total = snapshot.listed_total if snapshot is not None else len(work_packages)
+            self.listed_total = listed_total
+            self.last_updated_at = max((wp.get("updatedAt", "") for wp in work_packages), default="") or None
+            self.report_data = report_data
+            self.status_matrix = status_matrix
+
+    def fetch_changes(self):
+        """获取上次构建后更新过的工作包
+
+        Returns:
+            (变化的工作包列表, 项目工作包总数)，请求失败或变化过多时返回None
+        """
+        project_id = self.project.get("id")
+        filters = [{"updatedAt": {"operator": "<>d", "values": [self.last_updated_at, ""]}}]
+        changed, changed_total = api_client.get_work_packages_page(
+            project_id, page=1, page_size=MAX_INCREMENTAL_CHANGES, filters=filters)
+        if changed is None:
+            return None
+        if changed_total > len(changed):
+            print(f"增量刷新: 变化的工作包超过 {MAX_INCREMENTAL_CHANGES} 个，需要完整重建")
+            return None
+
+        # 只取总数，用于发现被删除或移出项目的工作包
+        elements, total = api_client.get_work_packages_page(project_id, page=1, page_size=1)
+        if elements is None:
+            return None
+        return changed, total
+
+    def _is_unchanged(self, old, new):
+        return (old.get("lockVersion") == new.get("lockVersion")
+                and old.get("updatedAt") == new.get("updatedAt"))
+
+    def _is_structural(self, old, new):
+        """标题、父任务或城市变化会影响任务树和表格列，需要重新构建"""
+        if old.get("subject") != new.get("subject"):
+            return True
+        if parse_parent_id(old) != parse_parent_id(new):
+            return True
+        return self.city_index.columns_for_task(old) != self.city_index.columns_for_task(new)
+
+    def refresh(self, handler):
+        """增量刷新报表
+
+        Args:
+            handler: 提供 build_report_data 和 build_task_tree 的报表请求处理器
+
+        Returns:
+            (报表数据, 状态矩阵)，需要完整重建时返回None
+        """
+        with self._lock:
+            if self.project is None or not self.last_updated_at:
+                return None
+
+            start_time = time.perf_counter()
+            result = self.fetch_changes()
+            if result is None:
+                return None
+            changed, total = result
+            fetch_time = time.perf_counter() - start_time
+
+            changes = {}
+            structural = False
+            for wp in changed:
+                old = self.work_packages.get(wp["id"])
+                if old is not None and self._is_unchanged(old, wp):
+                    continue
+                status_link = wp.get("_links", {}).get("status")
+                if not (isinstance(status_link, dict) and "title" in status_link):
+                    detailed = api_client.get_work_package(wp["id"])
+                    if detailed:
+                        wp = detailed
+                if old is None or self._is_structural(old, wp):
+                    structural = True
+                changes[wp["id"]] = wp
+
+            new_ids = sum(1 for wp_id in changes if wp_id not in self.work_packages)
+            if total != self.listed_total + new_ids:
+                print(f"增量刷新: 工作包总数 {total} 与预期 {self.listed_total + new_ids} 不一致，需要完整重建")
+                return None
+
+            if changes:
+                self.last_updated_at = max([self.last_updated_at] + [wp.get("updatedAt", "") for wp in changes.values()])
+            if not changes:
+                print(f"增量刷新: 没有变化 (请求 {fetch_time * 1000:.0f}ms)")
+                return self.report_data, self.status_matrix
+
+            merged = dict(self.work_packages)
+            merged.update(changes)
+
+            if structural:
+                # 任务树或城市归属变化，用本地数据重新构建，不需要重新获取全部工作包
+                report_data, status_matrix = handler.build_report_data(self.project, self.cities, list(merged.values()))
+                mode = "本地重建"
+            else:
+                report_data, status_matrix = self._patch(handler, merged, changes)
+                mode = "单元格修补"
+
+            self.work_packages = merged
+            self.listed_total = total
+            self.report_data = report_data
+            self.status_matrix = status_matrix
+
+            compute_time = time.perf_counter() - start_time - fetch_time
+            print(f"增量刷新: {len(changes)} 个工作包变化，{mode}，"
+                  f"请求 {fetch_time * 1000:.0f}ms，计算 {compute_time * 1000:.1f}ms")
+            return report_data, status_matrix
+
+    def _patch(self, handler, merged, changes):
+        """只修补状态变化的单元格、城市统计、父任务汇总和受影响城市的任务列表"""
+        old_data = self.report_data
+        matrix = self.status_matrix.copy()
+        city_statistics = {name: dict(stats) for name, stats in old_data["city_statistics"].items()}
+
+        changed_rows = []
+        affected_cities = set()
+        for wp_id, wp in changes.items():
+            cols = self.city_index.columns_for_task(wp)
+            changed_rows.append(matrix.row_of[wp_id])
+            if not cols:
+                continue
+            code = status_code_for_task(wp)
+            old_codes = matrix.update_task(wp_id, cols, code)
+            for col, old_code in zip(cols, old_codes.tolist()):
+                stats = city_statistics.setdefault(matrix.city_names[col], {})
+                if old_code != STATUS_ABSENT:
+                    stats[STATUS_LABELS[old_code]] = stats.get(STATUS_LABELS[old_code], 0) - 1
+                else:
+                    stats["总计"] = stats.get("总计", 0) + 1
+                stats[STATUS_LABELS[code]] = stats.get(STATUS_LABELS[code], 0) + 1
+                affected_cities.add(self.cities[col]["name"])
+
+        tasks_status = dict(old_data["tasks_status"])
+        for row in matrix.rollup_rows(changed_rows):
+            entry = matrix.task_status_entry(row)
+            if entry:
+                tasks_status[matrix.task_ids[row]] = entry
+            else:
+                tasks_status.pop(matrix.task_ids[row], None)
+
+        tasks_by_city = dict(old_data["tasks_by_city"])
+        for city_name in affected_cities:
+            tasks_by_city[city_name] = [changes.get(task["id"], task) for task in tasks_by_city[city_name]]
+
+        report_data = dict(old_data)
+        report_data.update({
+            "tasks_by_city": tasks_by_city,
+            "tasks_status": tasks_status,
+            "city_statistics": city_statistics,
+        })
+
+        # 模板任务树中带有状态和描述，省厅任务变化时重新生成
+        if "省厅" in affected_cities:
+            tasks_tree = old_data["tasks_tree"]
+            child_tasks = {child_id for children in tasks_tree.values() for child_id in children}
+            report_data["template_tasks"] = [
+                handler.build_task_tree(task, tasks_tree, merged)
+                for task in tasks_by_city["省厅"] if task["id"] not in child_tasks
+            ]
+
+        for key in ("snapshot_hash", "snapshot_time", "generated_at"):
+            report_data.pop(key, None)
+        return report_data, matrix
+
+
+# 全局报表引擎实例
+report_engine = ReportEngine()
@@ -0,0 +1,262 @@
+"""
+报表导出模块
+根据缓存的报表表格逐行生成CSV、XLSX和按城市打包的ZIP，
+生成器每次只产出一小段数据，由报表服务器以分块传输的方式发送
+"""
+
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+STAT_LABELS = ["未开始", "进行中", "已完成", "挂起", "拒绝", "总计"]
+
+
+class _StreamSink:
+    """供 zipfile 写入的只追加缓冲区，生成器每写完一行就把已产生的字节取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def column_titles(grid):
+    """生成单行表头使用的列标题，子任务列带上父任务标题"""
+    titles = []
+    for _, subject, group_index in grid.columns:
+        group_subject, span = grid.groups[group_index][1], grid.groups[group_index][2]
+        titles.append(f"{group_subject}/{subject}" if span else subject)
+    return titles
+
+
+def _csv_line(writer, buffer, row):
+    writer.writerow(row)
+    line = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return line
+
+
+def iter_csv(grid):
+    """逐行生成 城市 × 任务 状态表的CSV文本
+
+    开头带UTF-8 BOM，Excel直接打开时中文不会乱码。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield "\ufeff" + _csv_line(writer, buffer, ["城市"] + column_titles(grid))
+    for row, city_name in enumerate(grid.city_names):
+        labels = [grid.status_labels[code] for code in grid.status[row].tolist()]
+        yield _csv_line(writer, buffer, [city_name] + labels)
+
+
+def iter_city_csv(grid, row):
+    """逐行生成单个城市的任务清单CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield "\ufeff" + _csv_line(writer, buffer, ["父任务", "任务", "任务ID", "状态"])
+    task_ids = grid.task_ids[row].tolist()
+    codes = grid.status[row].tolist()
+    for col, (_, subject, group_index) in enumerate(grid.columns):
+        group_subject, span = grid.groups[group_index][1], grid.groups[group_index][2]
+        yield _csv_line(writer, buffer, [
+            group_subject if span else "",
+            subject,
+            task_ids[col] or "",
+            grid.status_labels[codes[col]],
+        ])
+
+
+def iter_city_zip(grid):
+    """生成每个城市一个CSV文件的ZIP包
+
+    输出流不可回退，zipfile 会为每个文件写入数据描述符，
+    因此不需要先在内存或磁盘上生成完整文件。
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for row, city_name in enumerate(grid.city_names):
+            # 替换路径分隔符和Windows文件名中不允许的字符
+            file_name = re.sub(r'[\\/:*?"<>|]', "_", city_name) or f"city_{row + 1}"
+            with archive.open(f"{row + 1:03d}_{file_name}.csv", "w") as entry:
+                for line in iter_city_csv(grid, row):
+                    entry.write(line.encode("utf-8"))
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def column_letter(index):
+    """把从0开始的列下标转换为Excel列名（A、B、…、AA）"""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell(ref, value, style=0):
+    style_attr = f' s="{style}"' if style else ""
+    if isinstance(value, int):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _row(row_number, values, style=0):
+    cells = "".join(_cell(f"{column_letter(col)}{row_number}", value, style)
+                    for col, value in enumerate(values) if value != "")
+    return f'<row r="{row_number}">{cells}</row>'
+
+
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">')
+
+# 状态样式下标与 STATUS_LABELS 顺序一致：未开始、进行中、已完成、挂起、拒绝
+_STATUS_STYLES = {"未开始": 2, "进行中": 3, "已完成": 4, "挂起": 5, "拒绝": 6}
+
+
+def iter_status_sheet(grid):
+    """生成任务完成情况工作表的XML，表头两行，父任务单元格合并"""
+    yield _SHEET_HEAD
+    yield '<sheetViews><sheetView workbookViewId="0"><pane xSplit="1" ySplit="2" topLeftCell="B3" state="frozen"/></sheetView></sheetViews>'
+    yield '<cols><col min="1" max="1" width="14" customWidth="1"/>'
+    if grid.columns:
+        yield f'<col min="2" max="{len(grid.columns) + 1}" width="16" customWidth="1"/>'
+    yield '</cols><sheetData>'
+
+    first, second, merges = ["城市"], [""], ["A1:A2"]
+    col = 1
+    for _, subject, span in grid.groups:
+        if span:
+            first.extend([subject] + [""] * (span - 1))
+            if span > 1:
+                merges.append(f"{column_letter(col)}1:{column_letter(col + span - 1)}1")
+            col += span
+        else:
+            first.append(subject)
+            merges.append(f"{column_letter(col)}1:{column_letter(col)}2")
+            col += 1
+    for _, subject, group_index in grid.columns:
+        second.append(subject if grid.groups[group_index][2] else "")
+    yield _row(1, first, 1)
+    yield _row(2, second, 1)
+
+    for row, city_name in enumerate(grid.city_names):
+        cells = [_cell(f"A{row + 3}", city_name, 1)]
+        for col, code in enumerate(grid.status[row].tolist()):
+            label = grid.status_labels[code]
+            cells.append(_cell(f"{column_letter(col + 1)}{row + 3}", label, _STATUS_STYLES.get(label, 2)))
+        yield f'<row r="{row + 3}">{"".join(cells)}</row>'
+
+    yield '</sheetData>'
+    yield f'<mergeCells count="{len(merges)}">'
+    yield "".join(f'<mergeCell ref="{ref}"/>' for ref in merges)
+    yield '</mergeCells></worksheet>'
+
+
+def iter_statistics_sheet(grid, city_statistics):
+    """生成城市统计工作表的XML"""
+    yield _SHEET_HEAD
+    yield '<sheetData>'
+    yield _row(1, ["城市"] + STAT_LABELS + ["完成率(%)"], 1)
+    for row, city_name in enumerate(grid.city_names):
+        stats = city_statistics.get(city_name, {})
+        counts = [int(stats.get(label, 0)) for label in STAT_LABELS]
+        completion_rate = round(counts[2] / counts[-1] * 100) if counts[-1] else 0
+        yield _row(row + 2, [city_name] + counts + [completion_rate])
+    yield '</sheetData></worksheet>'
+
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/worksheets/sheet2.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets>
+<sheet name="任务完成情况" sheetId="1" r:id="rId1"/>
+<sheet name="城市统计" sheetId="2" r:id="rId2"/>
+</sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet2.xml"/>
+<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+# 样式：0 默认，1 表头加粗，2-6 依次为未开始、进行中、已完成、挂起、拒绝的底色（与网页报表一致）
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="7">
+<fill><patternFill patternType="none"/></fill>
+<fill><patternFill patternType="gray125"/></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFEFEFF0"/></patternFill></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFD1F2E1"/></patternFill></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFE1F3D8"/></patternFill></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFFAECD8"/></patternFill></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFFDE2E2"/></patternFill></fill>
+</fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="7">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="0" fontId="0" fillId="3" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="0" fontId="0" fillId="4" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="0" fontId="0" fillId="5" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="0" fontId="0" fillId="6" borderId="0" xfId="0" applyFill="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+
+def iter_xlsx(grid, city_statistics):
+    """生成XLSX工作簿（任务完成情况 + 城市统计两个工作表）
+
+    单元格使用内联字符串，不需要预先收集共享字符串表，工作表XML可以逐行写入ZIP。
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in (("[Content_Types].xml", _CONTENT_TYPES),
+                              ("_rels/.rels", _ROOT_RELS),
+                              ("xl/workbook.xml", _WORKBOOK),
+                              ("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS),
+                              ("xl/styles.xml", _STYLES)):
+            archive.writestr(name, content)
+        yield from sink.drain()
+
+        for name, fragments in (("xl/worksheets/sheet1.xml", iter_status_sheet(grid)),
+                                ("xl/worksheets/sheet2.xml", iter_statistics_sheet(grid, city_statistics))):
+            with archive.open(name, "w") as entry:
+                for fragment in fragments:
+                    entry.write(fragment.encode("utf-8"))
+                    yield from sink.drain()
+    yield from sink.drain()
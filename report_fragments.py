@@ -0,0 +1,87 @@
+"""
+报表HTML片段缓存模块
+报表表格按表头和每个城市行拆分为片段，片段以其输入数据的哈希为键缓存，
+重新生成报表时只渲染输入有变化的片段，其余直接复用
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# 缓存的最大片段数，超过后淘汰最久未使用的片段
+MAX_FRAGMENTS = 4096
+
+
+def header_key(grid, show_task_ids=False):
+    """表头片段的键：模板任务树（分组和列）变化时随之变化"""
+    digest = hashlib.sha1(b"header")
+    digest.update(json.dumps([grid.groups, grid.columns, bool(show_task_ids)],
+                             ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def row_key(grid, row, show_task_ids=False):
+    """城市行片段的键
+
+    包含城市名称、该行各单元格的任务ID和状态标签，以及单元格任务的更新时间
+    （悬浮提示中的任务描述随更新时间变化）。
+    """
+    digest = hashlib.sha1(b"row")
+    labels = [grid.status_labels[index] for index in grid.status[row].tolist()]
+    digest.update(json.dumps([grid.city_names[row], labels, bool(show_task_ids)],
+                             ensure_ascii=False).encode('utf-8'))
+    task_ids = grid.task_ids[row]
+    digest.update(task_ids.tobytes())
+    updated = ";".join(grid.tasks[task_id].get('updatedAt', '') for task_id in task_ids.tolist() if task_id)
+    digest.update(updated.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FragmentCache:
+    """按键缓存HTML片段的LRU缓存，多个请求线程共用
+
+    Args:
+        max_entries: 最多保存的片段数
+    """
+
+    def __init__(self, max_entries=MAX_FRAGMENTS):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """返回键对应的片段，没有缓存时调用 render() 生成并缓存
+
+        渲染在锁外进行，两个请求同时渲染同一片段时结果相同，后写入的覆盖先写入的。
+        """
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = render()
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        """返回缓存的片段数和命中次数"""
+        with self._lock:
+            return {"fragments": len(self._fragments), "hits": self.hits, "misses": self.misses}
+
+
+# 全局报表片段缓存实例
+fragment_cache = FragmentCache()
@@ -0,0 +1,156 @@
+"""
+报表表格模块
+把报表数据整理为"城市 × 模板任务列"的紧凑表格，
+HTML报表、紧凑JSON接口和导出功能共用同一份单元格数据
+"""
+
+import numpy as np
+
+from api_client import api_client
+from report_matrix import STATUS_LABELS
+
+# 部分报表中尚未获取到数据的单元格
+MISSING_LABEL = "待加载"
+
+
+def get_task_status_title(task):
+    """获取工作包的状态标题，缺少状态时返回"未开始\""""
+    status_link = task.get("_links", {}).get("status")
+    if isinstance(status_link, dict) and "title" in status_link:
+        return status_link["title"]
+    return "未开始"
+
+
+def translate_status_title(status):
+    """把OpenProject状态标题转换为中文标签，未知状态原样返回"""
+    return {
+        "Closed": "已完成",
+        "In progress": "进行中",
+        "On hold": "挂起",
+        "Rejected": "拒绝",
+        "New": "未开始",
+    }.get(status, status)
+
+
+def get_task_description(task):
+    """获取工作包描述的原始文本"""
+    if "description" not in task:
+        return ""
+    description = task["description"]
+    if isinstance(description, dict):
+        return description.get("raw", "") or ""
+    return str(description) if description is not None else ""
+
+
+class ReportGrid:
+    """城市 × 模板任务列的报表表格
+
+    列来自省厅的模板任务树：有子任务的顶级任务展开为子任务列，没有子任务的顶级任务自成一列。
+    每个单元格记录该城市同名任务的ID（找不到时为0）和状态标签下标；
+    找不到同名任务时使用 tasks_status 中模板任务在该城市的汇总状态，
+    报表数据只包含部分工作包（带有 partial 标记）时标记为待加载。
+    """
+
+    def __init__(self):
+        self.city_names = []
+        self.groups = []        # [(模板任务ID, 标题, 子任务列数)]
+        self.columns = []       # [(模板任务ID, 标题, 所属分组下标)]
+        self.status_labels = list(STATUS_LABELS)
+        self.task_ids = np.zeros((0, 0), dtype=np.int64)
+        self.status = np.zeros((0, 0), dtype=np.int16)
+        self.tasks = {}         # 工作包ID -> 工作包
+
+    def label_index(self, label):
+        """获取状态标签的下标，新标签追加到末尾"""
+        try:
+            return self.status_labels.index(label)
+        except ValueError:
+            self.status_labels.append(label)
+            return len(self.status_labels) - 1
+
+    @classmethod
+    def build(cls, report_data):
+        """根据报表数据构建表格"""
+        grid = cls()
+        cities = report_data.get("cities", [])
+        tasks_by_city = report_data.get("tasks_by_city", {})
+        tasks_status = report_data.get("tasks_status", {})
+        partial = bool(report_data.get("partial"))
+        grid.city_names = [city["name"] for city in cities]
+
+        for group_index, task_tree in enumerate(report_data.get("template_tasks", [])):
+            children = task_tree.get("children", [])
+            grid.groups.append((task_tree["id"], task_tree.get("subject", ""), len(children)))
+            if children:
+                for child in children:
+                    grid.columns.append((child["id"], child.get("subject", ""), group_index))
+            else:
+                grid.columns.append((task_tree["id"], task_tree.get("subject", ""), group_index))
+
+        shape = (len(grid.city_names), len(grid.columns))
+        grid.task_ids = np.zeros(shape, dtype=np.int64)
+        grid.status = np.zeros(shape, dtype=np.int16)
+
+        for row, city_name in enumerate(grid.city_names):
+            # 每个城市只建一次"标题 -> 第一个同名任务"的索引
+            by_subject = {}
+            for task in tasks_by_city.get(city_name, []):
+                grid.tasks[task["id"]] = task
+                by_subject.setdefault(task.get("subject"), task)
+
+            for col, (template_id, subject, _) in enumerate(grid.columns):
+                city_task = by_subject.get(subject)
+                if city_task is not None:
+                    grid.task_ids[row, col] = city_task["id"]
+                    label = translate_status_title(get_task_status_title(city_task))
+                elif partial:
+                    label = MISSING_LABEL
+                else:
+                    label = tasks_status.get(template_id, {}).get(city_name, "未开始")
+                grid.status[row, col] = grid.label_index(label)
+
+        return grid
+
+    def cell(self, row, col):
+        """返回单元格的 (任务ID或None, 状态标签)"""
+        task_id = int(self.task_ids[row, col])
+        return (task_id or None), self.status_labels[self.status[row, col]]
+
+    def to_compact(self):
+        """生成列式的紧凑数据：标题做字典编码，单元格按行展平，不包含HAL对象和描述"""
+        subjects = []
+        subject_index = {}
+
+        def encode(subject):
+            if subject not in subject_index:
+                subject_index[subject] = len(subjects)
+                subjects.append(subject)
+            return subject_index[subject]
+
+        return {
+            "status_labels": self.status_labels,
+            "subjects": subjects,
+            "groups": [[task_id, encode(subject), span] for task_id, subject, span in self.groups],
+            "columns": [[task_id, encode(subject), group] for task_id, subject, group in self.columns],
+            "cities": self.city_names,
+            "task_ids": self.task_ids.ravel().tolist(),
+            "status": self.status.ravel().tolist(),
+        }
+
+    def task_detail(self, task_id):
+        """返回单个任务的悬浮提示信息，找不到时返回None"""
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        # 与 CityIndex 相同，只看"城市"自定义字段
+        city_link = task.get("_links", {}).get(f"customField{api_client.get_city_field_id()}")
+        if not isinstance(city_link, dict):
+            city_link = None
+        return {
+            "id": task_id,
+            "subject": task.get("subject", ""),
+            "status": translate_status_title(get_task_status_title(task)),
+            "description": get_task_description(task),
+            "city": city_link.get("title") if city_link else "",
+            "updated_at": task.get("updatedAt", ""),
+        }
@@ -0,0 +1,258 @@
+"""
+报表历史模块
+每次构建报表时把各城市的状态统计追加到磁盘上的定长二进制记录文件，
+只在城市的统计数字变化时写入新记录，查询时按采样点取每个城市最近一条记录，
+用于绘制各城市完成进度随时间变化的趋势
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from report_artifacts import write_atomic
+
+# 默认的历史数据目录，每个项目一个子目录
+HISTORY_DIR = "report_history"
+# 记录中保存的统计项，顺序固定，与报表城市统计一致
+HISTORY_LABELS = ["未开始", "进行中", "已完成", "挂起", "拒绝", "总计"]
+# 每条记录18字节：时间戳（秒）、城市下标、各统计项数量
+RECORD_DTYPE = np.dtype([
+    ("time", "<u4"),
+    ("city", "<u2"),
+    ("counts", "<u2", (len(HISTORY_LABELS),)),
+])
+# 查询返回的最大采样点数，同时是默认值和上限
+MAX_POINTS = 400
+
+_MAX_COUNT = np.iinfo(np.uint16).max
+
+
+class _CityTimeline:
+    """单个城市的记录时间和记录在文件中的下标，按时间顺序追加，容量不足时加倍"""
+
+    def __init__(self, times=(), positions=()):
+        self.times = np.array(times, dtype=np.int64)
+        self.positions = np.array(positions, dtype=np.int64)
+        self.length = len(self.times)
+
+    def extend(self, times, positions):
+        length = self.length + len(times)
+        if length > len(self.times):
+            capacity = max(length, 2 * len(self.times), 16)
+            for name in ("times", "positions"):
+                grown = np.empty(capacity, dtype=np.int64)
+                grown[:self.length] = getattr(self, name)[:self.length]
+                setattr(self, name, grown)
+        self.times[self.length:length] = times
+        self.positions[self.length:length] = positions
+        self.length = length
+
+    def view(self):
+        """当前记录的只读视图，之后的追加不影响已返回的视图"""
+        return self.times[:self.length], self.positions[:self.length]
+
+
+class HistorySeries:
+    """单个项目的历史记录
+
+    history.bin 只追加、不修改；cities.json 保存城市下标对应的名称，只会追加新城市。
+    同一进程内的追加由锁保护，记录的时间戳单调不减。
+    内存中按城市保存记录时间和记录下标的索引，查询时在每个城市的时间序列中二分查找，只读取范围内的记录。
+
+    Args:
+        directory: 项目的历史数据目录
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.data_path = os.path.join(directory, "history.bin")
+        self.cities_path = os.path.join(directory, "cities.json")
+        self.city_names = []
+        self.city_ids = {}
+        self.last_time = 0
+        self._last_counts = {}
+        self._timelines = {}
+        self._record_count = 0
+        self._lock = threading.Lock()
+        self._recover()
+
+    def _recover(self):
+        """读取城市列表和每个城市的最后一条记录，丢弃意外中断时写入的不完整记录"""
+        try:
+            with open(self.cities_path, 'r', encoding='utf-8') as f:
+                self.city_names = json.load(f)
+        except (OSError, ValueError):
+            self.city_names = []
+        self.city_ids = {name: index for index, name in enumerate(self.city_names)}
+
+        if not os.path.exists(self.data_path):
+            return
+        size = os.path.getsize(self.data_path)
+        partial = size % RECORD_DTYPE.itemsize
+        if partial:
+            print(f"历史记录文件末尾有 {partial} 字节不完整的记录，已截断")
+            os.truncate(self.data_path, size - partial)
+
+        records = self.records()
+        self._record_count = len(records)
+        if len(records) == 0:
+            return
+        self.last_time = int(records["time"][-1])
+        # 打开时建立一次城市索引：稳定排序后每个城市的记录连续且保持时间顺序
+        city_column = np.asarray(records["city"])
+        order = np.argsort(city_column, kind="stable")
+        sorted_cities = city_column[order]
+        times = np.asarray(records["time"], dtype=np.int64)
+        boundaries = np.flatnonzero(np.diff(sorted_cities)) + 1
+        for positions in np.split(order, boundaries):
+            city = int(city_column[positions[0]])
+            self._timelines[city] = _CityTimeline(times[positions], positions)
+            self._last_counts[city] = tuple(records["counts"][positions[-1]].tolist())
+
+    def records(self):
+        """以内存映射方式返回当前全部记录"""
+        count = os.path.getsize(self.data_path) // RECORD_DTYPE.itemsize if os.path.exists(self.data_path) else 0
+        if count == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.memmap(self.data_path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def _city_index(self, name):
+        index = self.city_ids.get(name)
+        if index is None:
+            index = len(self.city_names)
+            self.city_names.append(name)
+            self.city_ids[name] = index
+            # 城市列表必须先于引用它的记录写入磁盘
+            write_atomic(self.cities_path, json.dumps(self.city_names, ensure_ascii=False).encode('utf-8'))
+        return index
+
+    def append(self, city_statistics, timestamp=None):
+        """追加一次报表构建的城市统计
+
+        统计数字没有变化的城市不写入记录；上次有数据但本次没有出现的城市记为全部为0。
+
+        Args:
+            city_statistics: 城市名称到 {统计项: 数量} 的字典
+            timestamp: 记录时间，默认为当前时间
+
+        Returns:
+            int: 写入的记录条数
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            timestamp = max(int(timestamp if timestamp is not None else time.time()), self.last_time)
+
+            rows = []
+            for name, stats in city_statistics.items():
+                index = self._city_index(name)
+                counts = tuple(min(max(int(stats.get(label, 0)), 0), _MAX_COUNT) for label in HISTORY_LABELS)
+                if self._last_counts.get(index) != counts:
+                    rows.append((timestamp, index, counts))
+            present = {self.city_ids[name] for name in city_statistics}
+            for index, counts in self._last_counts.items():
+                if index not in present and any(counts):
+                    rows.append((timestamp, index, (0,) * len(HISTORY_LABELS)))
+
+            if not rows:
+                return 0
+            data = np.array(rows, dtype=RECORD_DTYPE)
+            with open(self.data_path, 'ab') as f:
+                f.write(data.tobytes())
+            for position, (_, index, counts) in enumerate(rows, self._record_count):
+                self._last_counts[index] = counts
+                self._timelines.setdefault(index, _CityTimeline()).extend([timestamp], [position])
+            self._record_count += len(rows)
+            self.last_time = timestamp
+            return len(rows)
+
+    def query(self, start=None, end=None, points=MAX_POINTS, cities=None):
+        """查询时间范围内各城市的统计，按采样点降采样
+
+        每个采样点的值为该时刻之前城市最近一条记录，早于 start 的记录同样参与计算，
+        因此范围开始时的状态是完整的。
+
+        Args:
+            start: 开始时间戳，默认为第一条记录的时间
+            end: 结束时间戳，默认为当前时间
+            points: 最大采样点数，超过 MAX_POINTS 时按 MAX_POINTS 计算
+            cities: 只返回这些城市，默认返回全部
+
+        Returns:
+            dict: labels、cities、times 和 counts（城市 × 采样点 × 统计项）
+        """
+        names = [name for name in self.city_names if cities is None or name in cities]
+        # 先取城市索引再映射记录文件：索引中的记录在更新索引之前已经写入文件
+        with self._lock:
+            timelines = {name: self._timelines[self.city_ids[name]].view()
+                         for name in names if self.city_ids[name] in self._timelines}
+        records = self.records()
+        end = int(end if end is not None else time.time())
+        if start is None:
+            start = int(records["time"][0]) if len(records) else end
+        start = min(int(start), end)
+        # 采样点数决定返回数组的大小，不能由调用方任意指定
+        points = min(max(2, int(points)), MAX_POINTS)
+
+        step = max(1, math.ceil((end - start) / (points - 1)))
+        sample_times = np.arange(start, end, step, dtype=np.int64)
+        sample_times = np.append(sample_times, end)
+
+        counts = np.zeros((len(names), len(sample_times), len(HISTORY_LABELS)), dtype=np.int64)
+        for row, name in enumerate(names):
+            if name not in timelines:
+                continue
+            times, positions = timelines[name]
+            # 从 start 之前的最后一条记录（范围开始时的状态）到 end 为止
+            lo = max(int(np.searchsorted(times, start, side="right")) - 1, 0)
+            hi = int(np.searchsorted(times, end, side="right"))
+            if lo >= hi:
+                continue
+            range_counts = np.asarray(records["counts"][positions[lo:hi]])
+            sample_positions = np.searchsorted(times[lo:hi], sample_times, side="right") - 1
+            valid = sample_positions >= 0
+            counts[row, valid] = range_counts[sample_positions[valid]]
+
+        return {
+            "labels": HISTORY_LABELS,
+            "cities": names,
+            "times": sample_times.tolist(),
+            "step": step,
+            "counts": counts.tolist(),
+        }
+
+
+class ReportHistory:
+    """所有项目的历史记录，按项目目录名懒加载
+
+    Args:
+        directory: 历史数据根目录
+    """
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def series(self, key):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = HistorySeries(os.path.join(self.directory, key))
+                self._series[key] = series
+            return series
+
+    def append(self, key, city_statistics, timestamp=None):
+        """追加项目的城市统计，返回写入的记录条数"""
+        return self.series(key).append(city_statistics, timestamp)
+
+    def query(self, key, start=None, end=None, points=MAX_POINTS, cities=None):
+        """查询项目的城市统计历史，参数与 HistorySeries.query 相同"""
+        return self.series(key).query(start, end, points, cities)
+
+
+# 全局报表历史实例
+report_history = ReportHistory()
@@ -516,7 +516,7 @@ class ReportHTMLGenerator:
         '''
         
         # 生成表格部分
-        table_content = f'''
+        table_parts = [f'''
         <table class="report-table" id="reportTable">
             <thead>
                 <tr>
@@ -525,17 +525,17 @@ class ReportHTMLGenerator:
                     <th style="width: 10%">当前状态</th>
                     <th style="width: 10%">创建时间</th>
                     <th style="width: 10%">更新时间</th>
-        '''
+        ''']
         
         # 添加城市列
         for city in cities:
-            table_content += f'<th class="city-header">{city}</th>'
+            table_parts.append(f'<th class="city-header">{city}</th>')
             
-        table_content += '''
+        table_parts.append('''
                 </tr>
             </thead>
             <tbody>
-        '''
+        ''')
         
         # 添加任务行
         for index, task in enumerate(tasks):
@@ -550,14 +550,14 @@ class ReportHTMLGenerator:
             collapsible_class = 'collapsible' if has_children else ''
             collapse_icon = '<span class="collapse-icon">▼</span>' if has_children else ''
             
-            table_content += f'''
+            table_parts.append(f'''
                 <tr class="task-row {collapsible_class}" data-task-id="{task_id}">
                     <td>{index + 1}</td>
                     <td>{collapse_icon}{task_name}</td>
                     <td><div class="status-cell {get_status_class(task_status)}">{get_status_label(task_status)}</div></td>
                     <td>{created_at}</td>
                     <td>{updated_at}</td>
-            '''
+            ''')
             
             # 添加城市状态单元格
             for city in cities:
@@ -565,17 +565,17 @@ class ReportHTMLGenerator:
                 status_class = get_status_class(city_status)
                 status_label = get_status_label(city_status)
                 
-                table_content += f'''
+                table_parts.append(f'''
                     <td><div class="status-cell {status_class}">{status_label}</div></td>
-                '''
+                ''')
                 
-            table_content += '</tr>'
+            table_parts.append('</tr>')
             
             # 如果有子任务，添加子任务行
             if has_children:
-                table_content += f'<tr class="task-children" data-parent="{task_id}"><td colspan="{5 + len(cities)}">'
-                table_content += '<table class="report-table" style="box-shadow: none; margin-bottom: 0;">'
-                table_content += '<tbody>'
+                table_parts.append(f'<tr class="task-children" data-parent="{task_id}"><td colspan="{5 + len(cities)}">')
+                table_parts.append('<table class="report-table" style="box-shadow: none; margin-bottom: 0;">')
+                table_parts.append('<tbody>')
                 
                 for child_index, child in enumerate(task.get('children', [])):
                     child_id = child.get('id', '')
@@ -584,14 +584,14 @@ class ReportHTMLGenerator:
                     child_created_at = child.get('created_at', '')
                     child_updated_at = child.get('updated_at', '')
                     
-                    table_content += f'''
+                    table_parts.append(f'''
                         <tr class="subtask-row">
                             <td style="width: 5%">{index + 1}.{child_index + 1}</td>
                             <td style="width: 25%; padding-left: 25px;">{child_name}</td>
                             <td style="width: 10%"><div class="status-cell {get_status_class(child_status)}">{get_status_label(child_status)}</div></td>
                             <td style="width: 10%">{child_created_at}</td>
                             <td style="width: 10%">{child_updated_at}</td>
-                    '''
+                    ''')
                     
                     # 添加城市状态单元格
                     for city in cities:
@@ -599,18 +599,18 @@ class ReportHTMLGenerator:
                         status_class = get_status_class(city_status)
                         status_label = get_status_label(city_status)
                         
-                        table_content += f'''
+                        table_parts.append(f'''
                             <td><div class="status-cell {status_class}">{status_label}</div></td>
-                        '''
+                        ''')
                         
-                    table_content += '</tr>'
+                    table_parts.append('</tr>')
                 
-                table_content += '</tbody></table></td></tr>'
+                table_parts.append('</tbody></table></td></tr>')
                 
-        table_content += '''
+        table_parts.append('''
             </tbody>
         </table>
-        '''
+        ''')
         
         # 添加JavaScript功能
         js_functionality = '''
@@ -657,7 +657,7 @@ class ReportHTMLGenerator:
         </script>
         '''
         
-        return table_header + table_content + js_functionality
+        return "".join([table_header] + table_parts + [js_functionality])
     
     def generate_error_page(self, error_message):
         """
@@ -0,0 +1,95 @@
+"""
+报表服务器HTTP辅助模块
+提供分块传输编码（chunked）和gzip压缩的流式响应写入
+"""
+
+import zlib
+
+
+def accepts_gzip(accept_encoding):
+    """根据请求的Accept-Encoding头判断客户端是否接受gzip"""
+    if not accept_encoding:
+        return False
+    for item in accept_encoding.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        if parts[0].lower() not in ("gzip", "*"):
+            continue
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class ChunkedResponseWriter:
+    """以 Transfer-Encoding: chunked 写出响应体，可选gzip压缩
+
+    小片段先在缓冲区中累积，达到 buffer_size 后压缩并作为一个分块写出，
+    这样既能尽早把首批字节发给浏览器，又不会产生大量极小的分块。
+    """
+
+    def __init__(self, wfile, use_gzip=False, buffer_size=16 * 1024):
+        self.wfile = wfile
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        self._closed = False
+        # wbits=31 生成带gzip头的数据流
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, data):
+        """写入一个片段（str或bytes）"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if not data:
+            return
+        self.bytes_in += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区内容作为一个分块写出"""
+        if not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._write_chunk(data)
+
+    def close(self, trailers=None):
+        """写出剩余数据和结束分块
+
+        Args:
+            trailers: 结束分块之后发送的尾部字段字典，需要在响应头的 Trailer 中声明
+        """
+        if self._closed:
+            return
+        self.flush()
+        if self._compressor is not None:
+            self._write_chunk(self._compressor.flush(zlib.Z_FINISH))
+        trailer_lines = "".join(f"{name}: {value}\r\n" for name, value in (trailers or {}).items())
+        self.wfile.write(b"0\r\n" + trailer_lines.encode("latin-1") + b"\r\n")
+        self.wfile.flush()
+        self._closed = True
+
+    def _write_chunk(self, data):
+        if not data:
+            return
+        self.bytes_out += len(data)
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def gzip_bytes(data, level=6):
+    """把完整的响应体压缩为gzip格式"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
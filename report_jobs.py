@@ -0,0 +1,184 @@
+"""
+报表任务管理模块
+同一项目的并发报表请求合并到同一个后台任务，任务在固定大小的线程池中执行，
+客户端通过订阅获取进度，可以取消，已结束的任务在访问时按过期时间清理
+"""
+
+import concurrent.futures
+import threading
+import time
+import uuid
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_DONE, JOB_ERROR, JOB_CANCELLED)
+
+
+class ReportJob:
+    """一个后台报表任务
+
+    提供与 queue.Queue 相同的 put 方法，原有代码中向 progress_queues 写入进度的地方无需修改。
+    进度消息按顺序保存，每个订阅者各自记录读取位置。
+    """
+
+    def __init__(self, key):
+        self.id = str(uuid.uuid4())
+        self.key = key
+        self.state = JOB_PENDING
+        self.messages = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.subscribers = set()
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def put(self, message, block=True, timeout=None):
+        """追加一条进度消息，消息状态为done/error时任务结束"""
+        with self._lock:
+            if self.state in FINISHED_STATES:
+                return
+            self.messages.append(message)
+            status = message.get("status")
+            if status in FINISHED_STATES:
+                self.state = status
+                self.finished_at = time.time()
+            elif self.state == JOB_PENDING:
+                self.state = JOB_RUNNING
+
+    def finish(self, state, message):
+        """以指定状态结束任务，任务已结束时忽略"""
+        self.put({"status": state, "message": message})
+
+    def cancel(self):
+        """请求取消任务，任务在下一个检查点停止"""
+        self._cancel_event.set()
+        self.finish(JOB_CANCELLED, "报表任务已取消")
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def is_finished(self):
+        return self.state in FINISHED_STATES
+
+
+class ReportJobManager:
+    """报表任务管理器
+
+    Args:
+        max_workers: 同时执行的任务数上限
+        job_ttl: 任务结束后保留进度的秒数，过期的任务在下一次访问管理器时清理
+    """
+
+    def __init__(self, max_workers=2, job_ttl=60):
+        self.max_workers = max_workers
+        self.job_ttl = job_ttl
+        # 任务ID -> 任务，报表服务器把它作为 progress_queues 使用
+        self.jobs = {}
+        self._active = {}
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="report-job")
+
+    def submit(self, key, target):
+        """提交任务，同一key已有未结束的任务时直接订阅该任务
+
+        Args:
+            key: 去重使用的键，一般为项目标识
+            target: 任务函数，参数为任务ID
+
+        Returns:
+            (订阅ID, 任务, 是否新建任务)
+        """
+        with self._lock:
+            self._evict_expired()
+            job = self._active.get(key)
+            created = job is None or job.is_finished()
+            if created:
+                busy = sum(1 for active in self._active.values() if not active.is_finished())
+                job = ReportJob(key)
+                self.jobs[job.id] = job
+                self._active[key] = job
+                if busy >= self.max_workers:
+                    job.messages.append({"status": "progress", "message": "等待其他报表任务完成...", "percent": 0})
+                self._executor.submit(self._run, job, target)
+                print(f"创建报表任务 {job.id} ({key})")
+            else:
+                print(f"合并到正在执行的报表任务 {job.id} ({key})")
+            subscription_id = self._subscribe(job)
+        return subscription_id, job, created
+
+    def _subscribe(self, job):
+        subscription_id = str(uuid.uuid4())
+        # 新订阅者从最近一条消息开始读取，不重放完整历史
+        self._subscriptions[subscription_id] = [job, max(0, len(job.messages) - 1)]
+        job.subscribers.add(subscription_id)
+        return subscription_id
+
+    def _run(self, job, target):
+        if job.is_cancelled():
+            return
+        with job._lock:
+            if job.state == JOB_PENDING:
+                job.state = JOB_RUNNING
+        try:
+            target(job.id)
+        except Exception as e:
+            job.finish(JOB_ERROR, f"生成报表数据时出错: {str(e)}")
+        finally:
+            if not job.is_finished():
+                job.finish(JOB_ERROR, "报表任务意外结束")
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def next_message(self, subscription_id):
+        """读取订阅者的下一条进度消息
+
+        Returns:
+            进度消息字典；暂无新消息时返回 {"status": "waiting"}；订阅不存在时返回None
+        """
+        with self._lock:
+            self._evict_expired()
+            subscription = self._subscriptions.get(subscription_id)
+        if subscription is None:
+            return None
+        job, cursor = subscription
+        if cursor < len(job.messages):
+            subscription[1] = cursor + 1
+            return job.messages[cursor]
+        return {"status": "waiting"}
+
+    def unsubscribe(self, subscription_id):
+        """取消订阅，任务没有其他订阅者时取消任务
+
+        Returns:
+            bool: 订阅存在时返回True
+        """
+        with self._lock:
+            subscription = self._subscriptions.pop(subscription_id, None)
+            if subscription is None:
+                return False
+            job = subscription[0]
+            job.subscribers.discard(subscription_id)
+            if not job.subscribers and not job.is_finished():
+                print(f"报表任务 {job.id} 已没有订阅者，取消任务")
+                job.cancel()
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+        return True
+
+    def _evict_expired(self):
+        """清理结束超过 job_ttl 秒的任务及其订阅，调用方需持有锁"""
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.job_ttl]
+        for job_id in expired:
+            job = self.jobs.pop(job_id)
+            for subscription_id in job.subscribers:
+                self._subscriptions.pop(subscription_id, None)
@@ -0,0 +1,327 @@
+"""
+报表状态矩阵模块
+将各城市的任务状态保存为整数编码的NumPy矩阵（任务 × 城市），
+父任务状态汇总和城市统计均通过向量化运算完成
+"""
+
+import numpy as np
+
+from report_timing import timed_stage
+
+# 状态编码，-1 表示该城市没有此任务
+STATUS_ABSENT = -1
+STATUS_NOT_STARTED = 0
+STATUS_IN_PROGRESS = 1
+STATUS_COMPLETED = 2
+STATUS_ON_HOLD = 3
+STATUS_REJECTED = 4
+
+# 与状态编码一一对应的中文标签
+STATUS_LABELS = ["未开始", "进行中", "已完成", "挂起", "拒绝"]
+
+# OpenProject状态标题到状态编码的映射
+STATUS_TITLE_CODES = {
+    "New": STATUS_NOT_STARTED,
+    "In progress": STATUS_IN_PROGRESS,
+    "Closed": STATUS_COMPLETED,
+    "On hold": STATUS_ON_HOLD,
+    "Rejected": STATUS_REJECTED,
+}
+
+
+def status_code_for_task(task):
+    """根据工作包的状态链接获取状态编码，缺少状态或未知状态时视为未开始"""
+    status_link = task.get("_links", {}).get("status")
+    if isinstance(status_link, dict):
+        return STATUS_TITLE_CODES.get(status_link.get("title", ""), STATUS_NOT_STARTED)
+    return STATUS_NOT_STARTED
+
+
+def parse_parent_id(task):
+    """从工作包的parent链接中解析父任务ID，没有父任务时返回None"""
+    parent_link = task.get("_links", {}).get("parent")
+    if isinstance(parent_link, dict) and parent_link.get("href"):
+        try:
+            return int(parent_link["href"].split("/")[-1])
+        except (ValueError, TypeError, IndexError):
+            print(f"处理任务 {task.get('id')} 的父任务链接时出错: {parent_link}")
+    return None
+
+
+def build_tasks_tree(work_packages):
+    """根据parent链接构建任务树
+
+    Returns:
+        (tasks_tree, child_tasks): 父任务ID到子任务ID列表的映射，以及所有子任务ID集合
+    """
+    tasks_tree = {}
+    child_tasks = set()
+    for wp in work_packages:
+        parent_id = parse_parent_id(wp)
+        if parent_id is not None:
+            tasks_tree.setdefault(parent_id, []).append(wp["id"])
+            child_tasks.add(wp["id"])
+    return tasks_tree, child_tasks
+
+
+class CityIndex:
+    """城市索引，一次性把工作包的城市字段解析为城市列下标
+
+    匹配规则与 ReportHandler.is_task_belongs_to_city 一致：
+    带href的单个城市对象只按href精确匹配，城市列表和不带href的对象再按名称或ID匹配。
+    """
+
+    def __init__(self, cities, city_field_key):
+        self.city_field_key = city_field_key
+        self.names = []
+        self._by_href = {}
+        self._by_name = {}
+        self._by_id = {}
+
+        for col, city in enumerate(cities):
+            city_name = city.get("name", "") or city.get("value", "")
+            city_id = city.get("id", "")
+            city_href = city.get("href", "")
+            if not city_href and city_id:
+                city_href = f"/api/v3/custom_options/{city_id}"
+
+            self.names.append(city_name)
+            self._by_href.setdefault(city_href, []).append(col)
+            if city_name:
+                self._by_name.setdefault(city_name, []).append(col)
+            if city_id != "":
+                self._by_id.setdefault(city_id, []).append(col)
+
+    def _match_names(self, entry):
+        cols = []
+        for field in ("title", "name", "value"):
+            if field in entry:
+                cols.extend(self._by_name.get(entry[field], []))
+        return cols
+
+    def columns_for_task(self, task):
+        """返回任务所属城市的列下标列表"""
+        task_city = task.get("_links", {}).get(self.city_field_key)
+
+        if isinstance(task_city, dict):
+            if "href" in task_city:
+                return list(self._by_href.get(task_city["href"], []))
+            cols = self._match_names(task_city)
+            if "id" in task_city:
+                cols.extend(self._by_id.get(task_city["id"], []))
+            return sorted(set(cols))
+
+        if isinstance(task_city, list):
+            cols = []
+            for entry in task_city:
+                if isinstance(entry, dict):
+                    if "href" in entry:
+                        cols.extend(self._by_href.get(entry["href"], []))
+                    cols.extend(self._match_names(entry))
+            return sorted(set(cols))
+
+        return []
+
+
+class StatusMatrix:
+    """任务 × 城市的状态矩阵
+
+    raw 保存各城市任务自身的状态编码，codes 在 raw 的基础上用子任务状态汇总出父任务状态。
+    城市统计只基于 raw 计算，与原先按城市任务逐个计数的结果一致。
+    """
+
+    def __init__(self, task_ids, city_names):
+        self.task_ids = list(task_ids)
+        self.city_names = list(city_names)
+        self.row_of = {task_id: row for row, task_id in enumerate(self.task_ids)}
+        self.col_of = {name: col for col, name in enumerate(self.city_names)}
+        shape = (len(self.task_ids), len(self.city_names))
+        self.raw = np.full(shape, STATUS_ABSENT, dtype=np.int8)
+        self.codes = self.raw.copy()
+        # 每个层级的 (父任务行, 分组起点, 子任务行)，由下至上排列
+        self._rollup_levels = []
+        # 增量汇总使用：子任务行 -> 父任务行，父任务行 -> 子任务行数组
+        self._parent_row = {}
+        self._child_rows = {}
+
+    @classmethod
+    def build(cls, work_packages, city_index, tasks_tree):
+        """根据工作包、城市索引和任务树构建矩阵，并完成父任务状态汇总"""
+        task_ids = [wp["id"] for wp in work_packages]
+        known = set(task_ids)
+        task_ids.extend(parent_id for parent_id in tasks_tree if parent_id not in known)
+
+        matrix = cls(task_ids, city_index.names)
+        with timed_stage("bucket"):
+            rows, cols, codes = [], [], []
+            for wp in work_packages:
+                code = status_code_for_task(wp)
+                row = matrix.row_of[wp["id"]]
+                for col in city_index.columns_for_task(wp):
+                    rows.append(row)
+                    cols.append(col)
+                    codes.append(code)
+
+            if rows:
+                matrix.raw[np.asarray(rows), np.asarray(cols)] = np.asarray(codes, dtype=np.int8)
+        with timed_stage("rollup"):
+            matrix.set_tasks_tree(tasks_tree)
+            matrix.rollup()
+        return matrix
+
+    def set_tasks_tree(self, tasks_tree):
+        """把任务树转换为按层级分组的行下标，供向量化汇总使用"""
+        heights = {}
+
+        def height(task_id, visiting=()):
+            if task_id in heights:
+                return heights[task_id]
+            if task_id in visiting:
+                # 循环引用时截断，避免无限递归
+                return 0
+            children = [c for c in tasks_tree.get(task_id, []) if c in tasks_tree]
+            h = 1 + max((height(c, visiting + (task_id,)) for c in children), default=0)
+            heights[task_id] = h
+            return h
+
+        levels = {}
+        for parent_id, children_ids in tasks_tree.items():
+            if children_ids and parent_id in self.row_of:
+                levels.setdefault(height(parent_id), []).append(parent_id)
+
+        self._rollup_levels = []
+        self._parent_row = {}
+        self._child_rows = {}
+        for level in sorted(levels):
+            parent_rows, starts, child_rows = [], [], []
+            for parent_id in levels[level]:
+                children = [self.row_of[c] for c in tasks_tree[parent_id] if c in self.row_of]
+                if not children:
+                    continue
+                parent_rows.append(self.row_of[parent_id])
+                starts.append(len(child_rows))
+                child_rows.extend(children)
+                self._child_rows[self.row_of[parent_id]] = np.asarray(children, dtype=np.intp)
+                for child_row in children:
+                    self._parent_row[child_row] = self.row_of[parent_id]
+            if parent_rows:
+                self._rollup_levels.append((
+                    np.asarray(parent_rows, dtype=np.intp),
+                    np.asarray(starts, dtype=np.intp),
+                    np.asarray(child_rows, dtype=np.intp),
+                ))
+
+    def rollup(self):
+        """由下至上汇总父任务状态：全部完成为已完成，任一进行中或已完成为进行中，否则未开始"""
+        self.codes = self.raw.copy()
+        for parent_rows, starts, child_rows in self._rollup_levels:
+            child_codes = self.codes[child_rows]
+            completed = child_codes == STATUS_COMPLETED
+            started = completed | (child_codes == STATUS_IN_PROGRESS)
+
+            n_present = np.add.reduceat((child_codes != STATUS_ABSENT).astype(np.int32), starts, axis=0)
+            n_completed = np.add.reduceat(completed.astype(np.int32), starts, axis=0)
+            n_started = np.add.reduceat(started.astype(np.int32), starts, axis=0)
+
+            self.codes[parent_rows] = np.where(
+                (n_present > 0) & (n_completed == n_present),
+                STATUS_COMPLETED,
+                np.where(n_started > 0, STATUS_IN_PROGRESS, STATUS_NOT_STARTED),
+            ).astype(np.int8)
+
+    def _rollup_row(self, parent_row):
+        """按与 rollup 相同的规则重新计算单个父任务行"""
+        child_codes = self.codes[self._child_rows[parent_row]]
+        n_present = np.count_nonzero(child_codes != STATUS_ABSENT, axis=0)
+        n_completed = np.count_nonzero(child_codes == STATUS_COMPLETED, axis=0)
+        n_started = n_completed + np.count_nonzero(child_codes == STATUS_IN_PROGRESS, axis=0)
+        self.codes[parent_row] = np.where(
+            (n_present > 0) & (n_completed == n_present),
+            STATUS_COMPLETED,
+            np.where(n_started > 0, STATUS_IN_PROGRESS, STATUS_NOT_STARTED),
+        ).astype(np.int8)
+
+    def copy(self):
+        """复制矩阵，任务树结构共享，状态数组独立，用于在新快照上增量修改"""
+        matrix = StatusMatrix.__new__(StatusMatrix)
+        matrix.__dict__.update(self.__dict__)
+        matrix.raw = self.raw.copy()
+        matrix.codes = self.codes.copy()
+        return matrix
+
+    def update_task(self, task_id, cols, code):
+        """修改任务在指定城市列的自身状态，返回被修改单元格原来的状态编码"""
+        row = self.row_of[task_id]
+        cols = np.asarray(cols, dtype=np.intp)
+        old_codes = self.raw[row, cols].copy()
+        self.raw[row, cols] = code
+        return old_codes
+
+    def rollup_rows(self, rows):
+        """只重新汇总指定行及其祖先，返回汇总状态可能变化的所有行
+
+        叶子任务的汇总状态就是自身状态；父任务沿父链逐级向上重新计算，
+        每条父链都计算到顶，多个子任务共享祖先时最终结果与完整汇总一致。
+        """
+        touched = set()
+        for row in rows:
+            if row not in self._child_rows:
+                self.codes[row] = self.raw[row]
+            touched.add(row)
+            parent_row = self._parent_row.get(row)
+            visited = set()
+            while parent_row is not None and parent_row not in visited:
+                visited.add(parent_row)
+                self._rollup_row(parent_row)
+                touched.add(parent_row)
+                parent_row = self._parent_row.get(parent_row)
+        return touched
+
+    def task_status_entry(self, row):
+        """生成单个任务在 tasks_status 中的 {城市名: 状态标签} 条目，任务不在任何城市时返回None"""
+        entry = {}
+        codes = self.codes[row].tolist()
+        for col, code in enumerate(codes):
+            if code != STATUS_ABSENT:
+                entry[self.city_names[col]] = STATUS_LABELS[code]
+        return entry or None
+
+    def status_counts(self):
+        """按城市统计任务自身状态数量
+
+        Returns:
+            numpy数组，形状为 (len(STATUS_LABELS) + 1, 城市数)，最后一行为总计
+        """
+        counts = np.empty((len(STATUS_LABELS) + 1, len(self.city_names)), dtype=np.int64)
+        for code in range(len(STATUS_LABELS)):
+            counts[code] = np.count_nonzero(self.raw == code, axis=0)
+        counts[-1] = np.count_nonzero(self.raw != STATUS_ABSENT, axis=0)
+        return counts
+
+    def city_statistics(self):
+        """生成与报表数据兼容的城市统计字典"""
+        counts = self.status_counts()
+        statistics = {}
+        for col, city_name in enumerate(self.city_names):
+            stats = {label: int(counts[code, col]) for code, label in enumerate(STATUS_LABELS)}
+            stats["总计"] = int(counts[-1, col])
+            statistics[city_name] = stats
+        return statistics
+
+    def tasks_status(self):
+        """生成与报表数据兼容的 {任务ID: {城市名: 状态标签}} 字典"""
+        result = {}
+        rows, cols = np.nonzero(self.codes != STATUS_ABSENT)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            task_status = result.setdefault(self.task_ids[row], {})
+            task_status[self.city_names[col]] = STATUS_LABELS[self.codes[row, col]]
+        return result
+
+    def status_label(self, task_id, city_name, default="未开始"):
+        """获取指定任务在指定城市汇总后的状态标签"""
+        row = self.row_of.get(task_id)
+        col = self.col_of.get(city_name)
+        if row is None or col is None:
+            return default
+        code = self.codes[row, col]
+        return STATUS_LABELS[code] if code != STATUS_ABSENT else default
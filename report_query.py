@@ -0,0 +1,168 @@
+"""
+报表查询模块
+在缓存的报表表格上预先建立城市、状态和父任务索引，
+按 city/status/parent 过滤单元格、按 fields 选择返回字段，并用 limit/cursor 分页，
+下游工具和城市门户只获取自己需要的部分
+"""
+
+import numpy as np
+
+from report_grid import get_task_description, translate_status_title
+
+# 可以返回的字段
+QUERY_FIELDS = ["city", "task_id", "template_id", "subject", "parent_id", "parent_subject",
+                "status", "updated_at", "description"]
+# 未指定 fields 时返回的字段，描述较大，需要时显式请求
+DEFAULT_FIELDS = ["city", "task_id", "template_id", "subject", "parent_id", "status"]
+# 查询参数名，请求中包含任意一个时使用查询接口
+QUERY_PARAMS = ("city", "status", "parent", "fields", "limit", "cursor")
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+class QueryError(Exception):
+    """查询参数无效"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _split_values(values):
+    """合并重复参数和逗号分隔的参数值"""
+    result = []
+    for value in values or []:
+        result.extend(part.strip() for part in value.split(",") if part.strip())
+    return result
+
+
+class ReportQueryIndex:
+    """报表表格的查询索引，每个快照构建一次
+
+    单元格按"城市行 × 任务列"展平编号，状态索引保存每个状态的已排序单元格编号，
+    父任务索引保存每个模板分组包含的列。
+
+    Args:
+        grid: 报表表格
+        snapshot_hash: 快照哈希，写入分页游标，快照变化后旧游标失效
+    """
+
+    def __init__(self, grid, snapshot_hash=""):
+        self.grid = grid
+        self.snapshot_hash = snapshot_hash
+        self.city_rows = {name: row for row, name in enumerate(grid.city_names)}
+
+        flat_status = grid.status.ravel()
+        order = np.argsort(flat_status, kind="stable")
+        sorted_status = flat_status[order]
+        self.status_cells = {}
+        for index, label in enumerate(grid.status_labels):
+            lo, hi = np.searchsorted(sorted_status, [index, index + 1])
+            if hi > lo:
+                self.status_cells[label] = order[lo:hi]
+
+        self.parent_columns = {}
+        for col, (_, _, group_index) in enumerate(grid.columns):
+            group_id = grid.groups[group_index][0]
+            self.parent_columns.setdefault(group_id, []).append(col)
+
+    def _cursor(self, position):
+        return f"{self.snapshot_hash[:12]}.{position}"
+
+    def _parse_cursor(self, cursor):
+        prefix, _, position = cursor.rpartition(".")
+        if prefix != self.snapshot_hash[:12]:
+            raise QueryError("报表数据已更新，分页游标失效，请从第一页重新查询", 409)
+        try:
+            return max(int(position), 0)
+        except ValueError:
+            raise QueryError("无效的分页游标")
+
+    def matching_cells(self, cities=None, statuses=None, parents=None):
+        """返回满足条件的单元格编号（升序）"""
+        grid = self.grid
+        rows, cols = grid.status.shape
+
+        row_mask = np.ones(rows, dtype=bool)
+        if cities:
+            row_mask[:] = False
+            row_mask[[self.city_rows[name] for name in cities if name in self.city_rows]] = True
+
+        col_mask = np.ones(cols, dtype=bool)
+        if parents:
+            col_mask[:] = False
+            for parent_id in parents:
+                col_mask[self.parent_columns.get(parent_id, [])] = True
+
+        if statuses:
+            labels = {translate_status_title(status) for status in statuses}
+            postings = [self.status_cells[label] for label in labels if label in self.status_cells]
+            if not postings:
+                return np.zeros(0, dtype=np.int64)
+            cells = np.sort(np.concatenate(postings))
+            return cells[row_mask[cells // cols] & col_mask[cells % cols]]
+
+        return np.flatnonzero(np.outer(row_mask, col_mask).ravel())
+
+    def run(self, params):
+        """执行查询
+
+        Args:
+            params: parse_qs 解析的查询参数
+
+        Returns:
+            dict: 字段列表、按行排列的结果、匹配总数和下一页游标
+
+        Raises:
+            QueryError: 参数无效或游标失效
+        """
+        fields = _split_values(params.get("fields")) or DEFAULT_FIELDS
+        unknown = [field for field in fields if field not in QUERY_FIELDS]
+        if unknown:
+            raise QueryError(f"未知的字段: {', '.join(unknown)}，可用字段: {', '.join(QUERY_FIELDS)}")
+        try:
+            parents = [int(value) for value in _split_values(params.get("parent"))]
+            limit = int(params.get("limit", [DEFAULT_LIMIT])[0])
+        except ValueError:
+            raise QueryError("parent 和 limit 必须是整数")
+        limit = min(max(limit, 1), MAX_LIMIT)
+        cursor = params.get("cursor", [""])[0]
+        offset = self._parse_cursor(cursor) if cursor else 0
+
+        cells = self.matching_cells(_split_values(params.get("city")), _split_values(params.get("status")), parents)
+        page = cells[offset:offset + limit]
+
+        grid = self.grid
+        cols = grid.status.shape[1]
+        page_rows = (page // cols).tolist()
+        page_cols = (page % cols).tolist()
+        task_ids = grid.task_ids.ravel()[page].tolist()
+        statuses = grid.status.ravel()[page].tolist()
+
+        rows = []
+        for row, col, task_id, status in zip(page_rows, page_cols, task_ids, statuses):
+            template_id, subject, group_index = grid.columns[col]
+            task = grid.tasks.get(task_id) if task_id else None
+            values = {
+                "city": grid.city_names[row],
+                "task_id": task_id or None,
+                "template_id": template_id,
+                "subject": subject,
+                "parent_id": grid.groups[group_index][0],
+                "parent_subject": grid.groups[group_index][1],
+                "status": grid.status_labels[status],
+            }
+            if "updated_at" in fields:
+                values["updated_at"] = task.get("updatedAt", "") if task else ""
+            if "description" in fields:
+                values["description"] = get_task_description(task) if task else ""
+            rows.append([values[field] for field in fields])
+
+        next_offset = offset + len(page)
+        return {
+            "fields": fields,
+            "rows": rows,
+            "total": int(len(cells)),
+            "next_cursor": self._cursor(next_offset) if next_offset < len(cells) else None,
+        }
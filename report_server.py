@@ -15,132 +15,948 @@ if not _HAS_PYQT:
 
 # 继续导入其他模块
 import json
+import math
 import time
 from datetime import datetime  # 修改为直接导入datetime类，而不是整个模块
-import uuid
 import threading
-import queue
 import mimetypes
-import random
 import re
-import csv
-import io
-import zipfile
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import traceback
+import hashlib
+import hmac
+import html
+import concurrent.futures
+from email.utils import formatdate, parsedate_to_datetime
+from report_matrix import StatusMatrix, CityIndex, build_tasks_tree
+from report_http import ChunkedResponseWriter, accepts_gzip, gzip_bytes
+from report_grid import ReportGrid, get_task_description, MISSING_LABEL
+from report_export import iter_csv, iter_xlsx, iter_city_zip
+from report_engine import report_engine
+from project_snapshot import project_snapshots, has_complete_status
+from report_jobs import ReportJobManager
+from report_artifacts import ArtifactStore, ARTIFACT_DIR, file_etag, project_key
+from report_history import report_history, HISTORY_LABELS
+from report_query import ReportQueryIndex, QueryError, QUERY_PARAMS
+from report_dashboard import dashboard_service
+from report_fragments import fragment_cache, header_key, row_key
+from report_timing import (start_timer, current_timer, stop_timer, timed_stage, SamplingProfiler,
+                           format_profile)
 
-# 创建全局进度消息队列，用于存储加载进度信息
-progress_queues = {}
+# 报表任务管理器：同一项目的并发请求共用一个任务，最多同时执行两个任务
+report_jobs = ReportJobManager(max_workers=2, job_ttl=60)
+# 任务ID -> 任务，任务对象提供put方法，用于写入加载进度信息
+progress_queues = report_jobs.jobs
+# 报表服务器只统计第一个项目，所有报表请求使用同一个去重键
+REPORT_JOB_KEY = "default_project"
 # 添加报表数据缓存，避免重复生成
-report_data_cache = {"data": None, "timestamp": None}
+report_data_cache = {"data": None, "timestamp": None, "matrix": None, "grid": None, "query_index": None}
+# 缓存超过该时间（秒）后刷新；增量刷新只需一次小请求，因此间隔可以较短
+REPORT_REFRESH_INTERVAL = 60
+# 预生成的报表静态文件，通过 /reports/ 路径提供
+artifact_store = ArtifactStore(ARTIFACT_DIR)
+# /debug/profile 的访问令牌，未设置时只允许本机访问
+DEBUG_TOKEN = os.getenv('REPORT_DEBUG_TOKEN', '')
+# 同一时间只运行一个采样分析
+profile_lock = threading.Lock()
+# 报表页面等待数据的最长时间（秒），超过后先显示已有的数据，其余在后台继续获取
+REPORT_PAGE_DEADLINE = 3
+# 后台刷新报表缓存，同一时间只执行一次刷新
+report_refresh_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-refresh")
+report_refresh = {"future": None}
+report_refresh_lock = threading.Lock()
+# 最近一次生成报表使用的项目和城市列表，生成部分报表时使用
+report_inputs = {"project": None, "cities": None}
+
+def compute_snapshot_hash(report_data, grid):
+    """计算报表快照的内容哈希，表格单元格、统计数据或任务更新时间变化时哈希随之变化"""
+    digest = hashlib.sha1()
+    summary = {
+        "project": [report_data['project'].get('id'), report_data['project'].get('name')],
+        "all_tasks_count": report_data.get('all_tasks_count', 0),
+        "city_statistics": report_data.get('city_statistics', {}),
+        "status_labels": grid.status_labels,
+        "groups": grid.groups,
+        "columns": grid.columns,
+        "cities": grid.city_names,
+    }
+    digest.update(json.dumps(summary, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    digest.update(grid.task_ids.tobytes())
+    digest.update(grid.status.tobytes())
+    # 描述等不在单元格中的字段通过更新时间体现
+    for task_id in sorted(grid.tasks):
+        digest.update(f"{task_id}:{grid.tasks[task_id].get('updatedAt', '')};".encode('utf-8'))
+    return digest.hexdigest()
+
+def stamp_report_data(report_data, grid, previous=None):
+    """在报表数据中写入快照哈希和生成时间
+    
+    内容与上一份快照相同时沿用原来的生成时间，这样浏览器的条件请求在数据没有变化时仍能得到304。
+    
+    Args:
+        report_data: 报表数据
+        grid: 对应的报表表格
+        previous: 上一份快照的报表数据或静态文件清单，包含 snapshot_hash 和 snapshot_time
+    """
+    snapshot_hash = compute_snapshot_hash(report_data, grid)
+    if previous is not None and previous.get('snapshot_hash') == snapshot_hash:
+        snapshot_time = previous['snapshot_time']
+    else:
+        snapshot_time = time.time()
+    report_data['snapshot_hash'] = snapshot_hash
+    report_data['snapshot_time'] = snapshot_time
+    report_data['generated_at'] = datetime.fromtimestamp(snapshot_time).strftime('%Y-%m-%d %H:%M:%S')
+
+def record_report_history(report_data):
+    """把报表的城市统计追加到项目历史，写入失败不影响报表本身"""
+    try:
+        report_history.append(project_key(report_data['project']), report_data.get('city_statistics', {}))
+    except Exception as e:
+        print(f"写入报表历史时出错: {str(e)}")
+
+def update_report_cache(report_data, status_matrix):
+    """保存报表数据、状态矩阵和报表表格到缓存，并写入快照哈希和生成时间"""
+    now = time.time()
+    with timed_stage("snapshot"):
+        grid = ReportGrid.build(report_data)
+        stamp_report_data(report_data, grid, report_data_cache["data"])
+    with timed_stage("history"):
+        record_report_history(report_data)
+    
+    report_data_cache["grid"] = grid
+    # 查询索引在第一次查询时构建
+    report_data_cache["query_index"] = None
+    report_data_cache["data"] = report_data
+    report_data_cache["matrix"] = status_matrix
+    report_data_cache["timestamp"] = now
+
+def start_report_refresh():
+    """在后台线程中刷新报表缓存，已有刷新正在进行时返回它的Future"""
+    with report_refresh_lock:
+        future = report_refresh["future"]
+        if future is None or future.done():
+            future = report_refresh_executor.submit(HeadlessReportHandler().get_report_data)
+            report_refresh["future"] = future
+        return future
+
+def format_age(seconds):
+    """把秒数格式化为 N 小时、N 分钟或 N 秒"""
+    if seconds >= 3600:
+        return f"{int(seconds // 3600)} 小时"
+    if seconds >= 60:
+        return f"{int(seconds // 60)} 分钟"
+    return f"{int(seconds)} 秒"
 
 class ReportHandler(BaseHTTPRequestHandler):
+    # 使用HTTP/1.1以支持分块传输编码，非流式响应均带Content-Length
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self):
-        if self.path == '/':
+        # 每个请求在处理线程中单独计时，各阶段耗时通过 Server-Timing 响应头返回
+        start_timer()
+        try:
+            self.route_get()
+        finally:
+            stop_timer()
+
+    def route_get(self):
+        path = urlparse(self.path).path
+        if path == '/':
             # 返回加载页面，显示进度条
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            
-            # 生成带有进度条的加载页面
-            loading_page = self.generate_loading_page()
-            self.wfile.write(loading_page.encode())
-        elif self.path.startswith('/api/progress/'):
+            self.send_bytes(self.generate_loading_page(), 'text/html; charset=utf-8')
+        elif path.startswith('/api/progress/'):
             # 提取进度ID
-            progress_id = self.path.split('/')[-1]
+            progress_id = path.split('/')[-1]
             
-            if progress_id in progress_queues:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                
-                # 尝试从队列获取进度更新
-                try:
-                    progress_data = progress_queues[progress_id].get(block=False)
-                    self.wfile.write(json.dumps(progress_data).encode())
-                except queue.Empty:
-                    # 没有新进度时，返回空结果
-                    self.wfile.write(json.dumps({"status": "waiting"}).encode())
+            # 读取该订阅者的下一条进度，没有新进度时返回waiting
+            progress_data = report_jobs.next_message(progress_id)
+            if progress_data is not None:
+                self.send_json(progress_data)
             else:
                 self.send_error(404)
-        elif self.path == '/api/report':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+        elif path == '/api/report':
+            # 提交后台任务，已有正在执行的任务时直接订阅其进度
+            progress_id, job, created = report_jobs.submit(REPORT_JOB_KEY, self.background_report_generation)
+            
+            # 在响应中包含订阅ID，客户端用它轮询进度
+            self.send_json({"progress_id": progress_id, "job_id": job.id, "shared": not created})
+        elif path == '/api/report_data':
+            # 紧凑的列式数据，供表格页面使用，不包含HAL对象和任务描述；
+            # 带有 city/status/parent/fields/limit/cursor 参数时只返回匹配的单元格
+            report_data = self.get_report_data()
+            query = parse_qs(urlparse(self.path).query)
+            if "error" in report_data:
+                self.send_json(report_data)
+            elif self.send_not_modified(report_data):
+                pass
+            elif any(name in query for name in QUERY_PARAMS):
+                self.send_report_query(report_data, query)
+            else:
+                self.send_json(self.build_compact_report(report_data), compress=True,
+                               headers=self.snapshot_headers(report_data))
+        elif path.startswith('/api/task/'):
+            # 单个任务的悬浮提示信息，表格页面按需获取
+            self.send_task_detail(path.split('/')[-1])
+        elif path in ('/api/report.csv', '/api/report.xlsx', '/api/report_by_city.zip'):
+            # 服务端根据缓存快照逐行生成导出文件
+            self.send_report_export(path)
+        elif path == '/api/dashboard':
+            # 全部项目的完成情况摘要，过期的项目在后台重新计算，先返回已有结果
+            query = parse_qs(urlparse(self.path).query)
+            dashboard_service.refresh(force=query.get('refresh', ['0'])[0] == '1')
+            self.send_json(self.build_dashboard_data(), compress=True, headers={'Cache-Control': 'no-store'})
+        elif path == '/dashboard':
+            # 全省汇总看板页面，轮询 /api/dashboard 直到所有项目完成
+            self.send_bytes(self.generate_dashboard_page(), 'text/html; charset=utf-8', compress=True)
+        elif path == '/api/history':
+            # 城市统计的历史数据，支持 days、points 和 city 参数
+            self.send_json(self.query_history(parse_qs(urlparse(self.path).query)), compress=True)
+        elif path == '/report_trend':
+            # 各城市完成率趋势页面，图表在服务端生成为SVG
+            history = self.query_history(parse_qs(urlparse(self.path).query))
+            self.send_bytes(self.generate_trend_page(history), 'text/html; charset=utf-8', compress=True)
+        elif path == '/report_grid':
+            # 虚拟滚动的表格页面，数据通过 /api/report_data 获取
+            self.send_bytes(self.generate_grid_page(), 'text/html; charset=utf-8', compress=True)
+        elif path == '/report_page':
+            # 标准版本不显示任务ID，数据在限定时间内没有准备好时先显示旧数据或部分数据
+            self.send_report_page(show_task_ids=False)
+        elif path == '/debug_report_page':
+            # 调试版本的报表页面，显示任务ID
+            self.send_report_page(show_task_ids=True)
+        elif path.startswith('/reports/'):
+            # 预生成的静态报表，直接从磁盘发送，不访问OpenProject
+            self.send_artifact(path[len('/reports/'):])
+        elif path == '/debug/profile':
+            # 对报表服务采样一段时间，返回耗时最多的函数
+            self.send_profile(parse_qs(urlparse(self.path).query))
+        elif path == '/favicon.ico':
+            # 处理浏览器自动请求favicon的情况
+            self.send_response(204)  # No Content
             self.end_headers()
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path.startswith('/api/report/cancel/'):
+            # 客户端离开或主动取消，任务没有其他订阅者时停止
+            progress_id = path.split('/')[-1]
+            if report_jobs.unsubscribe(progress_id):
+                self.send_json({"status": "cancelled"})
+            else:
+                self.send_error(404)
+        else:
+            self.send_error(404)
+
+    def send_report_page(self, show_task_ids=False):
+        """发送报表页面
+        
+        等待报表数据的时间不超过 deadline 参数（默认 REPORT_PAGE_DEADLINE 秒），
+        超时后显示旧数据或部分数据并定时重新加载，还没有任何数据时显示加载进度页面。
+        """
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            deadline = min(max(float(query.get('deadline', [REPORT_PAGE_DEADLINE])[0]), 0.5), 30)
+        except ValueError:
+            deadline = REPORT_PAGE_DEADLINE
+        
+        report_data = self.get_report_data_within(deadline)
+        if report_data is None:
+            self.send_bytes(self.generate_loading_page(), 'text/html; charset=utf-8',
+                            headers={'Cache-Control': 'no-store'})
+        elif 'stale' in report_data or 'partial' in report_data:
+            # 旧数据和部分数据不参与缓存校验
+            self.send_stream(self.iter_html(report_data, show_task_ids), 'text/html; charset=utf-8',
+                             headers={'Cache-Control': 'no-store'})
+        elif not self.send_not_modified(report_data):
+            self.send_stream(self.iter_html(report_data, show_task_ids), 'text/html; charset=utf-8',
+                             headers=self.snapshot_headers(report_data))
+
+    def send_bytes(self, body, content_type, status=200, compress=False, headers=None):
+        """发送带Content-Length的完整响应
+        
+        Args:
+            body: 响应体（str或bytes）
+            content_type: 响应内容类型
+            status: HTTP状态码
+            compress: 客户端支持且响应体较大时使用gzip压缩
+            headers: 额外的响应头字典
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        use_gzip = compress and len(body) > 1024 and accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        if use_gzip:
+            body = gzip_bytes(body)
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        if compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        timer = current_timer()
+        if timer is not None and timer.stages:
+            self.send_header('Server-Timing', timer.header_value())
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200, compress=False, headers=None):
+        """发送JSON响应"""
+        with timed_stage("json"):
+            body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        self.send_bytes(body, 'application/json; charset=utf-8', status, compress, headers)
+
+    def snapshot_headers(self, report_data):
+        """生成报表快照的缓存校验响应头，浏览器每次使用前都需要重新校验"""
+        if 'snapshot_hash' not in report_data:
+            return {'Cache-Control': 'no-store'}
+        return {
+            # 同一快照的gzip和非压缩版本字节不同，因此使用弱ETag
+            'ETag': f'W/"{report_data["snapshot_hash"]}"',
+            'Last-Modified': formatdate(report_data['snapshot_time'], usegmt=True),
+            'Cache-Control': 'no-cache',
+        }
+
+    def send_not_modified(self, report_data):
+        """条件请求命中当前快照时发送304
+        
+        If-None-Match 优先于 If-Modified-Since，与HTTP规范一致。
+        
+        Args:
+            report_data: 当前的报表数据
             
-            # 创建一个进度ID和队列
-            progress_id = str(uuid.uuid4())
-            progress_queues[progress_id] = queue.Queue()
-            
-            # 在响应中包含进度ID
-            self.wfile.write(json.dumps({"progress_id": progress_id}).encode())
-            
-            # 在后台启动数据生成任务
-            threading.Thread(target=self.background_report_generation, args=(progress_id,)).start()
-        elif self.path == '/api/report_data':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
+        Returns:
+            bool: 已发送304时返回True，调用方不再发送响应体
+        """
+        if 'snapshot_hash' not in report_data:
+            return False
+        if not self.validators_match(report_data['snapshot_hash'], report_data['snapshot_time']):
+            return False
+        
+        self.send_response(304)
+        self.send_header('Vary', 'Accept-Encoding')
+        for name, value in self.snapshot_headers(report_data).items():
+            self.send_header(name, value)
+        self.end_headers()
+        return True
+
+    def validators_match(self, etag_value, modified_time):
+        """请求的条件头是否与当前资源一致
+        
+        Args:
+            etag_value: 不带引号和W/前缀的ETag值
+            modified_time: 资源修改时间（time.time()格式）
             
-            report_data = self.get_report_data()
-            self.wfile.write(json.dumps(report_data).encode())
-        elif self.path == '/report_page':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
+        Returns:
+            bool: 客户端缓存仍然有效时返回True
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return any(tag == '*' or tag.replace('W/', '', 1).strip('"') == etag_value for tag in tags)
+        
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if not if_modified_since:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP日期精确到秒
+        return int(modified_time) <= since
+
+    def send_artifact(self, relative_path):
+        """从静态文件目录发送预生成的报表文件
+        
+        存在gzip版本且客户端支持时发送压缩文件；文件内容通过 socket.sendfile 发送，
+        支持的平台上由内核直接复制，不经过Python缓冲区。
+        
+        Args:
+            relative_path: 相对于静态文件目录的路径
+        """
+        if not relative_path or relative_path.endswith('/'):
+            relative_path += 'index.json'
+        path = artifact_store.resolve(relative_path)
+        if path is None or path.endswith('.gz'):
+            self.send_error(404)
+            return
+        
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/json':
+            content_type += '; charset=utf-8'
+        use_gzip = os.path.isfile(path + '.gz') and accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        
+        try:
+            f = open(path + '.gz' if use_gzip else path, 'rb')
+        except OSError:
+            self.send_error(404)
+            return
+        with f:
+            stat_result = os.fstat(f.fileno())
+            etag = file_etag(stat_result, 'gzip' if use_gzip else '')
+            headers = {
+                'ETag': etag,
+                'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True),
+                'Cache-Control': 'no-cache',
+                'Vary': 'Accept-Encoding',
+            }
             
-            # 优先使用缓存数据
-            if report_data_cache["data"] is not None and report_data_cache["timestamp"] is not None:
-                current_time = time.time()
-                cache_age = current_time - report_data_cache["timestamp"]
-                # 如果缓存存在且不超过5分钟，则使用缓存数据
-                if cache_age < 300:  # 5分钟 = 300秒
-                    print(f"使用缓存数据，缓存年龄: {cache_age:.1f}秒")
-                    report_data = report_data_cache["data"]
-                else:
-                    print(f"缓存数据已过期({cache_age:.1f}秒)，重新获取数据")
-                    report_data = self.get_report_data()
-            else:
-                print("无缓存数据，获取新数据")
-                report_data = self.get_report_data()
+            if self.validators_match(etag.strip('"'), stat_result.st_mtime):
+                self.send_response(304)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                return
             
-            # 生成HTML内容 - 标准版本不显示任务ID
-            html_content = self.generate_html(report_data, show_task_ids=False)
-            self.wfile.write(html_content.encode())
-        elif self.path == '/debug_report_page':
-            # 调试版本的报表页面，显示任务ID
             self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+            self.send_header('Content-type', content_type)
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(stat_result.st_size))
             self.end_headers()
+            try:
+                self.wfile.flush()
+                self.connection.sendfile(f, 0, stat_result.st_size)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+    def send_report_export(self, path):
+        """发送CSV、XLSX或按城市打包的ZIP导出文件
+        
+        文件内容由缓存快照的报表表格逐行生成并以分块传输发送，内存占用与表格大小无关。
+        
+        Args:
+            path: 请求路径，决定导出格式
+        """
+        report_data = self.get_report_data()
+        if "error" in report_data:
+            self.send_json(report_data, 500)
+            return
+        if self.send_not_modified(report_data):
+            return
+        
+        grid = self.get_report_grid(report_data)
+        generated = datetime.fromtimestamp(report_data.get('snapshot_time', time.time())).strftime('%Y%m%d_%H%M%S')
+        base_name = f"report_{report_data['project'].get('id', '')}_{generated}"
+        
+        if path.endswith('.csv'):
+            fragments = iter_csv(grid)
+            content_type = 'text/csv; charset=utf-8'
+            file_name = f"{base_name}.csv"
+            compress = True
+        elif path.endswith('.xlsx'):
+            fragments = iter_xlsx(grid, report_data.get('city_statistics', {}))
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            file_name = f"{base_name}.xlsx"
+            compress = False
+        else:
+            fragments = iter_city_zip(grid)
+            content_type = 'application/zip'
+            file_name = f"{base_name}_by_city.zip"
+            compress = False
+        
+        headers = self.snapshot_headers(report_data)
+        headers['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        print(f"导出报表: {file_name}")
+        self.send_stream(fragments, content_type, headers=headers, compress=compress)
+
+    def get_report_grid(self, report_data):
+        """获取报表表格，报表数据来自缓存时直接复用缓存中的表格"""
+        if report_data is report_data_cache["data"] and report_data_cache["grid"] is not None:
+            return report_data_cache["grid"]
+        return ReportGrid.build(report_data)
+
+    def get_query_index(self, report_data):
+        """获取报表的查询索引，报表数据来自缓存时复用缓存中的索引"""
+        if report_data is report_data_cache["data"]:
+            index = report_data_cache["query_index"]
+            if index is None:
+                index = ReportQueryIndex(self.get_report_grid(report_data), report_data.get('snapshot_hash', ''))
+                report_data_cache["query_index"] = index
+            return index
+        return ReportQueryIndex(self.get_report_grid(report_data), report_data.get('snapshot_hash', ''))
+
+    def send_report_query(self, report_data, query):
+        """按查询参数返回过滤、投影和分页后的报表单元格"""
+        try:
+            result = self.get_query_index(report_data).run(query)
+        except QueryError as e:
+            self.send_json({"error": str(e)}, e.status)
+            return
+        result.update({
+            "project": {"id": report_data['project'].get('id'), "name": report_data['project'].get('name', '')},
+            "generated_at": report_data.get('generated_at', ''),
+            "snapshot_hash": report_data.get('snapshot_hash', ''),
+        })
+        self.send_json(result, compress=True, headers=self.snapshot_headers(report_data))
+
+    def build_compact_report(self, report_data, grid=None):
+        """构建紧凑的列式报表数据
+        
+        单元格按城市逐行展平为 task_ids 和 status 两个整数数组，
+        status 是 status_labels 的下标，任务标题通过 subjects 字典编码。
+        
+        Args:
+            report_data: build_report_data 生成的报表数据
+            grid: 已构建的报表表格，默认从缓存获取或重新构建
             
-            # 优先使用缓存数据
-            if report_data_cache["data"] is not None and report_data_cache["timestamp"] is not None:
-                current_time = time.time()
-                cache_age = current_time - report_data_cache["timestamp"]
-                # 如果缓存存在且不超过5分钟，则使用缓存数据
-                if cache_age < 300:  # 5分钟 = 300秒
-                    print(f"调试模式：使用缓存数据，缓存年龄: {cache_age:.1f}秒")
-                    report_data = report_data_cache["data"]
-                else:
-                    print(f"调试模式：缓存数据已过期({cache_age:.1f}秒)，重新获取数据")
-                    report_data = self.get_report_data()
+        Returns:
+            dict: 可直接序列化为JSON的紧凑数据
+        """
+        if grid is None:
+            grid = self.get_report_grid(report_data)
+        compact = {
+            "version": 1,
+            "project": {
+                "id": report_data['project'].get('id'),
+                "name": report_data['project'].get('name', ''),
+            },
+            "all_tasks_count": report_data.get('all_tasks_count', 0),
+            "generated_at": report_data.get('generated_at', ''),
+            "snapshot_hash": report_data.get('snapshot_hash', ''),
+        }
+        compact.update(grid.to_compact())
+        
+        # 城市统计同样按列存储，顺序与 cities 一致
+        statistics = report_data.get('city_statistics', {})
+        stat_labels = ["未开始", "进行中", "已完成", "挂起", "拒绝", "总计"]
+        compact["statistics"] = {
+            "labels": stat_labels,
+            "counts": [[statistics.get(city, {}).get(label, 0) for label in stat_labels]
+                       for city in grid.city_names],
+        }
+        return compact
+
+    def build_dashboard_data(self):
+        """看板数据，为每个项目加上报表链接：优先使用静态报表，其次是在线报表"""
+        data = dashboard_service.snapshot()
+        live_data = report_data_cache["data"]
+        live_project_id = live_data['project'].get('id') if live_data else None
+        for item in data["projects"]:
+            if artifact_store.read_manifest(item["key"]):
+                item["report_url"] = f"/reports/{item['key']}/report.html"
+            elif item["id"] == live_project_id:
+                item["report_url"] = "/report_page"
             else:
-                print("调试模式：无缓存数据，获取新数据")
-                report_data = self.get_report_data()
+                item["report_url"] = None
+        return data
+
+    def generate_dashboard_page(self):
+        """生成全省汇总看板页面
+        
+        页面加载后轮询 /api/dashboard，已完成的项目立即显示，未完成的项目显示为计算中；
+        点击项目行展开各城市的统计。
+        """
+        return """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>全省任务完成情况</title>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <style>
+                body { font-family: 'PingFang SC', 'Microsoft YaHei', 'Helvetica Neue', Arial, sans-serif; margin: 0; background-color: #f5f7fa; color: #333; font-size: 13px; }
+                .toolbar { display: flex; align-items: center; gap: 15px; height: 56px; padding: 0 20px; background-color: #fff; border-bottom: 1px solid #ebeef5; }
+                .toolbar h1 { font-size: 18px; margin: 0; }
+                .toolbar .info { color: #606266; flex: 1; }
+                .toolbar a { color: #409eff; text-decoration: none; }
+                .summary { display: flex; gap: 12px; margin: 20px; }
+                .stat { flex: 1; padding: 15px; background-color: #fff; border-radius: 4px; text-align: center; }
+                .stat .value { font-size: 24px; font-weight: bold; color: #409eff; }
+                table { width: calc(100% - 40px); margin: 0 20px 20px; border-collapse: collapse; background-color: #fff; }
+                th, td { padding: 8px 10px; border-bottom: 1px solid #ebeef5; text-align: right; }
+                th:first-child, td:first-child { text-align: left; }
+                th { background-color: #f5f7fa; }
+                tr.project { cursor: pointer; }
+                tr.project:hover { background-color: #ecf5ff; }
+                tr.city td { color: #606266; background-color: #fafafa; }
+                tr.city td:first-child { padding-left: 30px; }
+                .bar { display: inline-block; width: 100px; height: 8px; margin-right: 6px; background-color: #ebeef5; border-radius: 4px; overflow: hidden; vertical-align: middle; }
+                .bar span { display: block; height: 100%; background-color: #67c23a; }
+                .pending { color: #e6a23c; }
+                .error { color: #f56c6c; }
+            </style>
+        </head>
+        <body>
+            <div class="toolbar">
+                <h1>全省任务完成情况</h1>
+                <span class="info" id="info">正在加载...</span>
+                <a href="/api/dashboard?refresh=1" onclick="refreshAll(); return false;">重新计算</a>
+                <a href="/report_page">标准报表</a>
+            </div>
+            <div class="summary" id="summary"></div>
+            <table>
+                <thead id="head"></thead>
+                <tbody id="body"></tbody>
+            </table>
             
-            # 生成HTML内容 - 调试版本显示任务ID
-            html_content = self.generate_html(report_data, show_task_ids=True)
-            self.wfile.write(html_content.encode())
-        elif self.path == '/favicon.ico':
-            # 处理浏览器自动请求favicon的情况
-            self.send_response(204)  # No Content
-            self.end_headers()
+            <script>
+                const expanded = new Set();
+                let latest = null;
+                
+                function escapeHtml(text) {
+                    return String(text).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+                }
+                
+                function rate(counts) {
+                    return counts['总计'] ? Math.round(counts['已完成'] * 1000 / counts['总计']) / 10 : 0;
+                }
+                
+                function rateCell(counts) {
+                    const value = rate(counts);
+                    return '<td><span class="bar"><span style="width:' + value + '%"></span></span>' + value + '%</td>';
+                }
+                
+                function countCells(labels, counts) {
+                    return labels.map(label => '<td>' + (counts[label] || 0) + '</td>').join('');
+                }
+                
+                function render(data) {
+                    latest = data;
+                    const pending = data.projects.filter(p => p.state === 'pending').length;
+                    document.getElementById('info').textContent = data.complete
+                        ? '共 ' + data.projects.length + ' 个项目'
+                        : '已完成 ' + data.ready + ' / ' + data.projects.length + ' 个项目，' + pending + ' 个计算中...';
+                    document.getElementById('summary').innerHTML =
+                        '<div class="stat"><div class="value">' + rate(data.totals) + '%</div>总体完成率</div>' +
+                        '<div class="stat"><div class="value">' + data.totals['已完成'] + '</div>已完成任务</div>' +
+                        '<div class="stat"><div class="value">' + data.totals['总计'] + '</div>任务总数</div>' +
+                        '<div class="stat"><div class="value">' + data.cities.length + '</div>城市</div>';
+                    document.getElementById('head').innerHTML = '<tr><th>项目 / 城市</th><th>完成率</th>' +
+                        data.labels.map(label => '<th>' + label + '</th>').join('') + '<th>报表</th></tr>';
+                    
+                    const rows = [];
+                    for (const project of data.projects) {
+                        const summary = project.summary;
+                        const link = project.report_url ? '<a href="' + project.report_url + '" onclick="event.stopPropagation()">查看</a>' : '';
+                        let cells;
+                        if (summary) {
+                            cells = rateCell(summary.totals) + countCells(data.labels, summary.totals);
+                        } else if (project.state === 'error') {
+                            cells = '<td class="error" colspan="' + (data.labels.length + 1) + '">' + escapeHtml(project.error || '计算失败') + '</td>';
+                        } else {
+                            cells = '<td class="pending" colspan="' + (data.labels.length + 1) + '">计算中...</td>';
+                        }
+                        const marker = project.state === 'pending' && summary ? ' <span class="pending">(更新中)</span>' : '';
+                        rows.push('<tr class="project" data-id="' + project.id + '"><td>' +
+                            (expanded.has(project.id) ? '▾ ' : '▸ ') + escapeHtml(project.name) + marker + '</td>' + cells + '<td>' + link + '</td></tr>');
+                        if (summary && expanded.has(project.id)) {
+                            for (const city of summary.cities) {
+                                rows.push('<tr class="city"><td>' + escapeHtml(city.name) + '</td>' + rateCell(city.counts) +
+                                    countCells(data.labels, city.counts) + '<td></td></tr>');
+                            }
+                        }
+                    }
+                    document.getElementById('body').innerHTML = rows.join('');
+                }
+                
+                document.getElementById('body').addEventListener('click', event => {
+                    const row = event.target.closest('tr.project');
+                    if (!row) return;
+                    const id = Number(row.dataset.id);
+                    expanded.has(id) ? expanded.delete(id) : expanded.add(id);
+                    if (latest) render(latest);
+                });
+                
+                function load(refresh) {
+                    fetch('/api/dashboard' + (refresh ? '?refresh=1' : ''))
+                        .then(response => response.json())
+                        .then(data => {
+                            render(data);
+                            // 还有项目在计算时继续轮询，已完成的项目先显示
+                            if (!data.complete) setTimeout(() => load(false), 2000);
+                        })
+                        .catch(error => {
+                            document.getElementById('info').textContent = '加载失败：' + error.message;
+                            setTimeout(() => load(false), 5000);
+                        });
+                }
+                
+                function refreshAll() {
+                    load(true);
+                }
+                
+                load(false);
+            </script>
+        </body>
+        </html>
+        """
+
+    def query_history(self, query):
+        """按查询参数读取当前报表项目的城市统计历史
+        
+        Args:
+            query: parse_qs 解析的查询参数，days 为最近天数（0表示全部，默认30），
+                   points 为最大采样点数（不超过 report_history.MAX_POINTS），city 可以重复指定多个城市
+                   
+        Returns:
+            dict: report_history.query 的结果，另外包含 project 和 days
+        """
+        report_data = report_data_cache["data"]
+        if report_data is None:
+            report_data = self.get_report_data()
+            if "error" in report_data:
+                return report_data
+        
+        try:
+            days = float(query.get('days', ['30'])[0])
+            points = int(query.get('points', ['200'])[0])
+        except ValueError:
+            days, points = 30, 200
+        if not math.isfinite(days):
+            return {"error": f"无效的天数: {query['days'][0]}"}
+        end = time.time()
+        start = end - days * 86400 if days > 0 else None
+        cities = set(query['city']) if query.get('city') else None
+        
+        history = report_history.query(project_key(report_data['project']), start, end, points, cities)
+        history["project"] = report_data['project'].get('name', '')
+        history["days"] = days
+        return history
+
+    def generate_trend_page(self, history):
+        """生成完成率趋势页面
+        
+        上方为全部城市合计的完成率曲线，下方每个城市一张小图，完成率为已完成数量除以总计。
+        """
+        if "error" in history:
+            return f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>完成率趋势</title></head><body><p>{history['error']}</p></body></html>"
+        
+        done_index = HISTORY_LABELS.index("已完成")
+        total_index = HISTORY_LABELS.index("总计")
+        times = history["times"]
+        
+        def rates(city_counts):
+            return [round(point[done_index] * 100 / point[total_index], 1) if point[total_index] else None
+                    for point in city_counts]
+        
+        def polyline(values, width, height, color, stroke_width):
+            if len(times) < 2:
+                return ""
+            span = times[-1] - times[0] or 1
+            coords = [f"{(t - times[0]) * width / span:.1f},{height - value * height / 100:.1f}"
+                      for t, value in zip(times, values) if value is not None]
+            if not coords:
+                return ""
+            return (f'<polyline fill="none" stroke="{color}" stroke-width="{stroke_width}" '
+                    f'points="{" ".join(coords)}"/>')
+        
+        def fmt(timestamp):
+            return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+        
+        overall_counts = [[sum(city[i][j] for city in history["counts"]) for j in range(len(HISTORY_LABELS))]
+                          for i in range(len(times))]
+        overall = rates(overall_counts)
+        grid_lines = "".join(
+            f'<line x1="0" x2="900" y1="{y}" y2="{y}" stroke="#ebeef5"/>'
+            f'<text x="-6" y="{y + 4}" text-anchor="end">{100 - y // 3}%</text>'
+            for y in range(0, 301, 75))
+        
+        cards = []
+        for name, city_counts in zip(history["cities"], history["counts"]):
+            city_rates = rates(city_counts)
+            latest = next((value for value in reversed(city_rates) if value is not None), None)
+            latest_text = f"{latest}%" if latest is not None else "-"
+            cards.append(f"""
+                <div class="card">
+                    <div class="card-title"><span>{name}</span><span class="rate">{latest_text}</span></div>
+                    <svg viewBox="0 0 220 60" preserveAspectRatio="none">
+                        <rect width="220" height="60" fill="#fafafa"/>
+                        {polyline(city_rates, 220, 60, "#409eff", 1.5)}
+                    </svg>
+                </div>""")
+        
+        period = f"最近 {history['days']:g} 天" if history["days"] > 0 else "全部历史"
+        range_text = f"{fmt(times[0])} 至 {fmt(times[-1])}" if times else ""
+        links = " ".join(f'<a href="/report_trend?days={days}">{label}</a>'
+                         for days, label in ((1, "1天"), (7, "7天"), (30, "30天"), (365, "1年"), (0, "全部")))
+        
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>完成率趋势 - {history['project']}</title>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <style>
+                body {{ font-family: 'PingFang SC', 'Microsoft YaHei', 'Helvetica Neue', Arial, sans-serif; margin: 0; background-color: #f5f7fa; color: #333; font-size: 13px; }}
+                .toolbar {{ display: flex; align-items: center; gap: 15px; height: 56px; padding: 0 20px; background-color: #fff; border-bottom: 1px solid #ebeef5; }}
+                .toolbar h1 {{ font-size: 18px; margin: 0; }}
+                .toolbar .info {{ color: #606266; flex: 1; }}
+                .toolbar a {{ color: #409eff; text-decoration: none; }}
+                .chart {{ margin: 20px; padding: 20px 20px 10px 50px; background-color: #fff; border-radius: 4px; }}
+                .chart text {{ font-size: 11px; fill: #909399; }}
+                .cards {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 12px; margin: 0 20px 20px; }}
+                .card {{ padding: 10px; background-color: #fff; border-radius: 4px; }}
+                .card svg {{ width: 100%; height: 60px; }}
+                .card-title {{ display: flex; justify-content: space-between; margin-bottom: 6px; }}
+                .rate {{ color: #67c23a; font-weight: bold; }}
+            </style>
+        </head>
+        <body>
+            <div class="toolbar">
+                <h1>完成率趋势</h1>
+                <span class="info">{history['project']} · {period} · {range_text}</span>
+                {links}
+                <a href="/report_page">标准报表</a>
+            </div>
+            <div class="chart">
+                <svg viewBox="-40 -10 950 330" width="100%">
+                    {grid_lines}
+                    {polyline(overall, 900, 300, "#409eff", 2)}
+                    <text x="0" y="318">{fmt(times[0]) if times else ""}</text>
+                    <text x="900" y="318" text-anchor="end">{fmt(times[-1]) if times else ""}</text>
+                </svg>
+            </div>
+            <div class="cards">{"".join(cards)}</div>
+        </body>
+        </html>
+        """
+
+    def send_task_detail(self, task_id_text):
+        """发送单个任务的详细信息（标题、状态、描述），用于悬浮提示"""
+        try:
+            task_id = int(task_id_text)
+        except ValueError:
+            self.send_json({"error": "无效的任务ID"}, 400)
+            return
+        
+        report_data = report_data_cache["data"]
+        detail = self.get_report_grid(report_data).task_detail(task_id) if report_data is not None else None
+        if detail is None:
+            self.send_json({"error": f"找不到任务 {task_id}"}, 404)
+            return
+        if not self.send_not_modified(report_data):
+            self.send_json(detail, headers=self.snapshot_headers(report_data))
+
+    def send_stream(self, fragments, content_type, headers=None, compress=True):
+        """以分块传输编码边生成边发送响应，客户端支持时使用gzip压缩
+        
+        Args:
+            fragments: 生成响应片段（str或bytes）的可迭代对象
+            content_type: 响应内容类型
+            headers: 额外的响应头字典
+            compress: 是否允许gzip压缩，ZIP等已压缩格式应传入False
+        """
+        use_gzip = compress and accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        if compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # 响应头中是生成前各阶段的耗时，包含生成耗时的完整结果在尾部字段中发送
+        timer = current_timer()
+        if timer is not None:
+            if timer.stages:
+                self.send_header('Server-Timing', timer.header_value())
+            self.send_header('Trailer', 'Server-Timing')
+        self.end_headers()
+        
+        writer = ChunkedResponseWriter(self.wfile, use_gzip)
+        try:
+            with timed_stage("render"):
+                for fragment in fragments:
+                    writer.write(fragment)
+            trailers = {'Server-Timing': timer.header_value()} if timer is not None else None
+            writer.close(trailers=trailers)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开，丢弃剩余内容
+            self.close_connection = True
+            return
+        except Exception as e:
+            # 响应头已发送，只能中断连接让客户端感知到响应不完整
+            print(f"流式生成响应时出错: {str(e)}")
+            traceback.print_exc()
+            self.close_connection = True
+            return
+        
+        if use_gzip and writer.bytes_in:
+            print(f"流式响应完成: 原始 {writer.bytes_in} 字节, 压缩后 {writer.bytes_out} 字节")
+
+    def debug_allowed(self, query):
+        """检查调试接口的访问权限"""
+        if DEBUG_TOKEN:
+            token = query.get('token', [''])[0] or self.headers.get('X-Debug-Token', '')
+            return hmac.compare_digest(token.encode('utf-8'), DEBUG_TOKEN.encode('utf-8'))
+        return self.client_address[0] in ('127.0.0.1', '::1')
+
+    def send_profile(self, query):
+        """对报表服务采样指定秒数，返回自身耗时和累计耗时最多的函数
+        
+        参数: seconds 采样时长（1-60秒），top 返回的函数数量，format 为 text 或 json，
+        rebuild=1 时在采样期间完整生成一次第一个项目的报表（不更新缓存），用于分析构建过程。
+        """
+        if not self.debug_allowed(query):
+            self.send_error(403)
+            return
+        try:
+            seconds = min(max(float(query.get('seconds', ['10'])[0]), 1), 60)
+            limit = min(max(int(query.get('top', ['30'])[0]), 1), 200)
+        except ValueError:
+            self.send_json({"error": "seconds 和 top 必须是数字"}, status=400)
+            return
+        if not profile_lock.acquire(blocking=False):
+            self.send_json({"error": "已有正在进行的采样分析"}, status=409)
+            return
+        
+        try:
+            rebuild = None
+            if query.get('rebuild', ['0'])[0] == '1':
+                rebuild = threading.Thread(target=self.profile_rebuild, name="profile-rebuild", daemon=True)
+                rebuild.start()
+            profiler = SamplingProfiler()
+            print(f"开始采样分析 {seconds:.0f} 秒...")
+            profiler.run(seconds)
+            result = profiler.top(limit)
+            result["seconds"] = seconds
+            result["rebuild_finished"] = rebuild is not None and not rebuild.is_alive()
+        finally:
+            profile_lock.release()
+        
+        if query.get('format', ['text'])[0] == 'json':
+            self.send_json(result, headers={'Cache-Control': 'no-store'})
         else:
-            self.send_error(404)
+            self.send_bytes(format_profile(result), 'text/plain; charset=utf-8', headers={'Cache-Control': 'no-store'})
+
+    def profile_rebuild(self):
+        """完整生成一次第一个项目的报表，结果不写入缓存"""
+        timer = start_timer()
+        try:
+            projects = api_client.get_projects()
+            if not projects:
+                print("采样分析: 无法获取项目列表")
+                return
+            project = projects[0]
+            cities = self.get_cities(project.get("id"))
+            if not cities:
+                print("采样分析: 无法获取城市列表")
+                return
+            all_work_packages = self.get_all_work_packages(project.get("id"), force_refresh=True)
+            report_data, _ = self.build_report_data(project, cities, all_work_packages)
+            with timed_stage("html"):
+                self.generate_html(report_data)
+            print(f"采样分析: 报表生成耗时 {timer.summary()}")
+        except Exception as e:
+            print(f"采样分析: 生成报表时出错: {str(e)}")
+        finally:
+            stop_timer()
 
     def background_report_generation(self, progress_id):
-        """在后台生成报表数据，并更新进度"""
+        """在后台生成报表数据，并更新进度
+        
+        由报表任务管理器在线程池中执行，每个阶段结束后检查任务是否已被取消。
+        """
+        timer = start_timer()
         try:
             queue_obj = progress_queues[progress_id]
             
@@ -148,7 +964,8 @@ class ReportHandler(BaseHTTPRequestHandler):
             queue_obj.put({"status": "progress", "message": "开始生成报表数据...", "percent": 5})
             
             # 获取项目列表
-            projects = api_client.get_projects()
+            with timed_stage("projects"):
+                projects = api_client.get_projects()
             if not projects:
                 queue_obj.put({"status": "error", "message": "无法获取项目列表"})
                 return
@@ -160,26 +977,28 @@ class ReportHandler(BaseHTTPRequestHandler):
             
             # 获取城市列表
             queue_obj.put({"status": "progress", "message": "获取城市列表...", "percent": 30})
-            cities = self.get_cities(project_id, progress_id)
+            with timed_stage("cities"):
+                cities = self.get_cities(project_id, progress_id)
             if not cities:
                 queue_obj.put({"status": "error", "message": "无法获取城市列表"})
                 return
+            report_inputs.update(project=project, cities=cities)
+            if queue_obj.is_cancelled():
+                return
             
             # 获取所有任务
             queue_obj.put({"status": "progress", "message": "获取工作包...", "percent": 40})
             # 传递 progress_id 和当前进度，以便在 get_all_work_packages 中更新详细进度
-            all_work_packages = self.get_all_work_packages(project_id, progress_id, 40)
+            all_work_packages = self.get_all_work_packages(project_id, progress_id, 40, force_refresh=True)
             
             if not all_work_packages:
                 queue_obj.put({"status": "error", "message": "无法获取任务数据"})
                 return
+            if queue_obj.is_cancelled():
+                return
             
-            queue_obj.put({"status": "progress", "message": f"处理 {len(all_work_packages)} 个工作包", "percent": 70})
-            
-            # 按城市分类任务和计算统计数据
-            tasks_by_city = {}
-            tasks_status = {}
-            city_statistics = {}
+            queue_obj.put({"status": "progress", "message": f"处理 {len(all_work_packages)} 个工作包", "percent": 70,
+                           "timings": timer.as_list()})
             
             # 获取省厅的任务作为模板 - 增加错误处理和数据检查
             try:
@@ -215,179 +1034,28 @@ class ReportHandler(BaseHTTPRequestHandler):
                 queue_obj.put({"status": "error", "message": error_msg})
                 return
             
-            # 分析任务层级关系
-            queue_obj.put({"status": "progress", "message": "分析任务关系...", "percent": 75})
-            all_tasks_dict = {wp["id"]: wp for wp in all_work_packages}
-            
-            # 构建任务树
-            tasks_tree = {}
-            child_tasks = set()
-            
-            # 记录任务的最终状态信息（用于调试）
-            missing_status_count = 0
-            for wp in all_work_packages:
-                wp_id = wp.get("id")
-                # 验证每个工作包是否有状态信息
-                has_status = "_links" in wp and "status" in wp["_links"] and wp["_links"]["status"] and "title" in wp["_links"]["status"]
-                if not has_status:
-                    missing_status_count += 1
-                    print(f"警告: 工作包 {wp_id} 仍然缺少状态信息")
-                
-                # 处理父子关系
-                if "_links" in wp and "parent" in wp["_links"] and wp["_links"]["parent"]:
-                    parent_link = wp["_links"]["parent"]
-                    # 检查parent_link是否包含href
-                    if isinstance(parent_link, dict) and "href" in parent_link and parent_link["href"]:
-                        try:
-                            parent_href = parent_link["href"]
-                            parent_id = int(parent_href.split("/")[-1])
-                            
-                            if parent_id not in tasks_tree:
-                                tasks_tree[parent_id] = []
-                            
-                            tasks_tree[parent_id].append(wp["id"])
-                            child_tasks.add(wp["id"])
-                        except (ValueError, TypeError, IndexError) as e:
-                            print(f"处理任务 {wp['id']} 的父任务链接时出错: {e}")
-            
-            if missing_status_count > 0:
-                print(f"在所有工作包中有 {missing_status_count} 个仍然缺少状态信息")
-            
-            # 找出顶级任务
-            top_level_tasks = [wp for wp in all_work_packages if wp["id"] not in child_tasks]
-            
-            # 获取每个城市的任务完成情况
-            queue_obj.put({"status": "progress", "message": "处理城市任务数据...", "percent": 80})
-            city_count = len(cities)
-            for i, city in enumerate(cities):
-                city_name = city["name"]
-                city_tasks = []
-                
-                # 获取该城市的所有任务
-                for wp in all_work_packages:
-                    if self.is_task_belongs_to_city(wp, city):
-                        city_tasks.append(wp)
-                
-                # 记录城市任务
-                tasks_by_city[city_name] = city_tasks
-                
-                # 记录该城市的顶级任务
-                city_top_tasks = [task for task in city_tasks if task["id"] not in child_tasks]
-                
-                # 计算任务状态统计
-                status_count = {"未开始": 0, "进行中": 0, "已完成": 0, "挂起": 0, "拒绝": 0, "总计": len(city_tasks)}
-                
-                print(f"\n处理城市 {city_name} 的任务状态:")
-                # 记录任务状态
-                for task in city_tasks:
-                    task_id = task["id"]
-                    task_status = "未开始"
-                    
-                    if "_links" in task and "status" in task["_links"] and task["_links"]["status"]:
-                        status_title = task["_links"]["status"].get("title", "")
-                        
-                        # 根据状态title判断任务状态
-                        if status_title == "In progress":
-                            task_status = "进行中"
-                            status_count["进行中"] += 1
-                        elif status_title == "Closed":
-                            task_status = "已完成"
-                            status_count["已完成"] += 1
-                        elif status_title == "New":
-                            task_status = "未开始"
-                            status_count["未开始"] += 1
-                        elif status_title == "On hold":
-                            task_status = "挂起"
-                            if "挂起" not in status_count:
-                                status_count["挂起"] = 0
-                            status_count["挂起"] += 1
-                        elif status_title == "Rejected":
-                            task_status = "拒绝"
-                            if "拒绝" not in status_count:
-                                status_count["拒绝"] = 0
-                            status_count["拒绝"] += 1
-                    else:
-                        status_count["未开始"] += 1
-                        print(f"  工作包 {task_id} 缺少状态信息，默认为'未开始'")
-                    
-                    if task_id not in tasks_status:
-                        tasks_status[task_id] = {}
-                    
-                    tasks_status[task_id][city_name] = task_status
-                    #print(f"  设置工作包 {task_id} 在 {city_name} 的状态为: {task_status}")
-                
-                # 保存统计信息
-                city_statistics[city_name] = status_count
-                print(f"城市 {city_name} 状态统计: {status_count}")
-            
-            # 计算父任务的状态（基于子任务状态）
-            queue_obj.put({"status": "progress", "message": "计算任务状态...", "percent": 90})
-            for city in cities:
-                city_name = city["name"]
-                for task_id, children_ids in tasks_tree.items():
-                    if children_ids:  # 只处理有子任务的任务
-                        # 获取所有子任务状态
-                        children_statuses = []
-                        for child_id in children_ids:
-                            if child_id in tasks_status and city_name in tasks_status[child_id]:
-                                children_statuses.append(tasks_status[child_id][city_name])
-                        
-                        # 计算父任务状态
-                        parent_status = "未开始"
-                        if children_statuses:
-                            if all(status == "已完成" for status in children_statuses):
-                                parent_status = "已完成"
-                            elif any(status == "进行中" for status in children_statuses) or any(status == "已完成" for status in children_statuses):
-                                parent_status = "进行中"
-                        
-                        # 更新父任务状态
-                        if task_id not in tasks_status:
-                            tasks_status[task_id] = {}
-                        tasks_status[task_id][city_name] = parent_status
-                        #print(f"根据子任务状态，设置父工作包 {task_id} 在 {city_name} 的状态为: {parent_status}")
-            
-            # 获取省厅作为模板的任务树
-            template_tasks = []
-            if "省厅" in tasks_by_city:
-                template_top_tasks = [task for task in tasks_by_city["省厅"] if task["id"] not in child_tasks]
-                
-                # 按顶级任务构建完整的任务树
-                for top_task in template_top_tasks:
-                    task_tree = self.build_task_tree(top_task, tasks_tree, all_tasks_dict)
-                    template_tasks.append(task_tree)
-            
-            # 创建报表数据
-            final_report_data = {
-                "project": project,
-                "cities": cities,
-                "template_tasks": template_tasks,
-                "tasks_by_city": tasks_by_city,
-                "tasks_status": tasks_status,
-                "all_tasks_count": len(all_work_packages),
-                "city_statistics": city_statistics,
-                "tasks_tree": tasks_tree
-            }
+            # 按城市分类任务、构建状态矩阵并计算统计数据
+            final_report_data, status_matrix = self.build_report_data(project, cities, all_work_packages, progress_id)
+            if queue_obj.is_cancelled():
+                return
             
-            # 保存到缓存
-            global report_data_cache
-            report_data_cache["data"] = final_report_data
-            report_data_cache["timestamp"] = time.time()
+            # 保存到缓存，并作为之后增量刷新的基准
+            update_report_cache(final_report_data, status_matrix)
+            report_engine.load(project, cities, all_work_packages, final_report_data, status_matrix)
             print("报表数据已保存到缓存")
+            print(f"报表生成耗时: {timer.summary()}")
             
-            # 最后发送完成消息
-            queue_obj.put({"status": "done", "message": "数据加载完成", "percent": 100})
+            # 最后发送完成消息，附带各阶段耗时
+            queue_obj.put({"status": "done", "message": "数据加载完成", "percent": 100,
+                           "timings": timer.as_list()})
             
         except Exception as e:
             if progress_id in progress_queues:
-                import traceback
                 error_msg = f"生成报表数据时出错: {str(e)}"
                 traceback.print_exc()
                 progress_queues[progress_id].put({"status": "error", "message": error_msg})
         finally:
-            # 等待一段时间后清理队列
-            time.sleep(15)
-            if progress_id in progress_queues:
-                del progress_queues[progress_id]
+            stop_timer()
 
     def generate_loading_page(self):
         """生成带有加载进度条的初始页面"""
@@ -552,17 +1220,28 @@ class ReportHandler(BaseHTTPRequestHandler):
             </div>
             
             <script>
+                // 当前订阅的进度ID，任务结束后清空
+                let activeProgressId = null;
+                
                 // 立即开始获取数据
                 document.addEventListener('DOMContentLoaded', function() {
                     startLoading();
                 });
                 
+                // 离开页面时取消订阅，没有其他订阅者时服务器会停止该任务
+                window.addEventListener('pagehide', function() {
+                    if (activeProgressId) {
+                        navigator.sendBeacon(`/api/report/cancel/${activeProgressId}`);
+                    }
+                });
+                
                 function startLoading() {
                     fetch('/api/report')
                         .then(response => response.json())
                         .then(data => {
                             if (data.progress_id) {
                                 // 开始轮询进度
+                                activeProgressId = data.progress_id;
                                 pollProgress(data.progress_id);
                             } else if (data.error) {
                                 showError(data.error);
@@ -604,11 +1283,13 @@ class ReportHandler(BaseHTTPRequestHandler):
                                 
                                 errorCount = 0; // 重置错误计数
                                 
-                                if (data.status === 'error') {
+                                if (data.status === 'error' || data.status === 'cancelled') {
                                     clearInterval(pollInterval);
+                                    activeProgressId = null;
                                     showError(data.message);
                                 } else if (data.status === 'done') {
                                     clearInterval(pollInterval);
+                                    activeProgressId = null;
                                     // 更新UI显示完成
                                     progressBar.style.width = '100%';
                                     progressPercent.textContent = '100%';
@@ -694,6 +1375,327 @@ class ReportHandler(BaseHTTPRequestHandler):
         </html>
         """
 
+    def generate_grid_page(self):
+        """生成虚拟滚动的表格页面
+        
+        页面本身不内嵌数据，加载后请求 /api/report_data 的紧凑数据，
+        滚动时只渲染可视区域内的单元格，悬浮提示按需请求 /api/task/<id>。
+        """
+        return """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>任务完成报表 - 表格视图</title>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <style>
+                :root {
+                    --primary-color: #409eff;
+                    --border-color: #ebeef5;
+                    --header-bg: #f5f7fa;
+                }
+                
+                * {
+                    box-sizing: border-box;
+                }
+                
+                body {
+                    font-family: 'PingFang SC', 'Microsoft YaHei', 'Helvetica Neue', Arial, sans-serif;
+                    margin: 0;
+                    background-color: #f5f7fa;
+                    color: #333;
+                    font-size: 13px;
+                }
+                
+                .toolbar {
+                    display: flex;
+                    align-items: center;
+                    gap: 15px;
+                    height: 56px;
+                    padding: 0 20px;
+                    background-color: #fff;
+                    border-bottom: 1px solid var(--border-color);
+                }
+                
+                .toolbar h1 {
+                    font-size: 18px;
+                    margin: 0;
+                }
+                
+                .toolbar .info {
+                    color: #606266;
+                    flex: 1;
+                }
+                
+                .toolbar input {
+                    padding: 6px 10px;
+                    border: 1px solid #dcdfe6;
+                    border-radius: 4px;
+                }
+                
+                .toolbar a {
+                    color: var(--primary-color);
+                    text-decoration: none;
+                }
+                
+                #viewport {
+                    position: relative;
+                    height: calc(100vh - 56px);
+                    overflow: auto;
+                    background-color: #fff;
+                }
+                
+                #canvas {
+                    position: relative;
+                }
+                
+                .cell {
+                    position: absolute;
+                    overflow: hidden;
+                    white-space: nowrap;
+                    text-overflow: ellipsis;
+                    text-align: center;
+                    border-right: 1px solid var(--border-color);
+                    border-bottom: 1px solid var(--border-color);
+                    padding: 0 6px;
+                }
+                
+                .head {
+                    background-color: var(--header-bg);
+                    font-weight: 600;
+                    z-index: 2;
+                }
+                
+                .city {
+                    background-color: #fff;
+                    font-weight: 600;
+                    z-index: 1;
+                }
+                
+                .corner {
+                    z-index: 3;
+                }
+                
+                .status-not-started { color: #909399; background-color: #efeff0; }
+                .status-in-progress { color: #19be6b; background-color: #d1f2e1; }
+                .status-completed { color: #67c23a; background-color: #e1f3d8; }
+                .status-on-hold { color: #e6a23c; background-color: #faecd8; }
+                .status-rejected { color: #f56c6c; background-color: #fde2e2; }
+                
+                #tooltip {
+                    position: fixed;
+                    display: none;
+                    max-width: 360px;
+                    padding: 10px 12px;
+                    background-color: rgba(48, 49, 51, 0.95);
+                    color: #fff;
+                    border-radius: 4px;
+                    white-space: pre-wrap;
+                    z-index: 10;
+                    pointer-events: none;
+                }
+                
+                .message {
+                    padding: 40px;
+                    text-align: center;
+                    color: #909399;
+                }
+            </style>
+        </head>
+        <body>
+            <div class="toolbar">
+                <h1>任务完成报表</h1>
+                <span class="info" id="info">正在加载数据...</span>
+                <input id="city-filter" type="text" placeholder="筛选城市">
+                <a href="/report_page">标准报表</a>
+            </div>
+            <div id="viewport"><div id="canvas"></div></div>
+            <div id="tooltip"></div>
+            
+            <script>
+                // 单元格尺寸固定，便于根据滚动位置直接计算可见的行列范围
+                const CITY_WIDTH = 100;
+                const CELL_WIDTH = 120;
+                const ROW_HEIGHT = 32;
+                const HEADER_HEIGHT = ROW_HEIGHT * 2;
+                const OVERSCAN = 4;
+                
+                const STATUS_CLASSES = {
+                    '已完成': 'status-completed',
+                    '进行中': 'status-in-progress',
+                    '挂起': 'status-on-hold',
+                    '拒绝': 'status-rejected'
+                };
+                
+                const viewport = document.getElementById('viewport');
+                const canvas = document.getElementById('canvas');
+                const tooltip = document.getElementById('tooltip');
+                const taskDetails = new Map();
+                
+                let data = null;
+                let rows = [];          // 当前显示的城市行下标（经过筛选）
+                let groupStarts = [];   // 每个分组的第一列下标
+                let frameRequested = false;
+                
+                function escapeHtml(text) {
+                    return String(text).replace(/&/g, '&amp;').replace(/</g, '&lt;')
+                        .replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+                }
+                
+                function cellHtml(className, left, top, width, height, text, extra) {
+                    return '<div class="cell ' + className + '" style="left:' + left + 'px;top:' + top +
+                        'px;width:' + width + 'px;height:' + height + 'px;line-height:' + (height - 1) + 'px"' +
+                        (extra || '') + ' title="' + escapeHtml(text) + '">' + escapeHtml(text) + '</div>';
+                }
+                
+                function render() {
+                    frameRequested = false;
+                    const columns = data.columns;
+                    const nCols = columns.length;
+                    const scrollTop = viewport.scrollTop;
+                    const scrollLeft = viewport.scrollLeft;
+                    
+                    const firstRow = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+                    const lastRow = Math.min(rows.length, Math.ceil((scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+                    const firstCol = Math.max(0, Math.floor(scrollLeft / CELL_WIDTH) - OVERSCAN);
+                    const lastCol = Math.min(nCols, Math.ceil((scrollLeft + viewport.clientWidth) / CELL_WIDTH) + OVERSCAN);
+                    
+                    const parts = [];
+                    
+                    // 可见区域内的单元格
+                    for (let r = firstRow; r < lastRow; r++) {
+                        const row = rows[r];
+                        const top = HEADER_HEIGHT + r * ROW_HEIGHT;
+                        for (let c = firstCol; c < lastCol; c++) {
+                            const index = row * nCols + c;
+                            const label = data.status_labels[data.status[index]];
+                            const taskId = data.task_ids[index];
+                            const className = STATUS_CLASSES[label] || 'status-not-started';
+                            const extra = taskId ? ' data-task="' + taskId + '"' : '';
+                            parts.push(cellHtml(className, CITY_WIDTH + c * CELL_WIDTH, top, CELL_WIDTH, ROW_HEIGHT, label, extra));
+                        }
+                        // 城市列固定在左侧
+                        parts.push(cellHtml('city', scrollLeft, top, CITY_WIDTH, ROW_HEIGHT, data.cities[row]));
+                    }
+                    
+                    // 表头固定在顶部：第一行为父任务，第二行为子任务
+                    const drawn = new Set();
+                    for (let c = firstCol; c < lastCol; c++) {
+                        const group = columns[c][2];
+                        const left = CITY_WIDTH + c * CELL_WIDTH;
+                        const groupInfo = data.groups[group];
+                        if (groupInfo[2] === 0) {
+                            // 没有子任务的父任务占两行
+                            parts.push(cellHtml('head', left, scrollTop, CELL_WIDTH, HEADER_HEIGHT, data.subjects[groupInfo[1]]));
+                            continue;
+                        }
+                        if (!drawn.has(group)) {
+                            drawn.add(group);
+                            const groupLeft = CITY_WIDTH + groupStarts[group] * CELL_WIDTH;
+                            parts.push(cellHtml('head', groupLeft, scrollTop, groupInfo[2] * CELL_WIDTH, ROW_HEIGHT, data.subjects[groupInfo[1]]));
+                        }
+                        parts.push(cellHtml('head', left, scrollTop + ROW_HEIGHT, CELL_WIDTH, ROW_HEIGHT, data.subjects[columns[c][1]]));
+                    }
+                    parts.push(cellHtml('head corner', scrollLeft, scrollTop, CITY_WIDTH, HEADER_HEIGHT, '城市'));
+                    
+                    canvas.innerHTML = parts.join('');
+                }
+                
+                function scheduleRender() {
+                    if (!frameRequested) {
+                        frameRequested = true;
+                        requestAnimationFrame(render);
+                    }
+                }
+                
+                function applyFilter() {
+                    const keyword = document.getElementById('city-filter').value.trim();
+                    rows = [];
+                    data.cities.forEach(function(name, index) {
+                        if (!keyword || name.indexOf(keyword) !== -1) {
+                            rows.push(index);
+                        }
+                    });
+                    canvas.style.width = (CITY_WIDTH + data.columns.length * CELL_WIDTH) + 'px';
+                    canvas.style.height = (HEADER_HEIGHT + rows.length * ROW_HEIGHT) + 'px';
+                    scheduleRender();
+                }
+                
+                function showTooltip(event, detail) {
+                    let text = detail.subject + '\\n' + 'ID:' + detail.id + ' - ' + detail.status;
+                    if (detail.description) {
+                        text += '\\n\\n' + detail.description;
+                    }
+                    tooltip.textContent = text;
+                    tooltip.style.left = (event.clientX + 12) + 'px';
+                    tooltip.style.top = (event.clientY + 12) + 'px';
+                    tooltip.style.display = 'block';
+                }
+                
+                canvas.addEventListener('mouseover', function(event) {
+                    const cell = event.target.closest('[data-task]');
+                    if (!cell) {
+                        tooltip.style.display = 'none';
+                        return;
+                    }
+                    const taskId = cell.getAttribute('data-task');
+                    if (taskDetails.has(taskId)) {
+                        showTooltip(event, taskDetails.get(taskId));
+                        return;
+                    }
+                    fetch('/api/task/' + taskId)
+                        .then(function(response) { return response.ok ? response.json() : null; })
+                        .then(function(detail) {
+                            if (detail) {
+                                taskDetails.set(taskId, detail);
+                                if (cell.matches(':hover')) {
+                                    showTooltip(event, detail);
+                                }
+                            }
+                        })
+                        .catch(function(error) { console.error('获取任务详情失败:', error); });
+                });
+                
+                canvas.addEventListener('mouseleave', function() {
+                    tooltip.style.display = 'none';
+                });
+                
+                viewport.addEventListener('scroll', scheduleRender);
+                window.addEventListener('resize', scheduleRender);
+                document.getElementById('city-filter').addEventListener('input', function() {
+                    if (data) {
+                        applyFilter();
+                    }
+                });
+                
+                fetch('/api/report_data')
+                    .then(function(response) { return response.json(); })
+                    .then(function(result) {
+                        if (result.error) {
+                            canvas.innerHTML = '<div class="message">' + escapeHtml(result.error) + '</div>';
+                            document.getElementById('info').textContent = '加载失败';
+                            return;
+                        }
+                        data = result;
+                        groupStarts = new Array(data.groups.length).fill(-1);
+                        data.columns.forEach(function(column, index) {
+                            if (groupStarts[column[2]] === -1) {
+                                groupStarts[column[2]] = index;
+                            }
+                        });
+                        document.getElementById('info').textContent = '项目：' + data.project.name +
+                            '　城市：' + data.cities.length + ' 个　任务列：' + data.columns.length +
+                            ' 个　工作包总数：' + data.all_tasks_count + ' 个';
+                        applyFilter();
+                    })
+                    .catch(function(error) {
+                        canvas.innerHTML = '<div class="message">加载数据失败：' + escapeHtml(error.message) + '</div>';
+                    });
+            </script>
+        </body>
+        </html>
+        """
+
     def get_report_data(self):
         try:
             # 检查是否有缓存数据
@@ -701,19 +1703,24 @@ class ReportHandler(BaseHTTPRequestHandler):
             if report_data_cache["data"] is not None and report_data_cache["timestamp"] is not None:
                 current_time = time.time()
                 cache_age = current_time - report_data_cache["timestamp"]
-                # 如果缓存存在且不超过5分钟，则使用缓存数据
-                if cache_age < 300:  # 5分钟 = 300秒
+                # 如果缓存存在且未到刷新间隔，则使用缓存数据
+                if cache_age < REPORT_REFRESH_INTERVAL:
                     print(f"get_report_data: 使用缓存数据，缓存年龄: {cache_age:.1f}秒")
                     return report_data_cache["data"]
-                else:
-                    print(f"get_report_data: 缓存数据已过期({cache_age:.1f}秒)，重新获取数据")
+                
+                print(f"get_report_data: 缓存数据已过期({cache_age:.1f}秒)，尝试增量刷新")
+                report_data = self.refresh_report_incrementally()
+                if report_data is not None:
+                    return report_data
+                print("get_report_data: 无法增量刷新，重新获取全部数据")
             else:
                 print("get_report_data: 无缓存数据，获取新数据")
             
             print("开始生成报表数据...")
             # 获取项目列表
             print("获取项目列表...")
-            projects = api_client.get_projects()
+            with timed_stage("projects"):
+                projects = api_client.get_projects()
             if not projects:
                 return {"error": "无法获取项目列表"}
                 
@@ -724,27 +1731,24 @@ class ReportHandler(BaseHTTPRequestHandler):
             
             # 获取城市列表
             print("获取城市列表...")
-            cities = self.get_cities(project_id)
+            with timed_stage("cities"):
+                cities = self.get_cities(project_id)
             if not cities:
                 return {"error": "无法获取城市列表"}
+            report_inputs.update(project=project, cities=cities)
             
             print(f"找到 {len(cities)} 个城市")
             
             # 获取所有任务
             print("开始获取所有工作包...")
-            all_work_packages = self.get_all_work_packages(project_id)
+            # 已有缓存说明增量刷新失败，需要绕过项目快照重新获取
+            all_work_packages = self.get_all_work_packages(project_id, force_refresh=report_data_cache["data"] is not None)
             
             if not all_work_packages:
                 return {"error": "无法获取任务数据"}
             
             print(f"成功获取 {len(all_work_packages)} 个工作包")
             
-            # 按城市分类任务
-            print("开始按城市分类任务...")
-            tasks_by_city = {}
-            tasks_status = {}
-            city_statistics = {}
-            
             # 获取省厅的任务作为模板
             province_city = next((city for city in cities if city["name"] == "省厅"), None)
             if not province_city:
@@ -752,145 +1756,13 @@ class ReportHandler(BaseHTTPRequestHandler):
             
             print("找到省厅城市")
             
-            # 分析任务层级关系
-            all_tasks_dict = {wp["id"]: wp for wp in all_work_packages}
-            
-            # 构建任务树
-            tasks_tree = {}
-            child_tasks = set()
-            
-            for wp in all_work_packages:
-                if "_links" in wp and "parent" in wp["_links"] and wp["_links"]["parent"]:
-                    parent_link = wp["_links"]["parent"]
-                    # 检查parent_link是否包含href
-                    if isinstance(parent_link, dict) and "href" in parent_link and parent_link["href"]:
-                        try:
-                            parent_href = parent_link["href"]
-                            parent_id = int(parent_href.split("/")[-1])
-                            
-                            if parent_id not in tasks_tree:
-                                tasks_tree[parent_id] = []
-                            
-                            tasks_tree[parent_id].append(wp["id"])
-                            child_tasks.add(wp["id"])
-                        except (ValueError, TypeError, IndexError) as e:
-                            print(f"处理任务 {wp['id']} 的父任务链接时出错: {e}")
-                            print(f"问题的父任务链接: {parent_link}")
-            
-            # 找出顶级任务
-            top_level_tasks = [wp for wp in all_work_packages if wp["id"] not in child_tasks]
-            print(f"找到 {len(top_level_tasks)} 个顶级任务")
-            
-            # 获取每个城市的任务完成情况
-            for city in cities:
-                city_name = city["name"]
-                city_tasks = []
-                
-                # 获取该城市的所有任务
-                for wp in all_work_packages:
-                    if self.is_task_belongs_to_city(wp, city):
-                        city_tasks.append(wp)
-                
-                # 记录城市任务
-                tasks_by_city[city_name] = city_tasks
-                
-                # 记录该城市的顶级任务
-                city_top_tasks = [task for task in city_tasks if task["id"] not in child_tasks]
-                print(f"城市 {city_name} 有 {len(city_top_tasks)} 个顶级任务, 总共 {len(city_tasks)} 个任务")
-                
-                # 计算任务状态统计
-                status_count = {"未开始": 0, "进行中": 0, "已完成": 0, "挂起": 0, "拒绝": 0, "总计": len(city_tasks)}
-                
-                # 记录任务状态
-                for task in city_tasks:
-                    task_id = task["id"]
-                    task_status = "未开始"
-                    
-                    if "_links" in task and "status" in task["_links"] and task["_links"]["status"]:
-                        status_title = task["_links"]["status"].get("title", "")
-                        
-                        # 根据状态title判断任务状态
-                        if status_title == "In progress":
-                            task_status = "进行中"
-                            status_count["进行中"] += 1
-                        elif status_title == "Closed":
-                            task_status = "已完成"
-                            status_count["已完成"] += 1
-                        elif status_title == "New":
-                            task_status = "未开始"
-                            status_count["未开始"] += 1
-                        elif status_title == "On hold":
-                            task_status = "挂起"
-                            if "挂起" not in status_count:
-                                status_count["挂起"] = 0
-                            status_count["挂起"] += 1
-                        elif status_title == "Rejected":
-                            task_status = "拒绝"
-                            if "拒绝" not in status_count:
-                                status_count["拒绝"] = 0
-                            status_count["拒绝"] += 1
-                    else:
-                        status_count["未开始"] += 1
-                    
-                    if task_id not in tasks_status:
-                        tasks_status[task_id] = {}
-                    
-                    tasks_status[task_id][city_name] = task_status
-                
-                # 保存统计信息
-                city_statistics[city_name] = status_count
-            
-            # 计算父任务的状态（基于子任务状态）
-            print("计算父任务状态...")
-            for city in cities:
-                city_name = city["name"]
-                for task_id, children_ids in tasks_tree.items():
-                    if children_ids:  # 只处理有子任务的任务
-                        # 获取所有子任务状态
-                        children_statuses = []
-                        for child_id in children_ids:
-                            if child_id in tasks_status and city_name in tasks_status[child_id]:
-                                children_statuses.append(tasks_status[child_id][city_name])
-                        
-                        # 计算父任务状态
-                        parent_status = "未开始"
-                        if children_statuses:
-                            if all(status == "已完成" for status in children_statuses):
-                                parent_status = "已完成"
-                            elif any(status == "进行中" for status in children_statuses) or any(status == "已完成" for status in children_statuses):
-                                parent_status = "进行中"
-                        
-                        # 更新父任务状态
-                        if task_id not in tasks_status:
-                            tasks_status[task_id] = {}
-                        tasks_status[task_id][city_name] = parent_status
-            
-            # 获取省厅作为模板的任务树
-            template_tasks = []
-            if "省厅" in tasks_by_city:
-                template_top_tasks = [task for task in tasks_by_city["省厅"] if task["id"] not in child_tasks]
-                
-                # 按顶级任务构建完整的任务树
-                for top_task in template_top_tasks:
-                    task_tree = self.build_task_tree(top_task, tasks_tree, all_tasks_dict)
-                    template_tasks.append(task_tree)
-                
-                print(f"省厅共有 {len(template_top_tasks)} 个顶级任务树")
-            
-            report_data = {
-                "project": project,
-                "cities": cities,
-                "template_tasks": template_tasks,
-                "tasks_by_city": tasks_by_city,  # 这里包含了每个城市的任务
-                "tasks_status": tasks_status,
-                "all_tasks_count": len(all_work_packages),
-                "city_statistics": city_statistics,
-                "tasks_tree": tasks_tree
-            }
+            # 按城市分类任务并计算状态
+            print("开始按城市分类任务...")
+            report_data, status_matrix = self.build_report_data(project, cities, all_work_packages)
             
-            # 保存到缓存
-            report_data_cache["data"] = report_data
-            report_data_cache["timestamp"] = time.time()
+            # 保存到缓存，并作为之后增量刷新的基准
+            update_report_cache(report_data, status_matrix)
+            report_engine.load(project, cities, all_work_packages, report_data, status_matrix)
             
             print("报表数据生成完成")
             return report_data
@@ -901,6 +1773,170 @@ class ReportHandler(BaseHTTPRequestHandler):
             traceback.print_exc()
             return {"error": f"生成报表数据时出错: {str(e)}"}
 
+    def get_report_data_within(self, deadline):
+        """在限定时间内获取报表数据
+        
+        缓存未过期时直接返回；否则在后台刷新并最多等待 deadline 秒。超时或刷新失败时返回带有
+        stale 标记的旧缓存，没有缓存时返回用已获取的工作包生成的部分报表，刷新在后台继续进行。
+        
+        Args:
+            deadline: 最长等待时间（秒）
+            
+        Returns:
+            报表数据；没有任何可显示的数据时返回None
+        """
+        cached = report_data_cache["data"]
+        timestamp = report_data_cache["timestamp"]
+        if cached is not None and timestamp is not None and time.time() - timestamp < REPORT_REFRESH_INTERVAL:
+            return cached
+        
+        future = start_report_refresh()
+        error = None
+        try:
+            with timed_stage("wait"):
+                report_data = future.result(timeout=deadline)
+            if "error" not in report_data:
+                return report_data
+            error = report_data["error"]
+        except concurrent.futures.TimeoutError:
+            print(f"报表数据未能在 {deadline} 秒内生成，先显示已有数据")
+        
+        cached = report_data_cache["data"]
+        if cached is not None:
+            return dict(cached, stale={"age": time.time() - report_data_cache["timestamp"], "error": error})
+        if error is not None:
+            return {"error": error}
+        with timed_stage("partial"):
+            return self.build_partial_report()
+
+    def build_partial_report(self):
+        """用正在加载的项目快照中已获取的工作包生成部分报表，没有可用数据时返回None"""
+        project, cities = report_inputs["project"], report_inputs["cities"]
+        if project is None or not cities:
+            return None
+        partial = project_snapshots.partial(project.get("id"))
+        if not partial or not partial[0]:
+            return None
+        
+        work_packages, listed_total = partial
+        print(f"生成部分报表: 已获取 {len(work_packages)}/{listed_total} 个工作包")
+        report_data, _ = self.build_report_data(project, cities, work_packages)
+        report_data["partial"] = {"loaded": len(work_packages), "total": listed_total}
+        return report_data
+
+    def report_notice(self, report_data):
+        """旧数据或部分数据的提示HTML，完整的最新数据返回空字符串"""
+        if 'partial' in report_data:
+            partial = report_data['partial']
+            return (f'<p class="data-notice">正在从OpenProject获取数据：已获取 {partial["loaded"]}/{partial["total"]} 个工作包，'
+                    f'标记为"{MISSING_LABEL}"的单元格尚未加载，页面将自动更新</p>')
+        if 'stale' in report_data:
+            stale = report_data['stale']
+            if stale.get('error'):
+                reason = f"刷新失败（{html.escape(stale['error'])}）"
+            else:
+                reason = "正在后台刷新"
+            return f'<p class="data-notice">当前显示的是 {format_age(stale["age"])}前获取的数据，{reason}，页面将自动更新</p>'
+        return ""
+
+    def refresh_report_incrementally(self):
+        """只获取上次构建后变化的工作包并修补缓存的报表
+        
+        Returns:
+            刷新后的报表数据，无法增量刷新时返回None
+        """
+        cached = report_data_cache["data"]
+        if cached is None or not report_engine.has_state(cached.get('project', {}).get('id')):
+            return None
+        try:
+            with timed_stage("incremental"):
+                result = report_engine.refresh(self)
+        except Exception as e:
+            print(f"增量刷新报表时出错: {str(e)}")
+            traceback.print_exc()
+            return None
+        if result is None:
+            return None
+        
+        report_data, status_matrix = result
+        if report_data is report_data_cache["data"]:
+            # 没有变化，只更新缓存时间
+            report_data_cache["timestamp"] = time.time()
+        else:
+            update_report_cache(report_data, status_matrix)
+        return report_data
+
+    def build_report_data(self, project, cities, all_work_packages, progress_id=None):
+        """按城市分类任务，构建状态矩阵并计算统计数据
+        
+        Args:
+            project: 项目数据
+            cities: 城市列表
+            all_work_packages: 项目的所有工作包
+            progress_id: 进度ID，用于更新进度
+            
+        Returns:
+            (报表数据, 状态矩阵) 元组
+        """
+        def update_progress(message, percent):
+            if progress_id and progress_id in progress_queues:
+                progress_queues[progress_id].put({"status": "progress", "message": message, "percent": percent})
+        
+        # 分析任务层级关系
+        update_progress("分析任务关系...", 75)
+        with timed_stage("tree"):
+            all_tasks_dict = {wp["id"]: wp for wp in all_work_packages}
+            tasks_tree, child_tasks = build_tasks_tree(all_work_packages)
+        
+        missing_status_count = sum(1 for wp in all_work_packages if not (wp.get("_links", {}).get("status") or {}).get("title"))
+        if missing_status_count > 0:
+            print(f"在所有工作包中有 {missing_status_count} 个仍然缺少状态信息")
+        
+        # 每个工作包只解析一次城市字段，而不是对每个城市逐一匹配
+        update_progress("处理城市任务数据...", 80)
+        with timed_stage("bucket"):
+            city_index = CityIndex(cities, f"customField{api_client.get_city_field_id()}")
+            tasks_by_city = {city["name"]: [] for city in cities}
+            for wp in all_work_packages:
+                for col in city_index.columns_for_task(wp):
+                    tasks_by_city[cities[col]["name"]].append(wp)
+        
+        # 构建状态矩阵，父任务状态和城市统计均为向量化计算（矩阵内部分别记录bucket和rollup阶段）
+        update_progress("计算任务状态...", 90)
+        status_matrix = StatusMatrix.build(all_work_packages, city_index, tasks_tree)
+        with timed_stage("stats"):
+            city_statistics = status_matrix.city_statistics()
+        for city_name, status_count in city_statistics.items():
+            print(f"城市 {city_name} 状态统计: {status_count}")
+        
+        # 获取省厅作为模板的任务树
+        template_tasks = []
+        if "省厅" in tasks_by_city:
+            with timed_stage("template"):
+                template_top_tasks = [task for task in tasks_by_city["省厅"] if task["id"] not in child_tasks]
+                
+                # 按顶级任务构建完整的任务树
+                for top_task in template_top_tasks:
+                    task_tree = self.build_task_tree(top_task, tasks_tree, all_tasks_dict)
+                    template_tasks.append(task_tree)
+            
+            print(f"省厅共有 {len(template_top_tasks)} 个顶级任务树")
+        
+        with timed_stage("stats"):
+            tasks_status = status_matrix.tasks_status()
+        report_data = {
+            "project": project,
+            "cities": cities,
+            "template_tasks": template_tasks,
+            "tasks_by_city": tasks_by_city,  # 这里包含了每个城市的任务
+            "tasks_status": tasks_status,
+            "all_tasks_count": len(all_work_packages),
+            "city_statistics": city_statistics,
+            "tasks_tree": tasks_tree
+        }
+        
+        return report_data, status_matrix
+
     def build_task_tree(self, task, tasks_tree, all_tasks_dict):
         """构建任务树"""
         task_id = task["id"]
@@ -928,310 +1964,44 @@ class ReportHandler(BaseHTTPRequestHandler):
         
         return task_tree
 
-    def get_all_work_packages(self, project_id, progress_id=None, base_percent=0):
-        """获取项目的所有工作包"""
-        try:
-            if progress_id and progress_id in progress_queues:
-                progress_queues[progress_id].put({"status": "progress", "message": "获取工作包数据...", "percent": base_percent + 1})
-            
-            print("尝试获取所有工作包...")
-            all_work_packages = []
-            
-            # 首先使用较小的页面大小获取，以了解总数
-            test_packages = api_client.get_work_packages(project_id, page=1, page_size=50)
-            total_count = api_client.get_last_work_packages_total()
-            
-            # 设置合适的页面大小，确保能一次性获取所有工作包
-            page_size = total_count + 50 if total_count > 0 else 500
-            print(f"项目包含 {total_count} 个工作包，调整页面大小为 {page_size}")
-            
-            # 使用动态计算的页面大小，一次性获取所有工作包
-            work_packages = api_client.get_work_packages(project_id, page=1, page_size=page_size)
-            
-            if work_packages:
-                msg = f"获取到 {len(work_packages)} 个工作包"
-                print(msg)
-                if progress_id and progress_id in progress_queues:
-                    progress_queues[progress_id].put({"status": "progress", "message": msg, "percent": base_percent + 10})
-                
-                # 检查主工作包列表中已有的ID
-                work_package_ids = {wp.get("id") for wp in work_packages if "id" in wp}
-                print(f"主列表中包含 {len(work_package_ids)} 个工作包ID")
-                
-                # 查找所有在子任务引用中的工作包ID
-                referenced_ids = set()
-                for wp in work_packages:
-                    if "_links" in wp and "children" in wp["_links"]:
-                        children = wp["_links"]["children"]
-                        if isinstance(children, list):
-                            for child in children:
-                                if isinstance(child, dict) and "href" in child:
-                                    # 从href提取ID
-                                    try:
-                                        href = child["href"]
-                                        child_id = int(href.split("/")[-1])
-                                        referenced_ids.add(child_id)
-                                    except (ValueError, IndexError):
-                                        pass
-                
-                # 找出被引用但不在主列表中的ID
-                missing_referenced_ids = [id for id in referenced_ids if id not in work_package_ids]
-                if missing_referenced_ids:
-                    missing_count = len(missing_referenced_ids)
-                    missing_ids_str = ", ".join([str(id) for id in missing_referenced_ids[:20]])
-                    if missing_count > 20:
-                        missing_ids_str += f"... (共{missing_count}个)"
-                    
-                    print(f"发现 {missing_count} 个被引用但不在主列表中的工作包: {missing_ids_str}")
-                    
-                    # 并行获取被引用的工作包详情
-                    print(f"开始并行获取 {missing_count} 个被引用的工作包详情...")
-                    referenced_details = self.get_work_packages_details_parallel(missing_referenced_ids)
-                    
-                    # 添加获取到的工作包
-                    for wp_id, wp_data in referenced_details.items():
-                        if wp_data:
-                            print(f"成功获取被引用的工作包 {wp_id} 详情，添加到列表")
-                            work_packages.append(wp_data)
-                            # 添加到已知ID集合
-                            work_package_ids.add(wp_id)
-                        else:
-                            print(f"无法获取被引用的工作包 {wp_id} 的详细信息")
-                
-                # 检查哪些工作包缺少状态信息或状态信息不完整
-                packages_without_status = []
-                print("\n开始检查工作包状态信息:")
-                
-                for wp in work_packages:
-                    wp_id = wp.get("id", "未知ID")
-                    
-                    # 详细检查状态信息
-                    has_links = "_links" in wp
-                    has_status_link = has_links and "status" in wp["_links"]
-                    
-                    # 更严格的检查：不仅检查是否存在status字段，还检查status对象是否完整
-                    status_link_valid = False
-                    status_info = "未知"
-                    
-                    if has_status_link:
-                        status_link = wp["_links"]["status"]
-                        # 检查status是否为None或空对象，或者是否缺少title或href
-                        if status_link and isinstance(status_link, dict):
-                            has_title = "title" in status_link
-                            has_href = "href" in status_link
-                            status_link_valid = has_title and has_href
-                            
-                            if has_title:
-                                status_info = status_link.get("title", "无标题")
-                    
-                    # 打印状态检查日志
-                    status_check_result = "正常" if (has_links and has_status_link and status_link_valid) else "缺少状态"
-                    print(f"工作包 {wp_id}: 状态={status_info}, 检查结果={status_check_result}")
-                    
-                    # 判断工作包是否缺少状态 - 更严格的条件
-                    if not has_links or not has_status_link or not status_link_valid:
-                        packages_without_status.append(wp_id)
-                
-                # 如果有缺少状态的工作包，并行获取详细信息
-                if packages_without_status:
-                    missing_count = len(packages_without_status)
-                    missing_ids = ", ".join([str(id) for id in packages_without_status[:20]])
-                    if len(packages_without_status) > 20:
-                        missing_ids += f"... (共{missing_count}个)"
-                    
-                    log_msg = f"发现 {missing_count} 个工作包缺少状态信息: {missing_ids}，开始并行获取..."
-                    print(log_msg)
-                    if progress_id and progress_id in progress_queues:
-                        progress_queues[progress_id].put({"status": "progress", 
-                                                         "message": log_msg, 
-                                                         "percent": base_percent + 12})
-                    
-                    # 并行获取缺少状态的工作包详情
-                    detailed_packages = self.get_work_packages_details_parallel(packages_without_status)
-                    
-                    # 更新工作包信息
-                    updated_count = 0
-                    for wp_id, detailed_wp in detailed_packages.items():
-                        if detailed_wp:
-                            # 验证获取的详细信息是否包含状态
-                            status_link = detailed_wp.get("_links", {}).get("status", {})
-                            has_status = isinstance(status_link, dict) and "title" in status_link and "href" in status_link
-                            status_info = status_link.get("title", "未知") if has_status else "未知"
-                            
-                            print(f"工作包 {wp_id} 详细信息获取成功，状态: {status_info}, 包含完整状态信息: {has_status}")
-                            
-                            # 找到原来的工作包并更新，如果不存在则添加
-                            updated = False
-                            for i, wp in enumerate(work_packages):
-                                if wp.get("id") == wp_id:
-                                    work_packages[i] = detailed_wp
-                                    updated = True
-                                    updated_count += 1
-                                    break
-                            
-                            if not updated:
-                                # 如果未找到现有的工作包，则添加新的
-                                work_packages.append(detailed_wp)
-                                updated_count += 1
-                                print(f"工作包 {wp_id} 添加到列表中，因为找不到现有记录")
-                            else:
-                                print(f"工作包 {wp_id} 信息已更新")
-                    
-                    update_msg = f"完成 {missing_count} 个缺少状态信息的工作包更新，成功更新 {updated_count} 个"
-                    print(update_msg)
-                    if progress_id and progress_id in progress_queues:
-                        progress_queues[progress_id].put({"status": "progress", 
-                                                         "message": update_msg, 
-                                                         "percent": base_percent + 15})
-                else:
-                    print("所有工作包都包含状态信息，无需单独获取")
-                
-                # 将任务添加到结果集
-                all_work_packages = work_packages
-            else:
-                msg = "获取工作包失败，未返回数据"
-                print(msg)
-                if progress_id and progress_id in progress_queues:
-                    progress_queues[progress_id].put({"status": "progress", "message": msg, "percent": base_percent + 5})
-                raise Exception("无法从API获取工作包数据")
+    def get_all_work_packages(self, project_id, progress_id=None, base_percent=0, force_refresh=False):
+        """获取项目的所有工作包
+        
+        Args:
+            project_id: 项目ID
+            progress_id: 进度队列ID
+            base_percent: 进度起始百分比，加载阶段占用其后的15%
+            force_refresh: 忽略未过期的项目快照重新获取
             
-            # 验证获取的任务数量和状态分布
-            if all_work_packages:
-                status_counts = {}
-                missing_status_count = 0
-                still_missing_ids = []
-                
-                for task in all_work_packages:
-                    task_id = task.get("id", "未知")
-                    
-                    # 检查状态信息是否完整
-                    status_link = task.get("_links", {}).get("status", {})
-                    has_complete_status = isinstance(status_link, dict) and "title" in status_link and "href" in status_link
-                    
-                    if has_complete_status:
-                        status = status_link.get("title", "未知")
-                        if status not in status_counts:
-                            status_counts[status] = 0
-                        status_counts[status] += 1
-                    else:
-                        missing_status_count += 1
-                        still_missing_ids.append(task_id)
-                        print(f"警告: 工作包 {task_id} 在最终结果中仍然缺少状态信息")
-                
-                print("\n最终任务状态统计:")
-                for status, count in sorted(status_counts.items()):
-                    print(f"  {status}: {count}个")
-                
-                if missing_status_count > 0:
-                    missing_ids_str = ", ".join([str(id) for id in still_missing_ids[:20]])
-                    if len(still_missing_ids) > 20:
-                        missing_ids_str += f"... (共{missing_status_count}个)"
-                    print(f"  仍然缺少状态: {missing_status_count}个 (ID: {missing_ids_str})")
-                
-                return all_work_packages
-            else:
-                msg = "警告：没有获取到任何工作包数据"
-                print(msg)
-                if progress_id and progress_id in progress_queues:
-                    progress_queues[progress_id].put({"status": "progress", "message": msg, "percent": base_percent + 15})
-                raise Exception("获取的工作包数据为空")
+        Returns:
+            list: 工作包列表
+        """
+        def update_progress(message, percent):
+            if progress_id and progress_id in progress_queues:
+                progress_queues[progress_id].put({"status": "progress", "message": message,
+                                                  "percent": base_percent + 1 + percent * 14 // 100})
         
+        try:
+            with timed_stage("fetch"):
+                snapshot = project_snapshots.get(project_id, force_refresh=force_refresh,
+                                                 progress_callback=update_progress)
         except Exception as e:
             msg = f"获取所有工作包时出错: {str(e)}"
             print(msg)
-            if progress_id and progress_id in progress_queues:
-                progress_queues[progress_id].put({"status": "progress", "message": msg, "percent": base_percent + 10})
-                
-            import traceback
+            update_progress(msg, 70)
             traceback.print_exc()
             raise Exception(f"获取工作包失败: {str(e)}")
-
-    def get_work_packages_details_parallel(self, work_package_ids, max_workers=10):
-        """并行获取多个工作包的详细信息
         
-        Args:
-            work_package_ids: 工作包ID列表
-            max_workers: 最大并行线程数
-            
-        Returns:
-            dict: 以工作包ID为键，工作包详情为值的字典
-        """
-        if not work_package_ids:
-            return {}
-            
-        results = {}
-        total_count = len(work_package_ids)
-        print(f"开始并行获取 {total_count} 个工作包详情，使用 {max_workers} 个并行线程")
-        
-        # 使用线程池并行获取
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_id = {
-                executor.submit(self.get_work_package_details, wp_id): wp_id 
-                for wp_id in work_package_ids
-            }
-            
-            # 处理完成的任务
-            completed = 0
-            for future in concurrent.futures.as_completed(future_to_id):
-                wp_id = future_to_id[future]
-                completed += 1
-                
-                try:
-                    data = future.result()
-                    results[wp_id] = data
-                    print(f"并行获取进度: {completed}/{total_count}, 工作包 {wp_id} 获取{'成功' if data else '失败'}")
-                except Exception as e:
-                    print(f"并行获取进度: {completed}/{total_count}, 工作包 {wp_id} 请求异常: {str(e)}")
-                    results[wp_id] = None
-        
-        success_count = sum(1 for data in results.values() if data is not None)
-        print(f"并行获取完成: 总计 {total_count} 个工作包, 成功 {success_count} 个, 失败 {total_count - success_count} 个")
-        return results
-
-    def get_work_package_details(self, work_package_id):
-        """获取单个工作包的详细信息"""
-        try:
-            # 确保链接格式正确
-            url = f"/api/v3/work_packages/{work_package_id}"
-            if not url.startswith("/"):
-                url = f"/{url}"
-                
-            full_url = f"{api_client.api_url}{url}"
-            print(f"获取工作包详细信息，URL: {full_url}")
-            
-            response = requests.get(
-                full_url, 
-                auth=api_client.auth, 
-                headers=api_client.headers,
-                timeout=(5, 15)  # 5秒连接超时，15秒读取超时
-            )
-            
-            # 打印响应状态码
-            print(f"工作包 {work_package_id} API响应状态码: {response.status_code}")
-            
-            # 详细日志
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    
-                    # 检查状态信息是否完整
-                    status_link = data.get("_links", {}).get("status", {})
-                    has_complete_status = isinstance(status_link, dict) and "title" in status_link and "href" in status_link
-                    status_info = status_link.get("title", "未设置") if has_complete_status else "状态信息不完整"
-                    
-                    print(f"获取到工作包 {work_package_id} 详细信息，状态: {status_info}")
-                    return data
-                except Exception as json_err:
-                    print(f"解析工作包 {work_package_id} 响应JSON时出错: {str(json_err)}")
-            else:
-                print(f"获取工作包 {work_package_id} 详细信息失败，HTTP状态: {response.status_code}")
-                response.raise_for_status()
-            
-            return None
-        except Exception as e:
-            print(f"获取工作包 {work_package_id} 详细信息时出错: {str(e)}")
-            return None
+        status_counts = {}
+        for wp in snapshot.work_packages:
+            if has_complete_status(wp):
+                status = wp["_links"]["status"]["title"]
+                status_counts[status] = status_counts.get(status, 0) + 1
+        print("\n最终任务状态统计:")
+        for status, count in sorted(status_counts.items()):
+            print(f"  {status}: {count}个")
+        
+        return list(snapshot.work_packages)
 
     def is_task_belongs_to_city(self, task, city):
         """检查任务是否属于指定城市"""
@@ -1394,8 +2164,13 @@ class ReportHandler(BaseHTTPRequestHandler):
         raise Exception("获取城市列表失败：所有重试均已失败")
 
     def generate_html(self, report_data, show_task_ids=False):
+        """生成完整的报表HTML字符串"""
+        return "".join(self.iter_html(report_data, show_task_ids))
+
+    def iter_html(self, report_data, show_task_ids=False):
+        """逐段生成报表HTML，供分块传输时边生成边发送"""
         if "error" in report_data:
-            return f"""
+            yield f"""
             <!DOCTYPE html>
             <html>
             <head>
@@ -1459,15 +2234,21 @@ class ReportHandler(BaseHTTPRequestHandler):
             </body>
             </html>
             """
+            return
 
+        # 旧数据和部分数据的页面定时重新加载，直到后台刷新完成
+        notice = self.report_notice(report_data)
+        refresh_meta = '<meta http-equiv="refresh" content="10">' if notice else ''
+        
         # 生成报表HTML
-        html = f"""
+        yield f"""
         <!DOCTYPE html>
         <html>
         <head>
             <title>任务报表 - {report_data['project']['name']}</title>
             <meta charset="utf-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            {refresh_meta}
             <style>
                 /* 基础样式 */
                 :root {{
@@ -1800,6 +2581,17 @@ class ReportHandler(BaseHTTPRequestHandler):
                     background-color: rgba(245, 108, 108, 0.2);
                 }}
                 
+                .status-missing {{ 
+                    color: #c0c4cc; 
+                    font-style: italic;
+                    background-color: #f4f4f5;
+                }}
+                
+                .data-notice {{
+                    color: var(--warning-color);
+                    font-weight: 600;
+                }}
+                
                 .report-table tr:hover {{ 
                     background-color: #f5f7fa; 
                 }}
@@ -1862,14 +2654,21 @@ class ReportHandler(BaseHTTPRequestHandler):
                     <div class="header-info">
                         <h1>任务完成报表</h1>
                         <p>项目：<span class="highlight">""" + report_data['project']['name'] + """</span></p>
-                        <p>生成时间：""" + datetime.now().strftime('%Y-%m-%d %H:%M:%S') + """</p>
+                        <p>生成时间：""" + report_data.get('generated_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S')) + """</p>
                         <p>工作包总数：<span class="highlight">""" + str(report_data['all_tasks_count']) + """</span> 个</p>
+                        """ + notice + """
                     </div>
                     <div class="header-actions">
                         <button class="btn btn-primary refresh-btn" onclick="refreshData()">
                             刷新数据
                             <span class="loading"><span class="spinner"></span></span>
                         </button>
+                        <a href="/report_grid" style="margin-left: 15px; color: var(--primary-color); text-decoration: none;">大表格视图</a>
+                        <a href="/report_trend" style="margin-left: 15px; color: var(--primary-color); text-decoration: none;">完成率趋势</a>
+                        <a href="/dashboard" style="margin-left: 15px; color: var(--primary-color); text-decoration: none;">全省看板</a>
+                        <a href="/api/report.xlsx" style="margin-left: 15px; color: var(--primary-color); text-decoration: none;">导出Excel</a>
+                        <a href="/api/report.csv" style="margin-left: 15px; color: var(--primary-color); text-decoration: none;">导出CSV</a>
+                        <a href="/api/report_by_city.zip" style="margin-left: 15px; color: var(--primary-color); text-decoration: none;">按城市导出</a>
                     </div>
                 </div>
                 
@@ -1882,21 +2681,21 @@ class ReportHandler(BaseHTTPRequestHandler):
 
         # 只有在有模板任务时才生成表格
         if report_data.get('template_tasks'):
-            html += self.generate_task_table(report_data, show_task_ids)
+            yield from self.iter_task_table(report_data, show_task_ids)
         else:
-            html += """
+            yield """
                         <div class="empty-data">
                             <p style="text-align:center;color:#909399;padding:30px;">没有找到省厅的任务数据，无法生成报表</p>
                         </div>
             """
         
-        html += """
+        yield """
                     </div>
                 </div>
         """
 
         # 添加城市统计信息
-        html += """
+        yield """
                 <div class="stats">
                     <h2>城市任务统计</h2>
                     <div class="stats-content">
@@ -1917,7 +2716,7 @@ class ReportHandler(BaseHTTPRequestHandler):
             if total > 0:
                 completion_rate = round((completed / total) * 100, 1)
             
-            html += f"""
+            yield f"""
                         <div class="stats-city">
                             <div class="stats-city-name">{city_name}</div>
                             <div><span class="stats-label">总计：</span><span class="stats-value">{total}</span> 个任务</div>
@@ -1945,7 +2744,7 @@ class ReportHandler(BaseHTTPRequestHandler):
                         </div>
             """
         
-        html += """
+        yield """
                     </div>
                 </div>
             </div>
@@ -2066,15 +2865,20 @@ class ReportHandler(BaseHTTPRequestHandler):
         </html>
         """
         
-        return html
 
     def generate_task_table(self, report_data, show_task_ids=False):
-        """生成任务表格，列是任务，行是地市，表头分为两行"""
-        template_tasks = report_data['template_tasks']
-        cities = report_data['cities']
-        tasks_by_city = report_data.get('tasks_by_city', {})
+        """生成任务表格HTML字符串"""
+        return "".join(self.iter_task_table(report_data, show_task_ids))
+
+    def iter_task_table(self, report_data, show_task_ids=False):
+        """逐段生成任务表格，列是任务，行是地市，表头分为两行
+        
+        表头和每个城市行作为片段缓存，键为各自输入数据的哈希，
+        快照更新后只有模板任务树变化时重新渲染表头、只有单元格变化的城市行重新渲染。
+        """
+        grid = self.get_report_grid(report_data)
         
-        html = """
+        yield """
                 <div class="table-container">
                     <table class="report-table">
                         <thead>
@@ -2082,169 +2886,86 @@ class ReportHandler(BaseHTTPRequestHandler):
                                 <th rowspan="2" style="min-width: 80px;">城市</th>
         """
         
-        # 生成表头第一行 - 父任务
-        for task_tree in template_tasks:
-            children_count = len(task_tree.get('children', []))
-            task_id_text = f" (ID:{task_tree['id']})" if show_task_ids else ""
-            
-            if children_count > 0:
-                # 如果有子任务，父任务占据多列（只包含子任务的列数）
-                html += f'<th colspan="{children_count}" class="parent-task" title="{task_tree["subject"]}">{task_tree["subject"]}{task_id_text}</th>'
-            else:
-                # 如果没有子任务，父任务只占一列
-                html += f'<th rowspan="2" class="parent-task" title="{task_tree["subject"]}">{task_tree["subject"]}{task_id_text}</th>'
-        
-        html += """
-                            </tr>
-                            <tr>
-        """
-        
-        # 生成表头第二行 - 只显示子任务
-        for task_tree in template_tasks:
-            children = task_tree.get('children', [])
-            if children:
-                # 只添加子任务列，不再显示父任务自身
-                for child in children:
-                    task_id_text = f" (ID:{child['id']})" if show_task_ids else ""
-                    html += f'<th class="child-task" title="{child["subject"]}">{child["subject"]}{task_id_text}</th>'
+        yield fragment_cache.get(header_key(grid, show_task_ids),
+                                 lambda: self.render_table_header(grid, show_task_ids))
         
-        html += """
+        yield """
                             </tr>
                         </thead>
                         <tbody>
         """
         
-        # 为每个城市生成一行
-        for city in cities:
-            city_name = city['name']
-            city_tasks = tasks_by_city.get(city_name, [])
-            html += f"""
-                            <tr>
-                                <td>{city_name}</td>
-            """
-            
-            # 添加每个任务的状态
-            for task_tree in template_tasks:
-                template_subject = task_tree.get('subject', '')
-                children = task_tree.get('children', [])
-                
-                if not children:
-                    # 如果没有子任务，查找对应城市的该任务
-                    template_id = task_tree['id']
-                    
-                    # 尝试在该城市找到相同名字的任务
-                    city_task = next((t for t in city_tasks if t.get('subject') == template_subject), None)
-                    
-                    if city_task:
-                        # 找到了对应城市的同名任务，使用该任务的实际状态
-                        city_task_id = city_task.get('id', 'unknown')
-                        
-                        # 直接从任务中获取状态，而不是从状态缓存中获取
-                        status_title = "未开始"
-                        if "_links" in city_task and "status" in city_task["_links"] and city_task["_links"]["status"]:
-                            status_link = city_task["_links"]["status"]
-                            if isinstance(status_link, dict) and "title" in status_link:
-                                status_title = status_link["title"]
-                        
-                        # 转换状态为中文标签
-                        status_label = self.get_status_label(status_title)
-                        status_class = self.get_status_class(status_label)
-                        
-                        # 获取任务描述
-                        task_description = ""
-                        if "description" in city_task:
-                            if isinstance(city_task["description"], dict) and "raw" in city_task["description"]:
-                                task_description = city_task["description"]["raw"]
-                            else:
-                                task_description = str(city_task["description"])
-                            # 处理描述文本，清理HTML标签等
-                            task_description = task_description.replace('"', '&quot;').replace('<', '&lt;').replace('>', '&gt;')
-                        
-                        # 构建悬浮提示内容
-                        tooltip_content = f"ID:{city_task_id} - {status_label}"
-                        if task_description:
-                            tooltip_content = f"{tooltip_content}\n\n{task_description}"
-                        
-                        # 根据参数决定是否显示任务ID
-                        if show_task_ids:
-                            html += f'<td class="{status_class}" title="{tooltip_content}"><div class="status-cell">ID:{city_task_id} - {status_label}</div></td>'
-                        else:
-                            html += f'<td class="{status_class}" title="{tooltip_content}"><div class="status-cell">{status_label}</div></td>'
-                    else:
-                        # 未找到对应城市的任务，使用省厅状态计算的状态
-                        parent_status = self.get_task_status_for_city(template_id, city_name, report_data)
-                        status_class = self.get_status_class(parent_status)
-                        status_label = self.get_status_label(parent_status)
-                        
-                        if show_task_ids:
-                            html += f'<td class="{status_class}" title="无ID - {status_label}"><div class="status-cell">无ID - {status_label}</div></td>'
-                        else:
-                            html += f'<td class="{status_class}" title="{status_label}"><div class="status-cell">{status_label}</div></td>'
-                else:
-                    # 如果有子任务，显示子任务状态
-                    for child in children:
-                        child_subject = child.get('subject', '')
-                        template_id = child['id']
-                        
-                        # 尝试在该城市找到相同名字的子任务
-                        city_child_task = next((t for t in city_tasks if t.get('subject') == child_subject), None)
-                        
-                        if city_child_task:
-                            # 找到了对应城市的同名任务，使用该任务的ID和实际状态
-                            city_child_id = city_child_task.get('id', 'unknown')
-                            
-                            # 直接从任务中获取状态，而不是从状态缓存中获取
-                            status_title = "未开始"
-                            if "_links" in city_child_task and "status" in city_child_task["_links"] and city_child_task["_links"]["status"]:
-                                status_link = city_child_task["_links"]["status"]
-                                if isinstance(status_link, dict) and "title" in status_link:
-                                    status_title = status_link["title"]
-                            
-                            # 转换状态为中文标签
-                            status_label = self.get_status_label(status_title)
-                            status_class = self.get_status_class(status_label)
-                            
-                            # 获取任务描述
-                            task_description = ""
-                            if "description" in city_child_task:
-                                if isinstance(city_child_task["description"], dict) and "raw" in city_child_task["description"]:
-                                    task_description = city_child_task["description"]["raw"]
-                                else:
-                                    task_description = str(city_child_task["description"])
-                                # 处理描述文本，清理HTML标签等
-                                task_description = task_description.replace('"', '&quot;').replace('<', '&lt;').replace('>', '&gt;')
-                            
-                            # 构建悬浮提示内容
-                            tooltip_content = f"ID:{city_child_id} - {status_label}"
-                            if task_description:
-                                tooltip_content = f"{tooltip_content}\n\n{task_description}"
-                            
-                            if show_task_ids:
-                                html += f'<td class="{status_class}" title="{tooltip_content}"><div class="status-cell">ID:{city_child_id} - {status_label}</div></td>'
-                            else:
-                                html += f'<td class="{status_class}" title="{tooltip_content}"><div class="status-cell">{status_label}</div></td>'
-                        else:
-                            # 未找到对应城市的任务，使用省厅状态计算的状态
-                            child_status = self.get_task_status_for_city(template_id, city_name, report_data)
-                            status_class = self.get_status_class(child_status)
-                            status_label = self.get_status_label(child_status)
-                            
-                            if show_task_ids:
-                                html += f'<td class="{status_class}" title="无ID - {status_label}"><div class="status-cell">无ID - {status_label}</div></td>'
-                            else:
-                                html += f'<td class="{status_class}" title="{status_label}"><div class="status-cell">{status_label}</div></td>'
-            
-            html += """
-                            </tr>
-            """
+        # 为每个城市生成一行，单元格的任务ID和状态取自报表表格
+        for row in range(len(grid.city_names)):
+            yield fragment_cache.get(row_key(grid, row, show_task_ids),
+                                     lambda: self.render_city_row(grid, row, show_task_ids))
         
-        html += """
+        yield """
                         </tbody>
                     </table>
                 </div>
         """
+
+    def render_table_header(self, grid, show_task_ids=False):
+        """渲染表头两行的单元格，第一行是父任务，第二行只显示子任务"""
+        parts = []
+        for task_id, subject, children_count in grid.groups:
+            task_id_text = f" (ID:{task_id})" if show_task_ids else ""
+            if children_count > 0:
+                # 如果有子任务，父任务占据多列（只包含子任务的列数）
+                parts.append(f'<th colspan="{children_count}" class="parent-task" title="{subject}">{subject}{task_id_text}</th>')
+            else:
+                # 如果没有子任务，父任务只占一列
+                parts.append(f'<th rowspan="2" class="parent-task" title="{subject}">{subject}{task_id_text}</th>')
+        
+        parts.append("""
+                            </tr>
+                            <tr>
+        """)
+        
+        for task_id, subject, group_index in grid.columns:
+            if grid.groups[group_index][2] > 0:
+                task_id_text = f" (ID:{task_id})" if show_task_ids else ""
+                parts.append(f'<th class="child-task" title="{subject}">{subject}{task_id_text}</th>')
+        return "".join(parts)
+
+    def render_city_row(self, grid, row, show_task_ids=False):
+        """渲染一个城市的表格行"""
+        parts = [f"""
+                            <tr>
+                                <td>{grid.city_names[row]}</td>
+            """]
+        
+        for col in range(len(grid.columns)):
+            city_task_id, status_label = grid.cell(row, col)
+            status_class = self.get_status_class(status_label)
+            
+            if city_task_id is not None:
+                # 找到了对应城市的同名任务，悬浮提示中附带任务描述
+                task_description = get_task_description(grid.tasks[city_task_id])
+                task_description = task_description.replace('"', '&quot;').replace('<', '&lt;').replace('>', '&gt;')
+                
+                tooltip_content = f"ID:{city_task_id} - {status_label}"
+                if task_description:
+                    tooltip_content = f"{tooltip_content}\n\n{task_description}"
+                
+                # 根据参数决定是否显示任务ID
+                if show_task_ids:
+                    parts.append(f'<td class="{status_class}" title="{tooltip_content}"><div class="status-cell">ID:{city_task_id} - {status_label}</div></td>')
+                else:
+                    parts.append(f'<td class="{status_class}" title="{tooltip_content}"><div class="status-cell">{status_label}</div></td>')
+            else:
+                # 未找到对应城市的任务，使用省厅状态计算的状态
+                if show_task_ids:
+                    parts.append(f'<td class="{status_class}" title="无ID - {status_label}"><div class="status-cell">无ID - {status_label}</div></td>')
+                else:
+                    parts.append(f'<td class="{status_class}" title="{status_label}"><div class="status-cell">{status_label}</div></td>')
+        
+        parts.append("""
+                            </tr>
+            """)
+        return "".join(parts)
         
-        return html
 
     def get_status_class(self, status):
         """获取状态对应的CSS类"""
@@ -2256,6 +2977,8 @@ class ReportHandler(BaseHTTPRequestHandler):
             return "status-on-hold"
         elif status == "拒绝" or status == "Rejected":
             return "status-rejected"
+        elif status == MISSING_LABEL:
+            return "status-missing"
         else:
             return "status-not-started"
 
@@ -2539,10 +3262,130 @@ class ReportHandler(BaseHTTPRequestHandler):
         else:
             return "#67c23a"  # 绿色
 
-def start_server(port=8000):
-    """启动报表服务器"""
+class HeadlessReportHandler(ReportHandler):
+    """不绑定HTTP连接的报表处理器，在后台线程或命令行中生成静态报表"""
+    
+    def __init__(self):
+        # BaseHTTPRequestHandler 的构造函数会立即处理请求，这里只使用报表生成相关的方法
+        pass
+
+    def build_project_artifacts(self, store, project):
+        """生成单个项目的报表HTML和紧凑JSON并写入静态文件目录
+        
+        Args:
+            store: 静态文件目录
+            project: 项目数据
+            
+        Returns:
+            (清单, 是否重写了文件) 元组
+        """
+        project_id = project.get("id")
+        key = project_key(project)
+        print(f"生成项目 {project.get('name')} (ID: {project_id}) 的静态报表...")
+        
+        with timed_stage("cities"):
+            cities = self.get_cities(project_id)
+        if not cities:
+            raise Exception("无法获取城市列表")
+        all_work_packages = self.get_all_work_packages(project_id, force_refresh=True)
+        report_data, _ = self.build_report_data(project, cities, all_work_packages)
+        
+        grid = ReportGrid.build(report_data)
+        previous = store.read_manifest(key)
+        stamp_report_data(report_data, grid, previous)
+        record_report_history(report_data)
+        if store.is_current(key, report_data['snapshot_hash']):
+            print(f"项目 {key} 的报表没有变化，保留现有文件")
+            return previous, False
+        
+        compact = self.build_compact_report(report_data, grid)
+        files = {
+            "report.html": self.generate_html(report_data).encode('utf-8'),
+            "report_data.json": json.dumps(compact, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        }
+        manifest = store.publish(key, project, report_data, files)
+        print(f"项目 {key} 的静态报表已更新: {', '.join(files)}")
+        return manifest, True
+
+def build_static_reports(output_dir=ARTIFACT_DIR, project_ids=None):
+    """为每个项目生成静态报表文件
+    
+    Args:
+        output_dir: 静态文件目录
+        project_ids: 项目ID或标识符列表，为空时生成全部项目
+        
+    Returns:
+        int: 文件有更新的项目数量
+    """
+    store = ArtifactStore(output_dir)
+    handler = HeadlessReportHandler()
+    start_time = time.time()
+    
+    with timed_stage("projects"):
+        projects = api_client.get_projects()
+    if not projects:
+        print("无法获取项目列表，跳过本次静态报表生成")
+        return 0
+    if project_ids:
+        wanted = {str(project_id) for project_id in project_ids}
+        projects = [project for project in projects
+                    if str(project.get("id")) in wanted or project.get("identifier") in wanted]
+    
+    manifests = []
+    updated = 0
+    for project in projects:
+        timer = start_timer()
+        try:
+            manifest, changed = handler.build_project_artifacts(store, project)
+            print(f"项目 {project.get('name')} 生成耗时: {timer.summary()}")
+        except Exception as e:
+            print(f"生成项目 {project.get('name')} 的静态报表失败: {str(e)}")
+            traceback.print_exc()
+            # 保留上一次成功生成的文件
+            manifest, changed = store.read_manifest(project_key(project)), False
+        if manifest:
+            manifests.append(manifest)
+        updated += changed
+    stop_timer()
+    
+    store.write_index(manifests)
+    print(f"静态报表生成完成: {len(projects)} 个项目，更新 {updated} 个，耗时 {time.time() - start_time:.1f}秒")
+    return updated
+
+def run_report_builder(output_dir=ARTIFACT_DIR, interval=0, project_ids=None):
+    """按固定间隔生成静态报表，interval 不大于0时只生成一次"""
+    while True:
+        try:
+            build_static_reports(output_dir, project_ids)
+        except Exception as e:
+            if interval <= 0:
+                raise
+            print(f"生成静态报表时出错: {str(e)}")
+            traceback.print_exc()
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+def start_server(port=8000, artifact_dir=ARTIFACT_DIR, build_interval=0, project_ids=None):
+    """启动报表服务器
+    
+    Args:
+        port: 监听端口
+        artifact_dir: 静态报表目录，通过 /reports/ 路径提供
+        build_interval: 大于0时在后台线程中按该间隔（秒）生成静态报表
+        project_ids: 生成静态报表的项目ID或标识符列表，为空时生成全部项目
+    """
+    global artifact_store
+    artifact_store = ArtifactStore(artifact_dir)
+    if build_interval > 0:
+        builder = threading.Thread(target=run_report_builder, args=(artifact_dir, build_interval, project_ids),
+                                   name="report-builder", daemon=True)
+        builder.start()
+        print(f"每 {build_interval} 秒生成一次静态报表到 {artifact_dir}")
     try:
-        server = HTTPServer(('0.0.0.0', port), ReportHandler)
+        # HTTP/1.1长连接下需要多线程服务器，避免一个保持连接的浏览器阻塞其他请求
+        server = ThreadingHTTPServer(('0.0.0.0', port), ReportHandler)
+        server.daemon_threads = True
         print(f"启动报表服务器在端口 {port}")
         print(f"访问地址: http://localhost:{port}/")
         server.serve_forever()
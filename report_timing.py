@@ -0,0 +1,153 @@
+"""
+报表性能分析模块
+StageTimer 记录一次请求或一个报表任务中各阶段的耗时，用于生成 Server-Timing 响应头和进度消息；
+SamplingProfiler 定时采样所有线程的调用栈，统计报表任务的热点函数
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class StageTimer:
+    """按顺序记录各阶段耗时，同名阶段的耗时累加"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, duration_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def header_value(self, names=None):
+        """生成 Server-Timing 响应头的值，阶段名只使用ASCII字符"""
+        items = [(name, ms) for name, ms in self.stages.items() if names is None or name in names]
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in items)
+
+    def as_list(self):
+        """[{name, ms}]，用于进度消息和日志"""
+        return [{"name": name, "ms": round(ms, 1)} for name, ms in self.stages.items()]
+
+    def summary(self):
+        total = (time.perf_counter() - self.started) * 1000
+        parts = ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.stages.items())
+        return f"总计 {total:.0f}ms ({parts})"
+
+
+def start_timer():
+    """为当前线程创建新的计时器"""
+    timer = StageTimer()
+    _local.timer = timer
+    return timer
+
+
+def current_timer():
+    """当前线程的计时器，没有时返回None"""
+    return getattr(_local, "timer", None)
+
+
+def stop_timer():
+    _local.timer = None
+
+
+@contextmanager
+def timed_stage(name):
+    """在当前线程的计时器中记录一个阶段，没有计时器时不做任何事"""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+class SamplingProfiler:
+    """采样分析器
+
+    在后台按固定间隔读取所有线程的当前调用栈（sys._current_frames），
+    统计每个函数位于栈顶（自身耗时）和出现在栈中（累计耗时）的采样次数。
+    与cProfile不同，它能覆盖线程池中执行的报表任务，对被分析代码的影响也很小。
+    线程池空闲线程和服务器监听线程会占据大部分采样，栈顶为等待函数的采样只计数、不参与排名。
+
+    Args:
+        interval: 采样间隔（秒）
+    """
+
+    IDLE_FUNCTIONS = ("wait", "select", "sleep", "accept", "poll", "_worker", "serve_forever", "readinto")
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.idle_samples = 0
+        self.self_counts = {}
+        self.total_counts = {}
+
+    @staticmethod
+    def _frame_key(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+    def sample(self, ignore_thread_ids=()):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in ignore_thread_ids:
+                continue
+            if frame.f_code.co_name in self.IDLE_FUNCTIONS:
+                self.idle_samples += 1
+                continue
+            self.samples += 1
+            leaf = self._frame_key(frame)
+            self.self_counts[leaf] = self.self_counts.get(leaf, 0) + 1
+            seen = set()
+            while frame is not None:
+                key = self._frame_key(frame)
+                if key not in seen:
+                    seen.add(key)
+                    self.total_counts[key] = self.total_counts.get(key, 0) + 1
+                frame = frame.f_back
+
+    def run(self, seconds):
+        """在当前线程中采样指定秒数"""
+        ignore = {threading.get_ident()}
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            self.sample(ignore)
+            time.sleep(self.interval)
+
+    def top(self, limit=30):
+        """返回自身和累计采样次数最多的函数"""
+        def ranked(counts):
+            items = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [{"function": key, "samples": count,
+                     "percent": round(count * 100 / self.samples, 1) if self.samples else 0.0}
+                    for key, count in items]
+
+        return {
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "interval_ms": self.interval * 1000,
+            "self": ranked(self.self_counts),
+            "cumulative": ranked(self.total_counts),
+        }
+
+
+def format_profile(result):
+    """把采样结果格式化为纯文本表格"""
+    lines = [f"有效采样 {result['samples']} 次，空闲采样 {result['idle_samples']} 次，间隔 {result['interval_ms']:.0f}ms", ""]
+    for title, key in (("自身耗时", "self"), ("累计耗时", "cumulative")):
+        lines.append(f"== {title} ==")
+        for item in result[key]:
+            lines.append(f"{item['percent']:6.1f}%  {item['samples']:7d}  {item['function']}")
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,100 @@
+"""二进制导出格式的读写测试：写入后读出的项目信息、工作包和末尾字段与写入的一致"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_binary import BLOCK_SIZE, BinaryExportStream, BinaryExportWriter, is_binary_export  # noqa: E402
+from import_stream import open_export  # noqa: E402
+
+
+def _wp(wp_id):
+    """不同ID的工作包字段组合不同：有的没有描述、没有 _links 或 _links 不是字典，有的链接值不可哈希"""
+    wp = {
+        "id": wp_id,
+        "subject": f"任务{wp_id}",
+        "_links": {
+            "self": {"href": f"/api/v3/work_packages/{wp_id}"},
+            "status": {"href": f"/api/v3/statuses/{wp_id % 3 + 1}", "title": "进行中"},
+            "project": {"href": "/api/v3/projects/7"},
+        },
+    }
+    if wp_id % 2:
+        wp["description"] = {"raw": f"说明{wp_id}"}
+    if wp_id % 5 == 0:
+        # 不可哈希的链接值（列表），整列只能原样保存
+        wp["_links"]["customField3"] = [{"href": "/api/v3/custom_options/1"}, {"href": "/api/v3/custom_options/2"}]
+    if wp_id % 3 == 0:
+        # 字典链接中含有列表，无法放入链接表
+        wp["_links"]["customField4"] = {"href": None, "options": [1, 2]}
+    if wp_id % 7 == 0:
+        del wp["_links"]
+    if wp_id % 11 == 0:
+        wp["_links"] = None
+    return wp
+
+
+class BinaryExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "project.opx")
+        self.header = {"project": {"id": 7, "name": "测试项目"}, "work_package_count": 0}
+
+    def write(self, work_packages, trailer=None):
+        with BinaryExportWriter(self.path) as writer:
+            writer.write_header(self.header)
+            for wp in work_packages:
+                writer.write_work_package(wp)
+            writer.finish(trailer)
+        return writer
+
+    def test_round_trip(self):
+        # 超过一个块，后面的块引用前面块写入的链接表
+        work_packages = [_wp(wp_id) for wp_id in range(1, BLOCK_SIZE * 2 + 50)]
+        writer = self.write(work_packages, {"delta_state": {"deleted": [3]}})
+        self.assertEqual(writer.count, len(work_packages))
+        self.assertTrue(is_binary_export(self.path))
+
+        with open_export(self.path) as stream:
+            self.assertIsInstance(stream, BinaryExportStream)
+            self.assertEqual(stream.header["project"], self.header["project"])
+            self.assertEqual(list(stream.iter_work_packages()), work_packages)
+            self.assertEqual(stream.trailer, {"delta_state": {"deleted": [3]}, "work_package_count": len(work_packages)})
+
+    def test_decoded_links_are_independent(self):
+        self.write([_wp(1), _wp(3)])
+        with open_export(self.path) as stream:
+            first, second = stream.iter_work_packages()
+        first["_links"]["project"]["title"] = "修改"
+        self.assertNotIn("title", second["_links"]["project"])
+
+    def test_missing_trailer(self):
+        writer = BinaryExportWriter(self.path)
+        writer.write_header(self.header)
+        for wp_id in range(1, BLOCK_SIZE + 2):
+            writer.write_work_package(_wp(wp_id))
+        # 模拟写入中断：只有完整的第一个块，没有末尾块
+        writer._file.close()
+        writer._file = None
+        os.replace(writer._tmp_path, self.path)
+
+        with open_export(self.path) as stream:
+            with self.assertRaises(ValueError):
+                list(stream.iter_work_packages())
+
+    def test_unfinished_writer_leaves_no_file(self):
+        with self.assertRaises(RuntimeError):
+            with BinaryExportWriter(self.path) as writer:
+                writer.write_header(self.header)
+                raise RuntimeError
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""差异导出和合并的测试：基准文件加依次生成的差异文件合并后与项目当前的工作包一致"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export_delta  # noqa: E402
+from export_writer import FORMAT_BINARY, FORMAT_NDJSON, FORMAT_NDJSON_GZIP, ExportWriter  # noqa: E402
+from import_stream import open_export  # noqa: E402
+
+
+def _wp(wp_id, subject=None, project_id=7):
+    return {
+        "id": wp_id,
+        "subject": subject or f"任务{wp_id}",
+        "updatedAt": "2026-01-01T00:00:00Z",
+        "_links": {"project": {"href": f"/api/v3/projects/{project_id}"}},
+    }
+
+
+class FakeServer:
+    """项目的当前状态：本项目工作包ID和本次差异导出时 updatedAt 过滤返回的工作包"""
+
+    def __init__(self):
+        self.ids = set()
+        self.updated = []
+        self.exported_at = None
+        self.filters = []
+
+    def build_export_header(self, project_id, progress_callback=None):
+        return {"project": {"id": project_id, "name": "测试项目"}, "exported_at": self.exported_at}
+
+    def stream(self, project_id, progress_callback=None, filters=None, known_ids=()):
+        self.filters.append(filters)
+        return len(self.updated), iter(self.updated)
+
+    def get_work_package_ids(self, project_id):
+        return set(self.ids)
+
+
+class ExportDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = FakeServer()
+        for target, name in ((export_delta, "build_export_header"), (export_delta.project_snapshots, "stream"),
+                             (export_delta.api_client, "get_work_package_ids")):
+            patcher = mock.patch.object(target, name, getattr(self.server, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # 基准：本项目的1-5号工作包，以及被引用而一起导出的其他项目工作包100
+        self.base_path = self.path("base.ndjson.gz")
+        with ExportWriter(self.base_path, FORMAT_NDJSON_GZIP) as writer:
+            writer.write_header({"project": {"id": 7, "name": "测试项目"}, "exported_at": "2026-01-01T00:00:00Z"})
+            for wp in [_wp(wp_id) for wp_id in range(1, 6)] + [_wp(100, project_id=8)]:
+                writer.write_work_package(wp)
+            writer.finish()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def export_delta(self, name, baseline_path, exported_at, ids, updated, export_format=FORMAT_NDJSON):
+        self.server.exported_at = exported_at
+        self.server.ids = ids
+        self.server.updated = updated
+        path = self.path(name)
+        export_delta.export_project_delta(7, path, baseline_path, export_format)
+        return path
+
+    def export_chain(self):
+        # 第一次：删除2，更新3，新建6
+        first = self.export_delta("delta1.ndjson", self.base_path, "2026-01-02T00:00:00Z",
+                                  {1, 3, 4, 5, 6}, [_wp(3, "任务3-改"), _wp(6)])
+        # 第二次（以第一次差异文件为基准）：删除4，更新1，新引用了其他项目的工作包101
+        second = self.export_delta("delta2.opx", first, "2026-01-03T00:00:00Z",
+                                   {1, 3, 5, 6}, [_wp(1, "任务1-改"), _wp(101, project_id=9)], FORMAT_BINARY)
+        return first, second
+
+    def read(self, path):
+        with open_export(path) as stream:
+            work_packages = {wp["id"]: wp["subject"] for wp in stream.iter_work_packages()}
+            return stream.header, stream.trailer, work_packages
+
+    def test_delta_contents(self):
+        first, second = self.export_chain()
+        header, trailer, work_packages = self.read(first)
+        self.assertEqual(work_packages, {3: "任务3-改", 6: "任务6"})
+        self.assertEqual(header["delta"]["base_exported_at"], "2026-01-01T00:00:00Z")
+        self.assertEqual(trailer["delta_state"], {"deleted": [2], "ids": [1, 3, 4, 5, 6], "external_ids": [100]})
+        # 按基准导出时间（减去时钟误差余量）过滤更新的工作包
+        self.assertEqual(self.server.filters[0], [{"updatedAt": {"operator": "<>d", "values": ["2025-12-31T23:00:00Z", ""]}}])
+
+        header, trailer, work_packages = self.read(second)
+        self.assertEqual(header["delta"]["base_exported_at"], "2026-01-02T00:00:00Z")
+        self.assertEqual(trailer["delta_state"], {"deleted": [4], "ids": [1, 3, 5, 6], "external_ids": [100, 101]})
+
+    def test_merge_chain(self):
+        first, second = self.export_chain()
+        expected = {1: "任务1-改", 3: "任务3-改", 5: "任务5", 6: "任务6", 100: "任务100", 101: "任务101"}
+        for export_format in (FORMAT_NDJSON_GZIP, FORMAT_BINARY):
+            with self.subTest(export_format=export_format):
+                merged = self.path(f"merged.{export_format}")
+                count = export_delta.merge_exports(self.base_path, [first, second], merged, export_format)
+                header, trailer, work_packages = self.read(merged)
+                self.assertEqual(work_packages, expected)
+                self.assertEqual(count, len(expected))
+                self.assertNotIn("delta", header)
+                self.assertEqual(header["exported_at"], "2026-01-03T00:00:00Z")
+                self.assertEqual(trailer["work_package_count"], len(expected))
+
+    def test_merged_file_is_a_baseline(self):
+        first, second = self.export_chain()
+        merged = self.path("merged.ndjson.gz")
+        export_delta.merge_exports(self.base_path, [first, second], merged)
+        baseline = export_delta.Baseline(merged)
+        self.assertEqual(baseline.ids, {1, 3, 5, 6})
+        self.assertEqual(baseline.external_ids, {100, 101})
+        self.assertEqual(baseline.exported_at, "2026-01-03T00:00:00Z")
+
+    def test_merge_rejects_wrong_order(self):
+        first, second = self.export_chain()
+        with self.assertRaisesRegex(ValueError, "不是基于"):
+            export_delta.merge_exports(self.base_path, [second], self.path("merged.ndjson.gz"))
+        with self.assertRaisesRegex(ValueError, "不是基于"):
+            export_delta.merge_exports(self.base_path, [second, first], self.path("merged.ndjson.gz"))
+        with self.assertRaisesRegex(ValueError, "第一个文件必须是完整导出文件"):
+            export_delta.merge_exports(first, [second], self.path("merged.ndjson.gz"))
+        self.assertFalse(os.path.exists(self.path("merged.ndjson.gz")))
+
+    def test_baseline_of_other_project(self):
+        self.server.exported_at = "2026-01-02T00:00:00Z"
+        with mock.patch.object(export_delta, "build_export_header",
+                               lambda project_id, progress_callback=None: {"project": {"id": 8}}):
+            with self.assertRaises(ValueError):
+                export_delta.export_project_delta(8, self.path("delta.ndjson"), self.base_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
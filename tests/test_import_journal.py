@@ -0,0 +1,45 @@
+"""导入日志的回归测试：意外中断留下的不完整记录不能影响继续导入时追加的记录"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from import_journal import ImportJournal  # noqa: E402
+
+
+class ImportJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "export.json.journal")
+
+    def resume(self, content):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        journal = ImportJournal(self.path)
+        self.assertTrue(journal.load())
+        journal.record_work_package(2, 20)
+        journal.record_work_package(3, 30)
+        journal.close()
+        reloaded = ImportJournal(self.path)
+        reloaded.load()
+        return reloaded.id_mapping
+
+    def test_torn_last_line_is_truncated(self):
+        mapping = self.resume('{"type": "project", "project_id": "7", "source": "s"}\n'
+                              '{"type": "wp", "old": "1", "new": "10"}\n'
+                              '{"type": "wp", "old": "2", "ne')
+        self.assertEqual(mapping, {"1": "10", "2": "20", "3": "30"})
+
+    def test_last_line_without_newline_is_kept(self):
+        mapping = self.resume('{"type": "project", "project_id": "7", "source": "s"}\n'
+                              '{"type": "wp", "old": "1", "new": "10"}')
+        self.assertEqual(mapping, {"1": "10", "2": "20", "3": "30"})
+
+
+if __name__ == "__main__":
+    unittest.main()
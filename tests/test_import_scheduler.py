@@ -0,0 +1,66 @@
+"""导入工作包创建顺序的回归测试：父任务不在导入数据中时保留父子链接，只有真正的循环才截断"""
+
+import itertools
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_client import OpenProjectClient  # noqa: E402
+
+
+def _wp(wp_id, parent_id=None):
+    parent = {"href": f"/api/v3/work_packages/{parent_id}"} if parent_id else {"href": None}
+    return {"id": wp_id, "subject": f"任务{wp_id}", "_links": {"parent": parent}}
+
+
+class ImportSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = OpenProjectClient()
+        self.created = {}       # 原ID -> 创建时使用的父任务新ID
+        new_ids = itertools.count(1000)
+        lock = threading.Lock()
+
+        def create(wp, new_project_id, parent_new_id, *args):
+            with lock:
+                new_id = str(next(new_ids))
+                self.created[str(wp["id"])] = parent_new_id
+            return wp["id"], new_id, 1
+
+        self.client._create_import_work_package = create
+
+    def run_import(self, work_packages):
+        id_mapping = {}
+        result = self.client._stream_import_work_packages(
+            iter(work_packages), "77", ({}, {}, {}), id_mapping, {}, max_workers=2)
+        return result, id_mapping
+
+    def test_chain_ending_at_absent_parent_keeps_links(self):
+        # 3 → 2 → 999（不在导入数据中），子任务先读取
+        (_, deferred, read_count, created_count), id_mapping = self.run_import([_wp(3, 2), _wp(2, 999)])
+        self.assertEqual(deferred, [])
+        self.assertEqual((read_count, created_count), (2, 2))
+        self.assertIsNone(self.created["2"])
+        self.assertEqual(self.created["3"], id_mapping["2"])
+
+    def test_cycle_is_cut_once(self):
+        # 1 → 2 → 3 → 1 构成循环，4 → 3 挂在循环上，5 → 999 的父任务不在导入数据中
+        work_packages = [_wp(4, 3), _wp(1, 2), _wp(2, 3), _wp(3, 1), _wp(5, 999)]
+        (_, deferred, _, created_count), id_mapping = self.run_import(work_packages)
+        self.assertEqual(created_count, 5)
+        self.assertEqual(len(deferred), 1)
+        member, parent_id = deferred[0]
+        self.assertIn(member, {"1", "2", "3"})
+        self.assertIsNone(self.created[member])
+        parents = {"1": "2", "2": "3", "3": "1", "4": "3"}
+        for wp_id, parent in parents.items():
+            if wp_id != member:
+                self.assertEqual(self.created[wp_id], id_mapping[parent], wp_id)
+        self.assertIsNone(self.created["5"])
+
+
+if __name__ == "__main__":
+    unittest.main()
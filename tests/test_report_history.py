@@ -0,0 +1,34 @@
+"""报表历史查询的回归测试：采样点数不能超过 MAX_POINTS"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_history import MAX_POINTS, HistorySeries  # noqa: E402
+
+
+class HistoryQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.series = HistorySeries(os.path.join(self.tmp.name, "project"))
+        self.series.append({"成都": {"已完成": 1, "总计": 2}}, timestamp=1000)
+        self.series.append({"成都": {"已完成": 2, "总计": 2}}, timestamp=1000 + 86400)
+
+    def test_points_are_capped(self):
+        result = self.series.query(1000, 1000 + 2 * 86400, points=10 ** 9)
+        self.assertLessEqual(len(result["times"]), MAX_POINTS)
+        self.assertEqual(len(result["counts"][0]), len(result["times"]))
+
+    def test_samples_keep_latest_record(self):
+        result = self.series.query(1000, 1000 + 2 * 86400, points=3)
+        done = [sample[2] for sample in result["counts"][0]]
+        self.assertEqual(done, [1, 2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,11 +4,13 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QFormLayout, QLineEdit, QCheckBox, QProgressDialog,
                             QTabWidget, QFrame, QDialog, QHeaderView)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject
-import json
 import os
 from api_client import api_client
 import traceback
-import concurrent.futures
+from export_delta import export_project_delta
+from export_writer import EXPORT_FORMATS, FORMAT_NDJSON_GZIP, export_project
+from import_journal import ImportJournal, default_journal_path
+from import_stream import open_export, read_export_metadata
 
 class ExportThread(QThread):
     """项目导出线程"""
@@ -16,7 +18,8 @@ class ExportThread(QThread):
     export_completed = pyqtSignal(str)  # 导出完成，参数是文件路径
     error_occurred = pyqtSignal(str)  # 错误信息
     
-    def __init__(self, project_id, file_path, include_work_packages=True, include_relations=True, include_comments=True, include_statuses=True):
+    def __init__(self, project_id, file_path, include_work_packages=True, include_relations=True, include_comments=True, include_statuses=True,
+                 export_format=FORMAT_NDJSON_GZIP, baseline_path=None):
         super().__init__()
         self.project_id = project_id
         self.file_path = file_path
@@ -24,261 +27,36 @@ class ExportThread(QThread):
         self.include_relations = include_relations
         self.include_comments = include_comments
         self.include_statuses = include_statuses
+        self.export_format = export_format
+        self.baseline_path = baseline_path  # 设置时只导出基准文件之后的变化
     
     def run(self):
         try:
-            # 导出项目基本信息
-            self.progress_update.emit(5, "正在获取项目基本信息...")
-            project_details = api_client.get_project_details(self.project_id)
-            
-            if not project_details:
-                self.error_occurred.emit("无法获取项目详情")
+            if self.baseline_path:
+                export_project_delta(
+                    self.project_id,
+                    self.file_path,
+                    self.baseline_path,
+                    export_format=self.export_format,
+                    progress_callback=self.progress_update.emit
+                )
+                self.export_completed.emit(self.file_path)
                 return
-                
-            self.progress_update.emit(10, f"正在导出项目: {project_details.get('name', 'Unknown')}...")
-            
-            # 获取项目表单配置（包含更详细的自定义字段信息）
-            self.progress_update.emit(12, "正在获取项目表单配置...")
-            project_form_config = api_client.get_project_form_configuration(self.project_id)
-            
-            # 准备导出数据结构
-            export_data = {
-                "project": project_details,
-                "project_form_config": project_form_config,
-                "work_packages": [],
-                "custom_fields": [],
-                "statuses": [],
-                "types": [],
-                "export_version": "1.0"
-            }
-            
-            # 获取自定义字段
-            self.progress_update.emit(15, "正在获取自定义字段...")
-            custom_fields = api_client.get_custom_fields()
-            if custom_fields:
-                export_data["custom_fields"] = custom_fields
-            
-            # 获取自定义字段选项
-            self.progress_update.emit(17, "正在获取自定义字段选项...")
-            custom_field_options = {}
-            for field in custom_fields:
-                field_id = field.get("id")
-                if field_id:
-                    options = api_client.get_custom_field_options(field_id)
-                    if options:
-                        custom_field_options[field_id] = options
-            
-            export_data["custom_field_options"] = custom_field_options
-            
-            # 获取状态和类型
-            self.progress_update.emit(20, "正在获取状态和类型数据...")
-            statuses = api_client.get_statuses()
-            if statuses:
-                export_data["statuses"] = statuses
-                
-            types = api_client.get_types()
-            if types:
-                export_data["types"] = types
-            
-            # 如果需要包含工作包
-            if self.include_work_packages:
-                self.progress_update.emit(30, "正在获取工作包数据...")
-                
-                # 使用与LoadWorkPackagesThread相同的流程获取全量工作包
-                # 首先获取项目测试工作包以确定总数
-                self.progress_update.emit(32, "正在确定工作包总数...")
-                page_size = 50  # 初始较小的页面大小
-                test_packages = api_client.get_work_packages(self.project_id, page=1, page_size=page_size)
-                
-                if test_packages is not None:
-                    # 通过第一次请求获取总数信息
-                    total_count = api_client.get_last_work_packages_total()
-                    if total_count > 0:
-                        # 设置合适的页面大小，确保一次能获取所有，并添加一些余量
-                        page_size = total_count + 50
-                        self.progress_update.emit(35, f"项目包含 {total_count} 个工作包，调整页面大小为 {page_size}")
-                    else:
-                        # 如果无法获取总数，使用较大的默认值
-                        page_size = 500
-                else:
-                    # 如果测试请求失败，使用默认值
-                    page_size = 500
-                
-                # 使用动态计算的页面大小，一次性获取所有工作包
-                self.progress_update.emit(38, f"正在获取所有工作包，页面大小: {page_size}...")
-                work_packages = api_client.get_work_packages(self.project_id, page=1, page_size=page_size)
-                
-                if work_packages:
-                    self.progress_update.emit(45, f"成功获取 {len(work_packages)} 个工作包")
-                    
-                    # 保存工作包ID以便后续查找
-                    work_package_ids = {wp.get("id") for wp in work_packages if "id" in wp}
-                    
-                    # 检查是否有子任务引用
-                    self.progress_update.emit(50, "正在检查子任务引用...")
-                    referenced_ids = set()
-                    
-                    # 收集所有子任务和父任务ID
-                    for wp in work_packages:
-                        # 检查子任务
-                        if "_links" in wp and "children" in wp["_links"]:
-                            children = wp["_links"]["children"]
-                            if isinstance(children, list):
-                                for child in children:
-                                    if isinstance(child, dict) and "href" in child:
-                                        # 从href提取ID
-                                        try:
-                                            href = child["href"]
-                                            child_id = int(href.split("/")[-1])
-                                            referenced_ids.add(child_id)
-                                        except (ValueError, IndexError):
-                                            pass
-                                            
-                        # 检查父任务
-                        if "_links" in wp and "parent" in wp["_links"]:
-                            parent = wp["_links"]["parent"]
-                            if isinstance(parent, dict) and "href" in parent:
-                                href = parent["href"]
-                                if href:  # 确保href不是None
-                                    try:
-                                        parent_id = int(href.split("/")[-1])
-                                        referenced_ids.add(parent_id)
-                                    except (ValueError, IndexError):
-                                        pass
-                    
-                    # 找出缺失的引用任务
-                    missing_referenced_ids = [id for id in referenced_ids if id not in work_package_ids]
-                    if missing_referenced_ids:
-                        missing_count = len(missing_referenced_ids)
-                        self.progress_update.emit(55, f"正在获取 {missing_count} 个引用任务...")
-                        
-                        # 并行获取被引用的工作包详情
-                        referenced_details = self.get_work_packages_details_parallel(missing_referenced_ids)
-                        
-                        # 添加获取到的工作包
-                        added_count = 0
-                        for wp_id, wp_data in referenced_details.items():
-                            if wp_data:
-                                work_packages.append(wp_data)
-                                work_package_ids.add(wp_id)
-                                added_count += 1
-                        
-                        self.progress_update.emit(60, f"已添加 {added_count} 个引用任务")
-                    
-                    # 检查工作包状态完整性
-                    self.progress_update.emit(65, "正在验证工作包状态...")
-                    packages_without_status = []
-                    
-                    for wp in work_packages:
-                        wp_id = wp.get("id", "未知")
-                        has_complete_status = False
-                        
-                        if "_links" in wp and "status" in wp["_links"]:
-                            status_link = wp["_links"]["status"]
-                            if isinstance(status_link, dict) and "title" in status_link and "href" in status_link:
-                                has_complete_status = True
-                        
-                        if not has_complete_status:
-                            packages_without_status.append(wp_id)
-                    
-                    # 获取缺少状态的工作包详细信息
-                    if packages_without_status:
-                        missing_count = len(packages_without_status)
-                        self.progress_update.emit(70, f"正在获取 {missing_count} 个缺少状态的工作包...")
-                        
-                        # 并行获取缺少状态的工作包详情
-                        detailed_packages = self.get_work_packages_details_parallel(packages_without_status)
-                        
-                        # 更新工作包信息
-                        updated_count = 0
-                        for wp_id, detailed_wp in detailed_packages.items():
-                            if detailed_wp:
-                                # 找到原来的工作包并更新，如果不存在则添加
-                                updated = False
-                                for i, wp in enumerate(work_packages):
-                                    if wp.get("id") == wp_id:
-                                        work_packages[i] = detailed_wp
-                                        updated = True
-                                        updated_count += 1
-                                        break
-                                
-                                if not updated:
-                                    # 如果未找到现有的工作包，则添加新的
-                                    work_packages.append(detailed_wp)
-                                    updated_count += 1
-                        
-                        self.progress_update.emit(75, f"已更新 {updated_count} 个工作包状态")
-                    
-                    # 确保没有重复的工作包
-                    unique_wps = {}
-                    for wp in work_packages:
-                        wp_id = wp.get("id")
-                        if wp_id is not None:
-                            unique_wps[wp_id] = wp
-                    
-                    # 转换回列表
-                    work_packages_final = list(unique_wps.values())
-                    self.progress_update.emit(80, f"整理完成，共 {len(work_packages_final)} 个工作包")
-                    
-                    # 添加到导出数据
-                    export_data["work_packages"] = work_packages_final
-                else:
-                    self.progress_update.emit(80, "没有找到工作包")
             
-            # 将数据写入文件
-            self.progress_update.emit(90, "正在写入文件...")
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
-            
-            self.progress_update.emit(100, "导出完成")
+            # 边获取工作包边写入文件，不在内存中保存整个项目
+            export_project(
+                self.project_id,
+                self.file_path,
+                export_format=self.export_format,
+                include_work_packages=self.include_work_packages,
+                progress_callback=self.progress_update.emit
+            )
             self.export_completed.emit(self.file_path)
             
         except Exception as e:
             error_msg = f"导出失败: {str(e)}\n{traceback.format_exc()}"
             print(error_msg)
             self.error_occurred.emit(error_msg)
-    
-    def get_work_packages_details_parallel(self, work_package_ids, max_workers=10):
-        """并行获取多个工作包的详细信息
-        
-        Args:
-            work_package_ids: 工作包ID列表
-            max_workers: 最大并行线程数
-            
-        Returns:
-            dict: 以工作包ID为键，工作包详情为值的字典
-        """
-        if not work_package_ids:
-            return {}
-            
-        results = {}
-        
-        # 使用线程池并行获取
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_id = {
-                executor.submit(api_client.get_work_package, wp_id): wp_id 
-                for wp_id in work_package_ids
-            }
-            
-            # 处理完成的任务
-            completed = 0
-            total_count = len(work_package_ids)
-            for future in concurrent.futures.as_completed(future_to_id):
-                wp_id = future_to_id[future]
-                completed += 1
-                
-                try:
-                    data = future.result()
-                    results[wp_id] = data
-                except Exception as e:
-                    results[wp_id] = None
-                
-                # 更新进度
-                if completed % 5 == 0 or completed == total_count:
-                    self.progress_update.emit(55 + int(15 * completed / total_count), f"已处理 {completed}/{total_count} 个工作包")
-        
-        return results
 
 
 class ImportThread(QThread):
@@ -287,38 +65,45 @@ class ImportThread(QThread):
     import_completed = pyqtSignal(str)  # 导入完成，参数是项目ID
     error_occurred = pyqtSignal(str)  # 错误信息
     
-    def __init__(self, file_path, project_name=None, force_relations=False, custom_field_mapping=None):
+    def __init__(self, file_path, project_name=None, force_relations=False, custom_field_mapping=None, resume=False,
+                 server_copy=True):
         super().__init__()
         self.file_path = file_path
         self.project_name = project_name
         self.force_relations = force_relations
         self.custom_field_mapping = custom_field_mapping or {}  # 添加自定义字段映射参数
+        self.resume = resume  # 根据导入日志继续上次中断的导入
+        self.server_copy = server_copy  # 同一实例时使用服务器端项目复制
+        self.journal_path = default_journal_path(file_path)
     
     def run(self):
         try:
             self.progress_update.emit(10, f"正在读取文件 {self.file_path}")
             
-            # 读取文件
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                project_data = json.load(f)
-            
-            # 输出自定义字段映射信息（用于调试）
-            if self.custom_field_mapping:
-                self.progress_update.emit(15, f"使用 {len(self.custom_field_mapping)} 个自定义字段映射")
-                print(f"自定义字段映射: {self.custom_field_mapping}")
-            
-            self.progress_update.emit(20, "文件已加载，准备导入项目")
-            
-            # 创建参数字典
-            params = {
-                'project_data': project_data,
-                'new_name': self.project_name,
-                'force_relations': self.force_relations,
-                'custom_field_mapping': self.custom_field_mapping
-            }
-            
-            # 导入项目
-            new_project_id = self.import_project_with_data(params)
+            # 流式读取文件：先读取工作包之前的项目信息，工作包在导入过程中逐个读取
+            with open_export(self.file_path) as stream:
+                project_data = stream.project_data()
+                
+                # 输出自定义字段映射信息（用于调试）
+                if self.custom_field_mapping:
+                    self.progress_update.emit(15, f"使用 {len(self.custom_field_mapping)} 个自定义字段映射")
+                    print(f"自定义字段映射: {self.custom_field_mapping}")
+                
+                self.progress_update.emit(20, "文件已打开，准备导入项目")
+                
+                # 创建参数字典
+                params = {
+                    'project_data': project_data,
+                    'new_name': self.project_name,
+                    'force_relations': self.force_relations,
+                    'custom_field_mapping': self.custom_field_mapping,
+                    'journal_path': self.journal_path,
+                    'resume': self.resume,
+                    'server_copy': self.server_copy
+                }
+                
+                # 导入项目
+                new_project_id = self.import_project_with_data(params)
             
             if new_project_id:
                 self.import_completed.emit(new_project_id)
@@ -344,6 +129,9 @@ class ImportThread(QThread):
                 - project_data: 项目数据
                 - new_name: 新项目名称
                 - force_relations: 是否强制处理关系
+                - journal_path: 导入日志路径
+                - resume: 是否根据导入日志继续导入
+                - server_copy: 同一实例时是否使用服务器端项目复制
         
         Returns:
             创建的项目ID
@@ -356,32 +144,13 @@ class ImportThread(QThread):
             self.error_occurred.emit("无效的项目数据")
             return None
         
-        # 收集类型映射
+        # 导出文件中的类型和状态按名称对应到当前实例，映射的键为原ID
         type_mapping = {}
-        
-        # 收集状态映射
         status_mapping = {}
-        
-        # 获取现有类型和状态
         try:
-            # 获取类型
-            types = api_client.get_types()
-            if types:
-                for t in types:
-                    type_name = t.get("name", "")
-                    type_id = t.get("id")
-                    if type_name and type_id:
-                        type_mapping[type_name] = type_id
-            
-            # 获取状态
-            statuses = api_client.get_statuses()
-            if statuses:
-                for s in statuses:
-                    status_name = s.get("name", "")
-                    status_id = s.get("id")
-                    if status_name and status_id:
-                        status_mapping[status_name] = status_id
-                        
+            api_client.metadata.load()
+            type_mapping = api_client.metadata.types.map_exported(project_data.get("types"))
+            status_mapping = api_client.metadata.statuses.map_exported(project_data.get("statuses"))
         except Exception as e:
             self.progress_update.emit(20, f"获取类型和状态出错: {str(e)}")
         
@@ -409,7 +178,10 @@ class ImportThread(QThread):
             "type_mapping": type_mapping,
             "status_mapping": status_mapping,
             "force_relations": force_relations,  # 添加强制处理关系选项
-            "custom_field_mapping": self.custom_field_mapping  # 添加自定义字段映射
+            "custom_field_mapping": self.custom_field_mapping,  # 添加自定义字段映射
+            "journal_path": params.get('journal_path'),
+            "resume": params.get('resume', False),
+            "server_copy": params.get('server_copy', True)
         }
         
         # 执行导入
@@ -464,6 +236,22 @@ class ExportImportWidget(QWidget):
         export_options_layout.addWidget(self.include_statuses_checkbox)
         export_options_form.addRow("导出选项:", export_options_layout)
         
+        # 导出格式
+        self.export_format_combo = QComboBox()
+        for export_format, label in EXPORT_FORMATS.items():
+            self.export_format_combo.addItem(label, export_format)
+        export_options_form.addRow("导出格式:", self.export_format_combo)
+        
+        # 差异导出的基准文件，为空时完整导出
+        self.baseline_edit = QLineEdit()
+        self.baseline_edit.setPlaceholderText("可选：选择上一次的导出文件，只导出之后的变化")
+        baseline_btn = QPushButton("选择...")
+        baseline_btn.clicked.connect(self.select_baseline)
+        baseline_layout = QHBoxLayout()
+        baseline_layout.addWidget(self.baseline_edit)
+        baseline_layout.addWidget(baseline_btn)
+        export_options_form.addRow("差异导出基准:", baseline_layout)
+        
         export_layout.addLayout(export_options_form)
         
         # 导出按钮
@@ -497,6 +285,12 @@ class ExportImportWidget(QWidget):
         force_relations_layout.addWidget(self.force_relations_checkbox)
         import_options_form.addRow("强制处理关系:", force_relations_layout)
         
+        # 服务器端复制选项
+        self.server_copy_checkbox = QCheckBox("导出文件来自当前服务器时由服务器直接复制项目")
+        self.server_copy_checkbox.setChecked(True)
+        self.server_copy_checkbox.setToolTip("只在原项目导出之后没有变化时使用服务器端复制，否则按导出文件逐个创建工作包")
+        import_options_form.addRow("服务器端复制:", self.server_copy_checkbox)
+        
         import_layout.addLayout(import_options_form)
         
         # 导入按钮
@@ -617,7 +411,9 @@ class ExportImportWidget(QWidget):
             include_work_packages=include_wp,
             include_relations=include_relations,
             include_comments=include_comments,
-            include_statuses=include_statuses
+            include_statuses=include_statuses,
+            export_format=self.export_format_combo.currentData(),
+            baseline_path=self.baseline_edit.text().strip() or None
         )
         
         # 连接信号
@@ -628,6 +424,17 @@ class ExportImportWidget(QWidget):
         # 启动线程
         self.export_thread.start()
     
+    def select_baseline(self):
+        """选择差异导出的基准文件"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, 
+            "选择基准导出文件", 
+            "", 
+            "OpenProject文件 (*.openproj);;所有文件 (*.*)"
+        )
+        if file_path:
+            self.baseline_edit.setText(file_path)
+    
     def import_project(self):
         """导入项目"""
         # 选择导入文件
@@ -643,9 +450,23 @@ class ExportImportWidget(QWidget):
             
         # 读取项目文件以获取自定义字段信息
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                project_data = json.load(f)
-                
+            # 只读取工作包之前的字段，旧版导出文件中自定义字段位于工作包之后时才需要读完整个文件
+            project_data = read_export_metadata(file_path, keys=["custom_fields"])
+            
+            # 同一文件有未完成的导入时询问是否继续
+            resume = False
+            journal = ImportJournal(default_journal_path(file_path))
+            if journal.load() and not journal.completed:
+                reply = QMessageBox.question(
+                    self,
+                    "继续导入",
+                    f"发现该文件上次未完成的导入（项目ID: {journal.project_id}，已创建 {len(journal.id_mapping)} 个工作包）。\n"
+                    f"是否继续上次的导入？选择“否”将创建新项目重新导入。",
+                    QMessageBox.Yes | QMessageBox.No,
+                    QMessageBox.Yes
+                )
+                resume = reply == QMessageBox.Yes
+            
             # 获取自定义字段信息
             custom_fields = project_data.get("custom_fields", [])
             
@@ -675,7 +496,9 @@ class ExportImportWidget(QWidget):
             file_path, 
             project_name, 
             self.force_relations_checkbox.isChecked(),
-            custom_field_mapping  # 传入字段映射
+            custom_field_mapping,  # 传入字段映射
+            resume=resume,
+            server_copy=self.server_copy_checkbox.isChecked()
         )
         
         # 连接信号
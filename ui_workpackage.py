@@ -8,8 +8,7 @@ from PyQt5.QtCore import Qt, QThread, pyqtSignal, QDate, QTimer
 from PyQt5.QtGui import QColor, QIcon
 import json
 from api_client import api_client
-import concurrent.futures
-import requests
+from project_snapshot import project_snapshots
 
 class LoadWorkPackagesThread(QThread):
     """加载工作包列表的线程"""
@@ -28,180 +27,11 @@ class LoadWorkPackagesThread(QThread):
             # 发送进度更新
             self.progress_update.emit("开始加载工作包...", 20)
             
-            # 首先获取项目详情，了解工作包总数
-            self.progress_update.emit("正在获取项目信息...", 25)
-            project_details = api_client.get_project_details(self.project_id)
-            
-            # 设置合适的页面大小，确保能一次性获取所有工作包
-            if project_details:
-                # 尝试从项目详情中获取工作包总数，如果无法获取，则先请求一个小的页面来获取总数
-                page_size = 50  # 初始较小的页面大小
-                test_packages = api_client.get_work_packages(self.project_id, page=1, page_size=page_size)
-                
-                if test_packages is not None:
-                    # 通过第一次请求获取总数信息
-                    total_count = api_client.get_last_work_packages_total()
-                    if total_count > 0:
-                        # 设置合适的页面大小，确保一次能获取所有，并添加一些余量
-                        page_size = total_count + 50
-                        self.progress_update.emit(f"项目包含 {total_count} 个工作包，调整页面大小为 {page_size}", 28)
-                    else:
-                        # 如果无法获取总数，使用较大的默认值
-                        page_size = 500
-                else:
-                    # 如果测试请求失败，使用默认值
-                    page_size = 500
-            else:
-                # 如果无法获取项目详情，使用默认值
-                page_size = 500
-            
-            # 一次性加载工作包，使用动态计算的页面大小
-            print(f"开始一次性加载所有工作包，页面大小：{page_size}...")
-            self.progress_update.emit("正在从服务器获取工作包数据...", 30)
-            work_packages = api_client.get_work_packages(self.project_id, page=1, page_size=page_size)
-            
-            if work_packages is None or len(work_packages) == 0:
-                error_msg = "无法获取工作包数据，服务器返回空列表"
-                print(error_msg)
-                self.error_occurred.emit(error_msg)
-                return
-            
-            success_msg = f"成功获取 {len(work_packages)} 个工作包"
-            print(success_msg)
-            self.progress_update.emit(success_msg, 50)
-            
-            # 保存工作包ID以便后续查找
-            work_package_ids = {wp.get("id") for wp in work_packages if "id" in wp}
-            print(f"主列表中有 {len(work_package_ids)} 个唯一工作包ID")
-            
-            # 检查是否有子任务引用
-            self.progress_update.emit("正在检查子任务引用...", 55)
-            referenced_ids = set()
-            
-            # 收集所有子任务和父任务ID
-            for wp in work_packages:
-                # 检查子任务
-                if "_links" in wp and "children" in wp["_links"]:
-                    children = wp["_links"]["children"]
-                    if isinstance(children, list):
-                        for child in children:
-                            if isinstance(child, dict) and "href" in child:
-                                # 从href提取ID
-                                try:
-                                    href = child["href"]
-                                    child_id = int(href.split("/")[-1])
-                                    referenced_ids.add(child_id)
-                                except (ValueError, IndexError):
-                                    pass
-                                    
-                # 检查父任务
-                if "_links" in wp and "parent" in wp["_links"]:
-                    parent = wp["_links"]["parent"]
-                    if isinstance(parent, dict) and "href" in parent:
-                        href = parent["href"]
-                        if href:  # 确保href不是None
-                            try:
-                                parent_id = int(href.split("/")[-1])
-                                referenced_ids.add(parent_id)
-                            except (ValueError, IndexError):
-                                pass
-            
-            # 找出缺失的引用任务
-            missing_referenced_ids = [id for id in referenced_ids if id not in work_package_ids]
-            if missing_referenced_ids:
-                missing_count = len(missing_referenced_ids)
-                missing_ids_str = ", ".join([str(id) for id in missing_referenced_ids[:20]])
-                if missing_count > 20:
-                    missing_ids_str += f"... (共{missing_count}个)"
-                
-                self.progress_update.emit(f"正在获取 {missing_count} 个引用任务...", 60)
-                print(f"发现 {missing_count} 个被引用但不在主列表中的工作包: {missing_ids_str}")
-                
-                # 并行获取被引用的工作包详情
-                referenced_details = self.get_work_packages_details_parallel(missing_referenced_ids)
-                
-                # 添加获取到的工作包
-                added_count = 0
-                for wp_id, wp_data in referenced_details.items():
-                    if wp_data:
-                        print(f"成功获取被引用的工作包 {wp_id} 详情，添加到列表")
-                        work_packages.append(wp_data)
-                        work_package_ids.add(wp_id)
-                        added_count += 1
-                
-                self.progress_update.emit(f"已添加 {added_count} 个引用任务", 65)
-                print(f"添加引用任务后，总共有 {len(work_packages)} 个工作包")
-            
-            # 检查工作包状态完整性
-            self.progress_update.emit("正在验证工作包状态...", 70)
-            packages_without_status = []
-            
-            for wp in work_packages:
-                wp_id = wp.get("id", "未知")
-                has_complete_status = False
-                
-                if "_links" in wp and "status" in wp["_links"]:
-                    status_link = wp["_links"]["status"]
-                    if isinstance(status_link, dict) and "title" in status_link and "href" in status_link:
-                        has_complete_status = True
-                
-                if not has_complete_status:
-                    packages_without_status.append(wp_id)
-            
-            # 获取缺少状态的工作包详细信息
-            if packages_without_status:
-                missing_count = len(packages_without_status)
-                missing_ids = ", ".join([str(id) for id in packages_without_status[:20]])
-                if len(packages_without_status) > 20:
-                    missing_ids += f"... (共{missing_count}个)"
-                
-                self.progress_update.emit(f"正在获取 {missing_count} 个缺少状态的工作包...", 75)
-                print(f"发现 {missing_count} 个工作包缺少状态信息: {missing_ids}")
-                
-                # 并行获取缺少状态的工作包详情
-                detailed_packages = self.get_work_packages_details_parallel(packages_without_status)
-                
-                # 更新工作包信息
-                updated_count = 0
-                for wp_id, detailed_wp in detailed_packages.items():
-                    if detailed_wp:
-                        # 验证获取的详细信息是否包含状态
-                        status_link = detailed_wp.get("_links", {}).get("status", {})
-                        has_status = isinstance(status_link, dict) and "title" in status_link and "href" in status_link
-                        status_info = status_link.get("title", "未知") if has_status else "未知"
-                        
-                        print(f"工作包 {wp_id} 详细信息获取成功，状态: {status_info}")
-                        
-                        # 找到原来的工作包并更新，如果不存在则添加
-                        updated = False
-                        for i, wp in enumerate(work_packages):
-                            if wp.get("id") == wp_id:
-                                work_packages[i] = detailed_wp
-                                updated = True
-                                updated_count += 1
-                                break
-                        
-                        if not updated:
-                            # 如果未找到现有的工作包，则添加新的
-                            work_packages.append(detailed_wp)
-                            updated_count += 1
-                            print(f"新增工作包 {wp_id}")
-                
-                self.progress_update.emit(f"已更新 {updated_count} 个工作包状态", 80)
-                print(f"更新状态后，总共有 {len(work_packages)} 个工作包")
-            else:
-                self.progress_update.emit("所有工作包都包含状态信息", 80)
-            
-            # 确保没有重复的工作包
-            unique_wps = {}
-            for wp in work_packages:
-                wp_id = wp.get("id")
-                if wp_id is not None:
-                    unique_wps[wp_id] = wp
-            
-            # 转换回列表
-            work_packages_final = list(unique_wps.values())
-            print(f"去重后，最终有 {len(work_packages_final)} 个唯一工作包")
+            # 通过项目快照服务加载，分页并发获取并补全引用任务和状态信息
+            snapshot = project_snapshots.get(
+                self.project_id, force_refresh=True,
+                progress_callback=lambda message, percent: self.progress_update.emit(message, 25 + percent * 60 // 100))
+            work_packages_final = list(snapshot.work_packages)
             
             # 发送所有工作包数据
             self.progress_update.emit(f"准备更新 UI，共 {len(work_packages_final)} 个工作包", 85)
@@ -211,12 +41,10 @@ class LoadWorkPackagesThread(QThread):
             if self.load_metadata:
                 self.progress_update.emit("正在加载元数据...", 90)
                 
-                # 加载类型
-                self.progress_update.emit("正在加载工作包类型...", 92)
+                # 并发加载类型、状态、优先级和项目成员
+                self.progress_update.emit("正在加载工作包类型和状态...", 92)
+                api_client.metadata.load(self.project_id)
                 types = api_client.get_types()
-                
-                # 加载状态
-                self.progress_update.emit("正在加载工作包状态...", 94)
                 statuses = api_client.get_statuses()
                 
                 # 加载自定义字段
@@ -232,89 +60,6 @@ class LoadWorkPackagesThread(QThread):
             error_details = f"加载工作包出错: {str(e)}\n{traceback.format_exc()}"
             print(error_details)
             self.error_occurred.emit(str(e))
-    
-    def get_work_packages_details_parallel(self, work_package_ids, max_workers=10):
-        """并行获取多个工作包的详细信息
-        
-        Args:
-            work_package_ids: 工作包ID列表
-            max_workers: 最大并行线程数
-            
-        Returns:
-            dict: 以工作包ID为键，工作包详情为值的字典
-        """
-        if not work_package_ids:
-            return {}
-            
-        results = {}
-        total_count = len(work_package_ids)
-        print(f"开始并行获取 {total_count} 个工作包详情，使用 {max_workers} 个并行线程")
-        
-        # 使用线程池并行获取
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_id = {
-                executor.submit(api_client.get_work_package, wp_id): wp_id 
-                for wp_id in work_package_ids
-            }
-            
-            # 处理完成的任务
-            completed = 0
-            for future in concurrent.futures.as_completed(future_to_id):
-                wp_id = future_to_id[future]
-                completed += 1
-                
-                try:
-                    data = future.result()
-                    results[wp_id] = data
-                    print(f"并行获取进度: {completed}/{total_count}, 工作包 {wp_id} 获取{'成功' if data else '失败'}")
-                except Exception as e:
-                    print(f"并行获取进度: {completed}/{total_count}, 工作包 {wp_id} 请求异常: {str(e)}")
-                    results[wp_id] = None
-        
-        success_count = sum(1 for data in results.values() if data is not None)
-        print(f"并行获取完成: 总计 {total_count} 个工作包, 成功 {success_count} 个, 失败 {total_count - success_count} 个")
-        return results
-    
-    def get_work_package_details(self, work_package_id):
-        """获取单个工作包的详细信息"""
-        try:
-            # 确保链接格式正确
-            url = f"/api/v3/work_packages/{work_package_id}"
-            if not url.startswith("/"):
-                url = f"/{url}"
-                
-            full_url = f"{api_client.api_url}{url}"
-            print(f"获取工作包详细信息，URL: {full_url}")
-            
-            response = requests.get(
-                full_url, 
-                auth=api_client.auth, 
-                headers=api_client.headers,
-                timeout=(5, 15)  # 5秒连接超时，15秒读取超时
-            )
-            
-            # 处理响应
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    
-                    # 检查状态信息是否完整
-                    status_link = data.get("_links", {}).get("status", {})
-                    has_complete_status = isinstance(status_link, dict) and "title" in status_link and "href" in status_link
-                    status_info = status_link.get("title", "未设置") if has_complete_status else "状态信息不完整"
-                    
-                    print(f"获取到工作包 {work_package_id} 详细信息，状态: {status_info}")
-                    return data
-                except Exception as json_err:
-                    print(f"解析工作包 {work_package_id} 响应JSON时出错: {str(json_err)}")
-            else:
-                print(f"获取工作包 {work_package_id} 详细信息失败，HTTP状态: {response.status_code}")
-            
-            return None
-        except Exception as e:
-            print(f"获取工作包 {work_package_id} 详情请求异常: {str(e)}")
-            return None
 
 class LoadProjectsThread(QThread):
     """异步加载项目列表线程"""
@@ -945,6 +690,7 @@ class WorkPackageWidget(QWidget):
             # 创建工作包
             result = api_client.create_work_package(project_id, data)
             if result:
+                project_snapshots.invalidate(project_id)
                 QMessageBox.information(self, "创建成功", "工作包创建成功")
                 self.load_work_packages()  # 刷新列表
             else:
@@ -1002,6 +748,7 @@ class WorkPackageWidget(QWidget):
             # 更新工作包
             result = api_client.update_work_package(wp_id, data)
             if result:
+                project_snapshots.invalidate(self.current_project.get("id"))
                 QMessageBox.information(self, "更新成功", "工作包更新成功")
                 self.load_work_packages()  # 刷新列表
             else:
@@ -1047,6 +794,7 @@ class WorkPackageWidget(QWidget):
         if reply == QMessageBox.Yes:
             success = api_client.delete_work_package(wp_id)
             if success:
+                project_snapshots.invalidate(self.current_project.get("id"))
                 QMessageBox.information(self, "删除成功", "工作包已删除")
                 self.load_work_packages()  # 刷新列表
             else:
@@ -1405,19 +1153,17 @@ class WorkPackageDialog(QDialog):
             
             # 类型
             if "type" in self.field_inputs and "type" in links:
-                type_link = links["type"]
-                if isinstance(type_link, dict) and "href" in type_link:
-                    type_id = type_link["href"].split("/")[-1]
-                    index = self.field_inputs["type"].findData(type_id)
+                wp_type = api_client.metadata.types.resolve(links["type"])
+                if wp_type is not None:
+                    index = self.field_inputs["type"].findData(wp_type.get("id"))
                     if index >= 0:
                         self.field_inputs["type"].setCurrentIndex(index)
             
             # 状态
             if "status" in self.field_inputs and "status" in links:
-                status_link = links["status"]
-                if isinstance(status_link, dict) and "href" in status_link:
-                    status_id = status_link["href"].split("/")[-1]
-                    index = self.field_inputs["status"].findData(status_id)
+                status = api_client.metadata.statuses.resolve(links["status"])
+                if status is not None:
+                    index = self.field_inputs["status"].findData(status.get("id"))
                     if index >= 0:
                         self.field_inputs["status"].setCurrentIndex(index)
             